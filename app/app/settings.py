@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework.authtoken",
     "core",
@@ -45,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so it sees the final responses, see core.media
+    "core.media.MediaOffloadMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -89,6 +92,26 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+# in memory per process by default, set CACHE_BACKEND and
+# CACHE_LOCATION to share it between the app servers in production
+# eg. django.core.cache.backends.memcached.MemcachedCache, memcached:11211
+# required as soon as there is more than one process (several workers
+# or servers): the invalidations of the cached responses and tokens
+# only reach the process that made the change otherwise, the others
+# serve stale lists and accept deleted tokens until they expire
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -141,3 +164,76 @@ STATIC_ROOT = "/vol/web/static"
 # 127.0.0.1:8000/media/
 
 AUTH_USER_MODEL = "core.User"
+
+# number of items in each page of the recipe api list endpoints
+RECIPE_API_PAGE_SIZE = 100
+# largest page a client can ask for with ?page_size=
+RECIPE_API_MAX_PAGE_SIZE = 1000
+# number of recipes returned by a search, see recipe.search
+RECIPE_SEARCH_PAGE_SIZE = 20
+# largest number of items in a request to the bulk endpoints
+RECIPE_API_MAX_BATCH_SIZE = 1000
+
+# cache used for the responses of the recipe api
+RECIPE_API_CACHE_ALIAS = "default"
+# seconds a cached response is kept, entries are also invalidated
+# as soon as the user's data changes
+RECIPE_API_CACHE_TIMEOUT = 300
+
+# cache used by user.authentication.CachedTokenAuthentication
+# shared between the processes, see CACHES
+AUTH_TOKEN_CACHE_ALIAS = "default"
+# seconds a token is trusted without checking the database
+AUTH_TOKEN_CACHE_TIMEOUT = 300
+
+# resized copies made of every recipe image, {name: longest side in px}
+RECIPE_IMAGE_SIZES = {"large": 1200, "medium": 600, "thumbnail": 150}
+# formats of the copies, the ones pillow can't write are skipped
+RECIPE_IMAGE_FORMATS = ("jpeg", "webp")
+RECIPE_IMAGE_QUALITY = 85
+# threads resizing the uploaded images in the background
+RECIPE_IMAGE_WORKERS = 2
+# largest image that can be uploaded, in bytes
+RECIPE_IMAGE_MAX_SIZE = 20 * 1024 * 1024
+# largest image that can be uploaded, in pixels (width * height)
+RECIPE_IMAGE_MAX_PIXELS = 50 * 1000 * 1000
+# the format and size of an upload are checked from its first bytes
+RECIPE_IMAGE_HEADER_SIZE = 256 * 1024
+# bytes read from the request at a time by the resumable uploads
+RECIPE_IMAGE_UPLOAD_CHUNK_SIZE = 64 * 1024
+# where the unfinished uploads are kept, outside of MEDIA_ROOT
+# so they are never served
+RECIPE_IMAGE_UPLOAD_DIR = "/vol/web/uploads"
+# seconds after which an unfinished upload is cleared
+RECIPE_IMAGE_UPLOAD_EXPIRY = 24 * 60 * 60
+
+# seconds clients and cdns may cache the content addressed media files
+MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# how the media files are sent, see core.media
+# "django", "x-accel-redirect" (nginx) or "x-sendfile" (apache, lighttpd)
+MEDIA_SERVE_MODE = os.environ.get("MEDIA_SERVE_MODE", "django")
+# internal nginx location aliased to MEDIA_ROOT
+MEDIA_ACCEL_REDIRECT_PREFIX = "/protected-media/"
+# send the files of X-Accel-Redirect / X-Sendfile responses from the app
+# when there is no web server in front of it
+MEDIA_OFFLOAD_EMULATE = bool(int(os.environ.get("MEDIA_OFFLOAD_EMULATE", 0)))
+
+# number of users whose ingredient index is kept by every process,
+# see recipe.coverage
+RECIPE_COVERAGE_INDEX_USERS = 100
+
+# width of the buckets of the recipe statistics histograms,
+# see recipe.stats
+RECIPE_STATS_TIME_BUCKET = 15
+RECIPE_STATS_PRICE_BUCKET = 5
+
+# build the lists of the recipe api from values() rows instead of
+# the serializers when possible, see recipe.readers
+RECIPE_API_FAST_READS = bool(int(os.environ.get("RECIPE_API_FAST_READS", 1)))
+
+# the sync token is set this many seconds in the past to catch the rows
+# committed late, see recipe.sync
+RECIPE_SYNC_MARGIN = 60
+# days the deletions are kept for the sync, older tokens get everything
+RECIPE_SYNC_TOMBSTONE_DAYS = 30
@@ -13,21 +13,27 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
-from django.conf.urls.static import static
+from django.urls import path, re_path, include
 from django.conf import settings
 
+from core.media import serve_media
+
 # namespace: used when you want to reverse()
 urlpatterns = [
     path("admin/", admin.site.urls),
     # user.urls == look at user then the urls directory under user
     path("api/user/", include("user.urls")),
     path("api/recipe/", include("recipe.urls")),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-# makes media url available in our dev server, so we can test
-# uploading images for our recipe, without having to set up a
-# separate web server for serving these media files
-
-# django doesn't serve media files by default
-# so need to manually add these in the urls.py
+    # the uploaded recipe images, django doesn't serve media files by
+    # default and static() only does with DEBUG on, through python
+    # serve_media() works in production: it answers conditional and
+    # range requests and can leave sending the bytes to sendfile(),
+    # nginx or apache, see core.media
+    re_path(
+        rf"^{re.escape(settings.MEDIA_URL.lstrip('/'))}(?P<path>.*)$",
+        serve_media,
+    ),
+]
@@ -0,0 +1,86 @@
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+
+from core.models import ImageBlob
+
+# images are stored under the sha256 of their bytes eg.
+# blobs/3f/a2/3fa2...9c.jpg
+# the same bytes uploaded to many recipes are stored once, and a file
+# never changes once written, so its url can be cached forever
+# ImageBlob counts the rows (recipe images and variants) pointing at
+# every file: store() adds a reference, release() removes one and the
+# file is deleted with the last one, once the transaction committed
+# the row is locked while a file is written or deleted, so a file
+# can't be deleted while another request starts using it
+
+BLOB_DIR = "blobs"
+
+
+def _digest(content):
+    """Return the sha256 of a file, read a chunk at a time"""
+    sha256 = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    content.seek(0)
+    return sha256.hexdigest()
+
+
+def blob_name(digest, ext):
+    """Return the storage path of the file with the given digest"""
+    # two levels of directories keep them small
+    return os.path.join(BLOB_DIR, digest[:2], digest[2:4], f"{digest}{ext}")
+
+
+def is_blob(name):
+    """Tell whether the path is a content addressed file"""
+    return name.startswith(f"{BLOB_DIR}/")
+
+
+def blob_digest(name):
+    """Return the digest of a content addressed file from its path"""
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+def store(content, filename):
+    """Save the content once per distinct bytes, return its path"""
+    ext = os.path.splitext(filename)[1].lower()
+    name = blob_name(_digest(content), ext)
+    with transaction.atomic():
+        ImageBlob.objects.get_or_create(name=name)
+        # the update locks the row until the transaction ends
+        ImageBlob.objects.filter(name=name).update(
+            references=F("references") + 1
+        )
+        if not default_storage.exists(name):
+            default_storage.save(name, content)
+    return name
+
+
+def _collect(name):
+    """Delete the file if nothing points at it anymore"""
+    with transaction.atomic():
+        blob = (
+            ImageBlob.objects.select_for_update()
+            .filter(name=name, references=0)
+            .first()
+        )
+        if blob is not None:
+            default_storage.delete(name)
+            blob.delete()
+
+
+def release(name):
+    """Remove a reference to a file, deleting it with the last one"""
+    # files stored before content addressing have no ImageBlob
+    # and are left alone
+    released = ImageBlob.objects.filter(
+        name=name, references__gt=0
+    ).update(references=F("references") - 1)
+    if released:
+        # only once the rows pointing at it are really gone
+        transaction.on_commit(lambda: _collect(name))
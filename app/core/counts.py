@@ -0,0 +1,69 @@
+from collections import defaultdict
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core.dedupe import CHUNK_SIZE
+
+# the recipe_count of the tags and ingredients: the number of recipes
+# using each of them, stored on the row rather than counted on every
+# request (see recipe.signals for how it is kept exact)
+# only works with the models given, which may be the historical ones
+# of a migration
+
+
+def recipe_count(field):
+    """Return the number of recipes of each object, as an expression"""
+    # field: the m2m field of the recipes, eg. Recipe.tags
+    # a correlated COUNT of the through rows, read from the
+    # (tag_id, recipe_id) index of core.0007
+    target = field.m2m_reverse_field_name()
+    counts = (
+        field.remote_field.through.objects.filter(**{target: OuterRef("pk")})
+        .order_by()
+        .values(target)
+        .annotate(count=Count("*"))
+        .values("count")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def recount(queryset, field):
+    """Set the recipe_count of the objects of the queryset, in one query"""
+    return queryset.update(recipe_count=recipe_count(field))
+
+
+def adjust(model, deltas):
+    """Add the changes {id: number of recipes} to the recipe_count"""
+    # one update per different change, usually +1 or -1
+    ids = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            ids[delta].append(pk)
+    for delta, pks in ids.items():
+        model.objects.filter(pk__in=pks).update(
+            recipe_count=F("recipe_count") + delta
+        )
+
+
+def find_wrong_counts(model, field):
+    """Return {id: user id} of the objects whose recipe_count is wrong"""
+    rows = (
+        model.objects.annotate(actual=recipe_count(field))
+        .exclude(recipe_count=F("actual"))
+        .values_list("id", "user")
+        .iterator()
+    )
+    return dict(rows)
+
+
+def repair(model, field):
+    """Recount the objects whose recipe_count is wrong, return them"""
+    # {id: user id}, the counts are read again by the updates so the
+    # changes made in the meantime are not lost
+    wrong = find_wrong_counts(model, field)
+    ids = list(wrong)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[start:start + CHUNK_SIZE]
+        recount(model.objects.filter(id__in=chunk), field)
+    return wrong
@@ -0,0 +1,104 @@
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+# merge the tags (or ingredients) of a user sharing the same name
+# the oldest one of each group is kept, the recipes of the others are
+# moved to it and the others are deleted. used by the migrations that
+# make the names unique, so it only works with the models given, which
+# are the historical ones of the migration
+# the duplicates are handled a chunk at a time, a few queries each:
+# - the through rows pointing to the duplicates
+# - the through rows the kept objects already have for these recipes
+# - one bulk insert of the missing ones
+# - one update of the recipes, their tags changed (see recipe.sync)
+# - one delete of the old rows and one of the duplicates
+# - one insert of their tombstones: the historical models of a migration
+#   send no signals, the sync clients must still learn they are gone
+
+# sqlite allows 999 parameters per query
+CHUNK_SIZE = 400
+
+
+def find_duplicates(model, key=F("name")):
+    """Return {duplicate id: id kept} for the objects sharing a key"""
+    # key: the expression compared, eg. Lower("name")
+    groups = (
+        model.objects.annotate(key=key)
+        .values("user", "key")
+        .annotate(keep=Min("id"), count=Count("id"))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    kept = {(group["user"], group["key"]): group["keep"] for group in groups}
+    if not kept:
+        return {}
+
+    # one pass over the table, a list of users could be too long
+    rows = (
+        model.objects.annotate(key=key)
+        .values_list("id", "user", "key")
+        .iterator()
+    )
+    return {
+        pk: kept[(user_id, value)]
+        for pk, user_id, value in rows
+        if (user_id, value) in kept and kept[(user_id, value)] != pk
+    }
+
+
+def _merge_links(field, mapping):
+    """Point the through rows of the duplicates to the objects kept"""
+    through = field.remote_field.through
+    source = field.m2m_column_name()
+    target = field.m2m_reverse_name()
+
+    links = through.objects.filter(**{f"{target}__in": list(mapping)})
+    wanted = {
+        (source_id, mapping[target_id])
+        for source_id, target_id in links.values_list(source, target)
+    }
+    if wanted:
+        # the recipes as a subquery, there may be more than sqlite allows
+        existing = set(
+            through.objects.filter(
+                **{
+                    f"{source}__in": links.values(source),
+                    f"{target}__in": set(mapping.values()),
+                }
+            ).values_list(source, target)
+        )
+        through.objects.bulk_create(
+            through(**{source: source_id, target: target_id})
+            for source_id, target_id in wanted - existing
+        )
+        field.model.objects.filter(id__in=links.values(source)).update(
+            updated_at=timezone.now()
+        )
+        links.delete()
+
+
+def _delete(model, ids):
+    """Delete the duplicates and leave a tombstone for each of them"""
+    # the historical model if the given one is, see recipe.sync
+    Tombstone = model._meta.apps.get_model("core", "Tombstone")
+    duplicates = model.objects.filter(id__in=ids)
+    tombstones = [
+        Tombstone(user_id=user_id, model=model._meta.model_name, object_id=pk)
+        for pk, user_id in duplicates.values_list("id", "user")
+    ]
+    # without the post_delete signals of the current models, which would
+    # leave a second tombstone (see recipe.signals)
+    duplicates._raw_delete(duplicates.db)
+    Tombstone.objects.bulk_create(tombstones)
+
+
+def merge_duplicates(model, field, key=F("name")):
+    """Merge the duplicates of the model, return {removed id: id kept}"""
+    # field: the m2m field of the recipes to the model, eg. Recipe.tags
+    mapping = find_duplicates(model, key)
+    items = list(mapping.items())
+    for start in range(0, len(items), CHUNK_SIZE):
+        chunk = dict(items[start:start + CHUNK_SIZE])
+        _merge_links(field, chunk)
+        _delete(model, list(chunk))
+    return mapping
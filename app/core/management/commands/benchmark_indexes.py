@@ -0,0 +1,120 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.models import Tag, Ingredient, Recipe
+from core.seed import analyze, seed_user
+
+# the indexes added in core.0007_indexes
+INDEXES = (
+    "core_recipe_user_id_idx",
+    "core_recipe_tags_reverse_idx",
+    "core_recipe_ingr_reverse_idx",
+)
+
+# the (user, name) indexes became unique constraints in
+# core.0016_unique_names, django generates their names
+UNIQUE_NAMES = (Tag, Ingredient)
+
+
+def drop_indexes(cursor):
+    """Drop the per-user indexes"""
+    for name in INDEXES:
+        cursor.execute(f"DROP INDEX {name}")
+    if connection.vendor == "postgresql":
+        # the seeded rows still have their foreign keys to check at
+        # commit, postgres refuses to alter their tables until then
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+    for model in UNIQUE_NAMES:
+        table = model._meta.db_table
+        constraints = connection.introspection.get_constraints(cursor, table)
+        for name, info in constraints.items():
+            if not info["unique"] or info["columns"] != ["user_id", "name"]:
+                continue
+            if info["index"]:
+                # sqlite: a unique index
+                cursor.execute(f"DROP INDEX {name}")
+            else:
+                cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+
+
+class Command(BaseCommand):
+    """Django command to compare query plans with and without indexes"""
+
+    help = (
+        "Seed a lot of data and print the query plans of the recipe api "
+        "with and without the per-user indexes. Everything runs in a "
+        "transaction that is rolled back, but the tables stay locked "
+        "while it runs, so don't use it against a live database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument("--recipes", type=int, default=5000)
+        parser.add_argument("--tags", type=int, default=1000)
+        parser.add_argument("--ingredients", type=int, default=1000)
+        parser.add_argument("--per-recipe", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with transaction.atomic():
+            self.stdout.write("Seeding data...")
+            users = [
+                seed_user(
+                    recipes=options["recipes"],
+                    tags=options["tags"],
+                    ingredients=options["ingredients"],
+                    per_recipe=options["per_recipe"],
+                    rng=rng,
+                )
+                for _ in range(options["users"])
+            ]
+            analyze()
+
+            for label, queryset in self._queries(users[0]):
+                self.stdout.write(self.style.MIGRATE_HEADING(label))
+                self.stdout.write("With indexes:")
+                self.stdout.write(queryset.explain())
+
+                # DDL is transactional, drop the indexes in a savepoint
+                # and roll it back to get them back
+                sid = transaction.savepoint()
+                with connection.cursor() as cursor:
+                    drop_indexes(cursor)
+                self.stdout.write("Without indexes:")
+                self.stdout.write(queryset.explain())
+                transaction.savepoint_rollback(sid)
+
+            # never keep the benchmark data
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("Done!"))
+
+    def _queries(self, user):
+        """Return the hot queries of the recipe api for the user"""
+        tag_ids = list(
+            Tag.objects.filter(user=user).values_list("id", flat=True)[:3]
+        )
+        return (
+            (
+                "Tags by name",
+                Tag.objects.filter(user=user).order_by("-name")[:100],
+            ),
+            (
+                "Ingredients by name",
+                Ingredient.objects.filter(user=user).order_by("-name")[:100],
+            ),
+            (
+                "Recipes newest first",
+                Recipe.objects.filter(user=user).order_by("-id")[:100],
+            ),
+            (
+                "Recipes by tags",
+                Recipe.objects.filter(user=user, tags__id__in=tag_ids),
+            ),
+            (
+                "Tags assigned to recipes",
+                Tag.objects.filter(user=user, recipe__isnull=False).distinct(),
+            ),
+        )
@@ -0,0 +1,230 @@
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote, unquote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from core.blobs import blob_digest, is_blob
+
+# media files are served by serve_media() at MEDIA_URL, in one of the
+# modes of settings.MEDIA_SERVE_MODE:
+# "django"            the app sends the file with a FileResponse,
+#                     gunicorn and uwsgi hand it to sendfile() through
+#                     wsgi.file_wrapper so the bytes never go through
+#                     python, Range requests are answered with a 206
+# "x-accel-redirect"  the app only checks the request and answers with
+#                     an X-Accel-Redirect header, nginx sends the file:
+#                     location /protected-media/ {
+#                         internal;
+#                         alias /vol/web/media/;
+#                     }
+# "x-sendfile"        same with the X-Sendfile header of apache
+#                     (mod_xsendfile) or lighttpd
+# in every mode the conditional requests (If-None-Match,
+# If-Modified-Since) are answered with a 304 without opening the file
+# MediaOffloadMiddleware does what nginx would do with the headers,
+# for the dev server and the tests (MEDIA_OFFLOAD_EMULATE)
+
+# a single range, eg. bytes=0-499, bytes=500- or bytes=-500
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeFile:
+    """Part of a file, for the response to a Range request"""
+
+    def __init__(self, file, start, length):
+        # the servers using sendfile() start from the current position
+        # of the file and send Content-Length bytes
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def _validators(path, file_stat):
+    """Return the etag and the modification time of a file"""
+    if is_blob(path):
+        # the digest of a content addressed file, see core.blobs
+        etag = blob_digest(path)
+    else:
+        # like nginx: modification time and size
+        etag = f"{int(file_stat.st_mtime):x}-{file_stat.st_size:x}"
+    return quote_etag(etag), int(file_stat.st_mtime)
+
+
+def _set_headers(response, path, etag, last_modified):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    if is_blob(path):
+        # a content addressed file never changes
+        response["Cache-Control"] = (
+            f"public, max-age={settings.MEDIA_IMMUTABLE_MAX_AGE}, immutable"
+        )
+    return response
+
+
+def _byte_range(request, size, etag, last_modified):
+    """Return the (start, length) asked by the request, if any"""
+    match = RANGE_RE.match(request.META.get("HTTP_RANGE", ""))
+    if request.method != "GET" or match is None:
+        # several ranges are allowed to get the whole file
+        return None
+
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range:
+        # only send a part if the client has the same version
+        if if_range.startswith(('"', "W/")):
+            if if_range != etag:
+                return None
+        elif parse_http_date_safe(if_range) != last_modified:
+            return None
+
+    first, last = match.groups()
+    if not first:
+        # the last n bytes
+        if not last:
+            return None
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end - start + 1
+
+
+def file_response(request, fullpath, file_stat, content_type, path=""):
+    """Send a file, or the part of it asked by a Range request"""
+    etag, last_modified = _validators(path, file_stat)
+    size = file_stat.st_size
+    byte_range = _byte_range(request, size, etag, last_modified)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    file = open(fullpath, "rb")
+    if byte_range is None:
+        # Content-Length is set from the size of the file
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, length = byte_range
+        response = FileResponse(
+            RangeFile(file, start, length),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Length"] = length
+        response["Content-Range"] = (
+            f"bytes {start}-{start + length - 1}/{size}"
+        )
+    response["Accept-Ranges"] = "bytes"
+    return _set_headers(response, path, etag, last_modified)
+
+
+def _offload(fullpath, path, content_type):
+    """Return an empty response telling the web server to send a file"""
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_SERVE_MODE == "x-accel-redirect":
+        prefix = settings.MEDIA_ACCEL_REDIRECT_PREFIX
+        response["X-Accel-Redirect"] = prefix + quote(path)
+    else:
+        response["X-Sendfile"] = fullpath
+    return response
+
+
+def _content_type(path):
+    content_type, encoding = mimetypes.guess_type(path)
+    return content_type or "application/octet-stream"
+
+
+def _stat(document_root, path):
+    """Return the absolute path of a media file and its stat"""
+    path = posixpath.normpath(path).lstrip("/")
+    try:
+        fullpath = safe_join(document_root, path)
+        file_stat = os.stat(fullpath)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404(f"'{path}' does not exist")
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404(f"'{path}' does not exist")
+    return path, fullpath, file_stat
+
+
+def serve_media(request, path, document_root=None):
+    """Serve a media file, see settings.MEDIA_SERVE_MODE"""
+    document_root = document_root or settings.MEDIA_ROOT
+    path, fullpath, file_stat = _stat(document_root, path)
+    etag, last_modified = _validators(path, file_stat)
+
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if not_modified is not None:
+        return _set_headers(not_modified, path, etag, last_modified)
+
+    content_type = _content_type(path)
+    if settings.MEDIA_SERVE_MODE == "django":
+        return file_response(request, fullpath, file_stat, content_type, path)
+
+    response = _offload(fullpath, path, content_type)
+    return _set_headers(response, path, etag, last_modified)
+
+
+class MediaOffloadMiddleware:
+    """Send the files of X-Accel-Redirect and X-Sendfile responses"""
+
+    # stand-in for nginx or apache when there is none in front of
+    # the app, ie. the dev server and the tests
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not settings.MEDIA_OFFLOAD_EMULATE:
+            return response
+
+        if response.has_header("X-Accel-Redirect"):
+            prefix = settings.MEDIA_ACCEL_REDIRECT_PREFIX
+            location = unquote(response["X-Accel-Redirect"])
+            if not location.startswith(prefix):
+                return response
+            path = location[len(prefix):]
+            path, fullpath, file_stat = _stat(settings.MEDIA_ROOT, path)
+        elif response.has_header("X-Sendfile"):
+            fullpath = response["X-Sendfile"]
+            path = os.path.relpath(fullpath, settings.MEDIA_ROOT)
+            file_stat = os.stat(fullpath)
+        else:
+            return response
+
+        # like the web servers, keep the headers set by the app
+        sent = file_response(
+            request, fullpath, file_stat, response["Content-Type"], path
+        )
+        for header in ("ETag", "Last-Modified", "Cache-Control"):
+            if response.has_header(header):
+                sent[header] = response[header]
+        return sent
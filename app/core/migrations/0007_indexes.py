@@ -0,0 +1,39 @@
+# Generated by Django 2.1.15 on 2026-10-18 03:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', 'name'], name='core_ingredient_user_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'id'], name='core_recipe_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'name'], name='core_tag_user_name_idx'),
+        ),
+        # the auto-created through tables only have a unique index on
+        # (recipe_id, tag_id), so finding the recipes of a tag has to
+        # go through the single column tag_id index and then the table.
+        # (tag_id, recipe_id) answers it from the index alone
+        migrations.RunSQL(
+            ['CREATE INDEX core_recipe_tags_reverse_idx '
+             'ON core_recipe_tags (tag_id, recipe_id)'],
+            ['DROP INDEX core_recipe_tags_reverse_idx'],
+        ),
+        migrations.RunSQL(
+            ['CREATE INDEX core_recipe_ingr_reverse_idx '
+             'ON core_recipe_ingredients (ingredient_id, recipe_id)'],
+            ['DROP INDEX core_recipe_ingr_reverse_idx'],
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+# the indexes of recipe.search, postgres only:
+# the full text index is on the exact expression django generates for
+# SearchVector("title"), pg_trgm provides the trigram operators
+# it is part of the contrib modules, which some installs lack,
+# recipe.search then does without trigram similarity
+SEARCH_INDEX = (
+    "CREATE INDEX core_recipe_title_search_idx ON core_recipe "
+    "USING gin (to_tsvector('english'::regconfig, COALESCE(title, '')))"
+)
+TRIGRAM_INDEXES = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX core_recipe_title_trgm_idx ON core_recipe "
+    "USING gin (title gin_trgm_ops)",
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(SEARCH_INDEX)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )
+        available = cursor.fetchone() is not None
+    if available:
+        for statement in TRIGRAM_INDEXES:
+            schema_editor.execute(statement)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS core_recipe_title_search_idx")
+    schema_editor.execute("DROP INDEX IF EXISTS core_recipe_title_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_imageblob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
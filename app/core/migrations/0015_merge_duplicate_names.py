@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from core.dedupe import merge_duplicates
+
+# the names of the tags and ingredients become unique per user in the
+# next migration, the duplicates already there are merged first
+# (a migration of its own: postgres can't alter a table that has
+# pending foreign key checks from the deletes)
+
+
+def merge_names(apps, schema_editor):
+    Recipe = apps.get_model("core", "Recipe")
+    for name in ("tags", "ingredients"):
+        field = Recipe._meta.get_field(name)
+        merge_duplicates(field.related_model, field)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_tombstones'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_names, migrations.RunPython.noop),
+    ]
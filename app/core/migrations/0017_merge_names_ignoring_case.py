@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models.functions import Lower
+
+from core.dedupe import merge_duplicates
+
+# the names become unique per user whatever their case in the next
+# migration, eg. "Vegan" and "vegan" are merged into the oldest one
+
+
+def merge_names(apps, schema_editor):
+    Recipe = apps.get_model("core", "Recipe")
+    for name in ("tags", "ingredients"):
+        field = Recipe._meta.get_field(name)
+        merge_duplicates(field.related_model, field, Lower("name"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_unique_names'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_names, migrations.RunPython.noop),
+    ]
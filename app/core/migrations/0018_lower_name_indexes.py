@@ -0,0 +1,26 @@
+from django.db import migrations
+
+# django 2.1 can't declare an index on an expression, these are created
+# by hand, the same statement works on postgres and sqlite
+# unique on lower(name): "Vegan" and "vegan" can't both exist for a
+# user, recipe.bulk.get_or_create_named looks the names up the same way
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_merge_names_ignoring_case'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            ['CREATE UNIQUE INDEX core_tag_user_lower_name_uniq '
+             'ON core_tag (user_id, lower(name))'],
+            ['DROP INDEX core_tag_user_lower_name_uniq'],
+        ),
+        migrations.RunSQL(
+            ['CREATE UNIQUE INDEX core_ingredient_user_lower_name_uniq '
+             'ON core_ingredient (user_id, lower(name))'],
+            ['DROP INDEX core_ingredient_user_lower_name_uniq'],
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+from core.counts import recount
+
+# the recipe_count of the existing tags and ingredients, one update
+# each, kept up to date by recipe.signals from then on
+# sqlite adds a column by copying the table, which loses the indexes
+# django doesn't know about: the ones of core.0018 are made again
+
+
+def count_recipes(apps, schema_editor):
+    Recipe = apps.get_model("core", "Recipe")
+    for name in ("tags", "ingredients"):
+        field = Recipe._meta.get_field(name)
+        recount(field.related_model.objects.all(), field)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_recipe_counts'),
+    ]
+
+    operations = [
+        migrations.RunPython(count_recipes, migrations.RunPython.noop),
+        migrations.RunSQL(
+            ['CREATE UNIQUE INDEX IF NOT EXISTS '
+             'core_tag_user_lower_name_uniq '
+             'ON core_tag (user_id, lower(name))',
+             'CREATE UNIQUE INDEX IF NOT EXISTS '
+             'core_ingredient_user_lower_name_uniq '
+             'ON core_ingredient (user_id, lower(name))'],
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -21,6 +21,14 @@ def recipe_image_file_path(instance, filename):
     return os.path.join("uploads/recipe/", filename)
 
 
+def recipe_image_variant_file_path(instance, filename):
+    """Generate file path for a resized copy of a recipe image"""
+    ext = filename.split(".")[-1]
+    filename = f"{uuid.uuid4()}.{ext}"
+
+    return os.path.join("uploads/recipe/variants/", filename)
+
+
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         """Creates and save a new user"""
@@ -60,25 +68,82 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = "email"
 
 
-class Tag(models.Model):
+class RecipeCountModel(models.Model):
+    """Tag or ingredient counting the recipes using it"""
+
+    # stored rather than counted on every request, kept exact by
+    # recipe.signals with F() updates and fixed by repair_recipe_counts
+    recipe_count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        # the value read with the object may be outdated by now, a save
+        # must not overwrite the updates made since (eg. when renaming)
+        if not self._state.adding and not any(
+            kwargs.get(name)
+            for name in ("force_insert", "force_update", "update_fields")
+        ):
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "recipe_count"
+            ]
+        super().save(*args, **kwargs)
+
+
+class Tag(RecipeCountModel):
     """Tag to be used for a recipe"""
 
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE
     )
+    # set on every save, see recipe.signals for the other changes
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # a name once per user whatever the case (lower(name) index of
+        # core.0018), listed by name, synced by updated_at, or by recipe_count
+        unique_together = (("user", "name"),)
+        indexes = [
+            models.Index(
+                fields=["user", "updated_at"], name="core_tag_user_updated_idx"
+            ),
+            models.Index(
+                fields=["user", "recipe_count", "id"],
+                name="core_tag_user_count_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Ingredient(models.Model):
+class Ingredient(RecipeCountModel):
     """Ingredient to be used in a recipe"""
 
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE
     )
+    # set on every save, see recipe.signals for the other changes
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # the same as the tags
+        unique_together = (("user", "name"),)
+        indexes = [
+            models.Index(
+                fields=["user", "updated_at"],
+                name="core_ingredient_user_upd_idx",
+            ),
+            models.Index(
+                fields=["user", "recipe_count", "id"],
+                name="core_ingredient_user_count_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -104,6 +169,130 @@ class Recipe(models.Model):
     tags = models.ManyToManyField("Tag")
     # pass a reference to the function, don't invoke it
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # the resized copies of the image are made in the background
+    # (see recipe.images), this tells the client whether they are ready
+    IMAGE_PROCESSING = "processing"
+    IMAGE_READY = "ready"
+    IMAGE_FAILED = "failed"
+    IMAGE_STATUS_CHOICES = (
+        (IMAGE_PROCESSING, "Processing"),
+        (IMAGE_READY, "Ready"),
+        (IMAGE_FAILED, "Failed"),
+    )
+    image_status = models.CharField(
+        max_length=10, blank=True, choices=IMAGE_STATUS_CHOICES
+    )
+    # set on every save, and by recipe.signals when the tags or the
+    # ingredients of the recipe change
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # recipes are listed per user, newest first
+        # or filtered and sorted on one of these fields (recipe.filters)
+        # the id makes the order unique for the cursor pagination
+        indexes = [
+            models.Index(
+                fields=["user", "id"], name="core_recipe_user_id_idx"
+            ),
+            models.Index(
+                fields=["user", "time_minutes", "id"],
+                name="core_recipe_user_time_idx",
+            ),
+            models.Index(
+                fields=["user", "price", "id"],
+                name="core_recipe_user_price_idx",
+            ),
+            models.Index(
+                fields=["user", "title", "id"],
+                name="core_recipe_user_title_idx",
+            ),
+            models.Index(
+                fields=["user", "updated_at"],
+                name="core_recipe_user_updated_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class RecipeImageVariant(models.Model):
+    """Resized copy of the image of a recipe"""
+
+    recipe = models.ForeignKey(
+        "Recipe", on_delete=models.CASCADE, related_name="image_variants"
+    )
+    # eg. "thumbnail", see settings.RECIPE_IMAGE_SIZES
+    name = models.CharField(max_length=20)
+    # eg. "jpeg", "webp"
+    format = models.CharField(max_length=10)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    file = models.ImageField(upload_to=recipe_image_variant_file_path)
+
+    class Meta:
+        unique_together = ("recipe", "name", "format")
+
+    def __str__(self):
+        return f"{self.recipe_id} {self.name} {self.format}"
+
+
+class ImageUpload(models.Model):
+    """Resumable upload of the image of a recipe"""
+
+    # the id is in the upload url, a uuid can't be guessed
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE
+    )
+    recipe = models.ForeignKey(
+        "Recipe", on_delete=models.CASCADE, related_name="image_uploads"
+    )
+    # size of the whole file in bytes, given when the upload starts
+    length = models.PositiveIntegerField()
+    # eg. "jpeg", set once the start of the file has been checked
+    format = models.CharField(max_length=10, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return str(self.id)
+
+
+class ImageBlob(models.Model):
+    """Stored image file shared by every row using the same bytes"""
+
+    # path of the file in the media storage, see core.blobs
+    name = models.CharField(max_length=255, unique=True)
+    # number of recipe images and variants pointing at the file
+    references = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
+class Tombstone(models.Model):
+    """Deleted tag, ingredient or recipe, for the sync of the clients"""
+
+    # no foreign key constraint: deleting a user deletes their recipes,
+    # which leave tombstones behind once the user's own are deleted.
+    # those are cleared with the expired ones (clear_tombstones)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    # model name of the deleted object eg. "recipe"
+    model = models.CharField(max_length=20)
+    object_id = models.IntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "deleted_at"],
+                name="core_tombstone_user_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id}"
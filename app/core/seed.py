@@ -0,0 +1,99 @@
+import random
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from core.counts import recount
+from core.models import Tag, Ingredient, Recipe
+
+# helpers to fill the database with a lot of data
+# used by the benchmark management commands
+
+
+def _bulk_ids(model, objs, user):
+    """Bulk insert the objects and return the ids of the user's rows"""
+    model.objects.bulk_create(objs, batch_size=5000)
+    # bulk_create() only sets the primary keys on postgres
+    # so read them back to work on every database
+    return list(
+        model.objects.filter(user=user)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+
+def seed_user(recipes=1000, tags=50, ingredients=200, per_recipe=5, rng=None):
+    """Create a user owning the given number of rows and return it"""
+    rng = rng or random.Random()
+    user = get_user_model().objects.create_user(
+        f"benchmark-{uuid.uuid4()}@londonappdev.com", "benchmark"
+    )
+
+    tag_ids = _bulk_ids(
+        Tag, (Tag(user=user, name=f"Tag {i}") for i in range(tags)), user
+    )
+    ingredient_ids = _bulk_ids(
+        Ingredient,
+        (
+            Ingredient(user=user, name=f"Ingredient {i}")
+            for i in range(ingredients)
+        ),
+        user,
+    )
+    recipe_ids = _bulk_ids(
+        Recipe,
+        (
+            Recipe(
+                user=user,
+                title=f"Recipe {i}",
+                time_minutes=rng.randint(1, 180),
+                # max_digits=5, decimal_places=2: up to 999.99
+                price=Decimal(rng.randint(100, 99999)) / 100,
+            )
+            for i in range(recipes)
+        ),
+        user,
+    )
+
+    # the through tables of the m2m fields, ie. the join table rows
+    tag_through = Recipe.tags.through
+    tag_through.objects.bulk_create(
+        (
+            tag_through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, min(per_recipe, len(tag_ids)))
+        ),
+        batch_size=5000,
+    )
+    ingredient_through = Recipe.ingredients.through
+    ingredient_through.objects.bulk_create(
+        (
+            ingredient_through(
+                recipe_id=recipe_id, ingredient_id=ingredient_id
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(
+                ingredient_ids, min(per_recipe, len(ingredient_ids))
+            )
+        ),
+        batch_size=5000,
+    )
+
+    # the through rows were inserted without signals
+    for field in Recipe._meta.many_to_many:
+        recount(field.related_model.objects.filter(user=user), field)
+
+    return user
+
+
+def analyze():
+    """Refresh the planner statistics of the recipe tables"""
+    # without it the planner still thinks the seeded tables are empty
+    with connection.cursor() as cursor:
+        for model in (Tag, Ingredient, Recipe):
+            cursor.execute(f"ANALYZE {model._meta.db_table}")
+            for field in model._meta.many_to_many:
+                through = field.remote_field.through
+                cursor.execute(f"ANALYZE {through._meta.db_table}")
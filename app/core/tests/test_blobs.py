@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TransactionTestCase, override_settings
+
+from core.blobs import release, store
+from core.models import ImageBlob, Recipe
+
+
+class MediaRootMixin:
+    """Store the files of the test in a temporary directory"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+
+# TransactionTestCase: the files are deleted once the transaction
+# is committed, which never happens in a TestCase
+class BlobTests(MediaRootMixin, TransactionTestCase):
+    def test_store_deduplicates(self):
+        """Test the same bytes are stored once under their digest"""
+        name1 = store(ContentFile(b"image"), "one.jpg")
+        name2 = store(ContentFile(b"image"), "two.jpg")
+
+        self.assertEqual(name1, name2)
+        self.assertTrue(name1.startswith("blobs/"))
+        self.assertTrue(name1.endswith(".jpg"))
+        self.assertEqual(ImageBlob.objects.get(name=name1).references, 2)
+        directory = os.path.dirname(default_storage.path(name1))
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_release_deletes_last_reference(self):
+        """Test the file is only deleted with its last reference"""
+        name = store(ContentFile(b"image"), "one.jpg")
+        store(ContentFile(b"image"), "two.jpg")
+
+        release(name)
+        self.assertTrue(default_storage.exists(name))
+
+        release(name)
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+
+    def test_release_unknown_file(self):
+        """Test files stored before content addressing are kept"""
+        name = default_storage.save("uploads/old.jpg", ContentFile(b"x"))
+
+        release(name)
+
+        self.assertTrue(default_storage.exists(name))
+
+    def test_delete_recipe_releases_image(self):
+        """Test deleting recipes sharing an image keeps it until the last"""
+        user = get_user_model().objects.create_user(
+            "user@londonappdev.com", "testpass"
+        )
+        recipes = [
+            Recipe.objects.create(
+                user=user,
+                title=f"Recipe {i}",
+                time_minutes=10,
+                price=5,
+                image=store(ContentFile(b"image"), "photo.jpg"),
+            )
+            for i in range(2)
+        ]
+        name = recipes[0].image.name
+
+        recipes[0].delete()
+        self.assertTrue(default_storage.exists(name))
+
+        recipes[1].delete()
+        self.assertFalse(default_storage.exists(name))
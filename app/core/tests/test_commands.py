@@ -1,5 +1,7 @@
+from io import StringIO
 from unittest.mock import patch
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
 from django.db.utils import OperationalError
 from django.test import TestCase
@@ -42,3 +44,21 @@ class CommandTests(TestCase):
             # the __getitem__ mock will get called 6 times
             # when wait_for_db command is called
             self.assertEqual(gi.call_count, 6)
+
+    def test_benchmark_indexes(self):
+        """Test the index benchmark prints the plans and keeps no data"""
+        out = StringIO()
+        call_command(
+            "benchmark_indexes",
+            users=2,
+            recipes=5,
+            tags=3,
+            ingredients=3,
+            per_recipe=2,
+            stdout=out,
+        )
+
+        output = out.getvalue()
+        self.assertIn("Tags by name", output)
+        self.assertIn("Without indexes:", output)
+        self.assertFalse(get_user_model().objects.exists())
@@ -0,0 +1,104 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.db.models.functions import Lower
+from django.test import TestCase
+
+from core.dedupe import find_duplicates, merge_duplicates
+from core.models import Recipe, Tag, Tombstone
+
+
+def drop_lower_name_index():
+    """Allow the names differing by case, as before core.0018"""
+    # rolled back with the rest of the test
+    with connection.cursor() as cursor:
+        cursor.execute("DROP INDEX core_tag_user_lower_name_uniq")
+
+
+def sample_recipe(user, title="Curry"):
+    return Recipe.objects.create(
+        user=user, title=title, time_minutes=10, price=5.00
+    )
+
+
+class DedupeTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+        self.field = Recipe._meta.get_field("tags")
+        drop_lower_name_index()
+
+    def test_find_duplicates(self):
+        """Test every duplicate maps to the oldest of its group"""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        upper = Tag.objects.create(user=self.user, name="VEGAN")
+        lower = Tag.objects.create(user=self.user, name="vegan")
+        Tag.objects.create(user=self.user, name="Quick")
+
+        mapping = find_duplicates(Tag, Lower("name"))
+
+        self.assertEqual(mapping, {upper.id: vegan.id, lower.id: vegan.id})
+
+    def test_duplicates_per_user(self):
+        """Test the same name of two users is not a duplicate"""
+        other = get_user_model().objects.create_user(
+            "other@londonappdev.com", "testpass"
+        )
+        Tag.objects.create(user=self.user, name="Vegan")
+        Tag.objects.create(user=other, name="vegan")
+
+        self.assertEqual(find_duplicates(Tag, Lower("name")), {})
+
+    def test_merge_duplicates(self):
+        """Test the recipes of the duplicates move to the one kept"""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        upper = Tag.objects.create(user=self.user, name="VEGAN")
+        lower = Tag.objects.create(user=self.user, name="vegan")
+        # both duplicates, the kept one and a duplicate, one duplicate
+        both = sample_recipe(self.user, "Both")
+        both.tags.add(upper, lower)
+        kept = sample_recipe(self.user, "Kept")
+        kept.tags.add(vegan, lower)
+        single = sample_recipe(self.user, "Single")
+        single.tags.add(upper)
+
+        removed = merge_duplicates(Tag, self.field, Lower("name"))
+
+        self.assertEqual(removed, {upper.id: vegan.id, lower.id: vegan.id})
+        self.assertEqual(list(Tag.objects.all()), [vegan])
+        for recipe in (both, kept, single):
+            self.assertEqual(list(recipe.tags.all()), [vegan])
+        tombstones = Tombstone.objects.values_list("model", "object_id")
+        self.assertCountEqual(
+            tombstones, [("tag", upper.id), ("tag", lower.id)]
+        )
+
+    def test_merge_historical_models(self):
+        """Test the models of a migration leave tombstones too"""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        lower = Tag.objects.create(user=self.user, name="vegan")
+        sample_recipe(self.user).tags.add(lower)
+        state = MigrationLoader(connection).project_state(
+            ("core", "0017_merge_names_ignoring_case")
+        )
+        field = state.apps.get_model("core", "Recipe")._meta.get_field("tags")
+
+        merge_duplicates(field.related_model, field, Lower("name"))
+
+        self.assertEqual(list(Tag.objects.all()), [vegan])
+        tombstone = Tombstone.objects.get()
+        self.assertEqual(tombstone.user, self.user)
+        self.assertEqual(tombstone.model, "tag")
+        self.assertEqual(tombstone.object_id, lower.id)
+
+    def test_merge_without_duplicates(self):
+        """Test nothing changes when every name is unique"""
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        sample_recipe(self.user).tags.add(tag)
+
+        with self.assertNumQueries(1):
+            removed = merge_duplicates(Tag, self.field, Lower("name"))
+
+        self.assertEqual(removed, {})
+        self.assertEqual(Tag.objects.count(), 1)
@@ -0,0 +1,148 @@
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+
+from core.blobs import store
+
+CONTENT = bytes(range(256)) * 4
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(
+            MEDIA_ROOT=self.media_root, MEDIA_SERVE_MODE="django"
+        )
+        self.settings.enable()
+        self.name = default_storage.save(
+            "uploads/recipe/photo.jpg", ContentFile(CONTENT)
+        )
+        self.url = f"/media/{self.name}"
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def content(self, res):
+        return b"".join(res.streaming_content)
+
+    def test_serve_file(self):
+        """Test a media file is sent with its validators"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.content(res), CONTENT)
+        self.assertEqual(res["Content-Type"], "image/jpeg")
+        self.assertEqual(res["Content-Length"], str(len(CONTENT)))
+        self.assertEqual(res["Accept-Ranges"], "bytes")
+        self.assertIn("ETag", res)
+        self.assertIn("Last-Modified", res)
+
+    def test_serve_missing_file(self):
+        """Test missing files and paths outside the media root are 404"""
+        self.assertEqual(self.client.get("/media/nope.jpg").status_code, 404)
+        res = self.client.get("/media/../settings.py")
+        self.assertEqual(res.status_code, 404)
+
+    def test_range(self):
+        """Test a range request returns only the part asked for"""
+        res = self.client.get(self.url, HTTP_RANGE="bytes=100-199")
+
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(self.content(res), CONTENT[100:200])
+        self.assertEqual(res["Content-Length"], "100")
+        self.assertEqual(
+            res["Content-Range"], f"bytes 100-199/{len(CONTENT)}"
+        )
+
+    def test_range_suffix(self):
+        """Test asking for the last bytes of a file"""
+        res = self.client.get(self.url, HTTP_RANGE="bytes=-10")
+
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(self.content(res), CONTENT[-10:])
+
+    def test_range_not_satisfiable(self):
+        """Test a range after the end of the file"""
+        res = self.client.get(self.url, HTTP_RANGE="bytes=5000-")
+
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res["Content-Range"], f"bytes */{len(CONTENT)}")
+
+    def test_if_range_changed(self):
+        """Test the whole file is sent when the client's copy is stale"""
+        res = self.client.get(
+            self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"'
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.content(res), CONTENT)
+
+    def test_if_none_match(self):
+        """Test a client with the current version gets a 304"""
+        etag = self.client.get(self.url)["ETag"]
+
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res["ETag"], etag)
+
+    def test_if_modified_since(self):
+        """Test a client with a recent enough copy gets a 304"""
+        last_modified = self.client.get(self.url)["Last-Modified"]
+
+        res = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(res.status_code, 304)
+
+    def test_blob_immutable(self):
+        """Test content addressed files are cacheable forever"""
+        name = store(ContentFile(CONTENT), "photo.jpg")
+
+        res = self.client.get(f"/media/{name}")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("immutable", res["Cache-Control"])
+
+    @override_settings(MEDIA_SERVE_MODE="x-accel-redirect")
+    def test_x_accel_redirect(self):
+        """Test nginx is told to send the file"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res["X-Accel-Redirect"], f"/protected-media/{self.name}"
+        )
+        self.assertEqual(res.content, b"")
+
+    @override_settings(MEDIA_SERVE_MODE="x-sendfile")
+    def test_x_sendfile(self):
+        """Test apache is told to send the file"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res["X-Sendfile"], default_storage.path(self.name))
+        self.assertEqual(res.content, b"")
+
+    @override_settings(
+        MEDIA_SERVE_MODE="x-accel-redirect", MEDIA_OFFLOAD_EMULATE=True
+    )
+    def test_x_accel_redirect_emulated(self):
+        """Test the stand-in sends the file like nginx would"""
+        res = self.client.get(self.url, HTTP_RANGE="bytes=0-9")
+
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(self.content(res), CONTENT[:10])
+        self.assertNotIn("X-Accel-Redirect", res)
+
+    @override_settings(
+        MEDIA_SERVE_MODE="x-sendfile", MEDIA_OFFLOAD_EMULATE=True
+    )
+    def test_x_sendfile_emulated(self):
+        """Test the stand-in sends the file like apache would"""
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.content(res), CONTENT)
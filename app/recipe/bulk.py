@@ -0,0 +1,476 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import prefetch_related_objects
+from django.db.models.functions import Lower
+from django.db.models.signals import post_save, m2m_changed
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from core.counts import adjust
+
+# batch endpoints, eg. /api/recipe/recipes/bulk/
+# POST   [{...}, {...}]                 create every item
+# PATCH  [{"id": 1, ...}, ...]          update every item
+# DELETE [1, 2, 3]                      delete every id
+# the whole batch is validated first, with one query per related model
+# for all the ids of the batch, then written in a single transaction.
+# if any item is invalid nothing is written and the response has one
+# entry per item: {"errors": [{}, {"tags": [...]}, ...]}
+#
+# bulk_create() and through table inserts don't send any signals, so
+# the same post_save / m2m_changed signals the ORM would send are sent
+# by hand, that way the receivers (eg. cache invalidation) keep working
+# the m2m_changed signals have an extra bulk=True, the receivers that
+# would write to every instance (eg. updated_at) leave it to the batch
+
+
+NOT_A_LIST = 'Expected a list of items but got type "{input_type}".'
+TOO_MANY = "Ensure this list has no more than {max_size} items."
+DOES_NOT_EXIST = 'Invalid pk "{pk_value}" - object does not exist.'
+INCORRECT_TYPE = "Incorrect type. Expected pk value, received {data_type}."
+REQUIRED = "This field is required."
+NAME_TAKEN = "{model_name} with this name already exists."
+CONFLICT = "The batch conflicts with itself or with existing objects."
+
+
+def bulk_create(model, objs):
+    """Insert the objects, set their ids and send post_save for them"""
+    if not connection.features.can_return_ids_from_bulk_insert:
+        # only postgres returns the new ids from a bulk insert
+        # other backends (eg. sqlite in django 2.1) save one by one
+        for obj in objs:
+            obj.save()
+        return objs
+
+    model.objects.bulk_create(objs)
+    for obj in objs:
+        post_save.send(
+            sender=model,
+            instance=obj,
+            created=True,
+            update_fields=None,
+            raw=False,
+            using=connection.alias,
+        )
+    return objs
+
+
+def _is_pk(value):
+    """Tell whether an id of a batch can be looked up"""
+    # bool is an int too, and a list or a dict isn't even hashable
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _pk_errors(pk, found):
+    """Return the errors of an id of a batch, none if it was found"""
+    if pk is None:
+        return [REQUIRED]
+    if not _is_pk(pk):
+        return [INCORRECT_TYPE.format(data_type=type(pk).__name__)]
+    if pk not in found:
+        return [DOES_NOT_EXIST.format(pk_value=pk)]
+    return []
+
+
+def get_or_create_named(model, user_id, names, retry=True):
+    """Return the ids of the objects of the user with the given names"""
+    # the existing ones in one select, the missing ones in one insert
+    # the names are unique per user whatever their case (see the
+    # lower(name) index of core.0018), eg. "vegan" finds "Vegan"
+    # {lowercase name: the first spelling given}
+    spellings = {}
+    for name in names:
+        spellings.setdefault(name.lower(), name)
+    keys = list(spellings)
+    if not keys:
+        return []
+
+    rows = (
+        model.objects.annotate(key=Lower("name"))
+        .filter(user_id=user_id, key__in=keys)
+        .values_list("name", "id")
+    )
+    ids = {name.lower(): pk for name, pk in rows}
+    missing = [
+        model(user_id=user_id, name=spellings[key])
+        for key in keys
+        if key not in ids
+    ]
+    if missing:
+        try:
+            # a savepoint, the transaction of the caller goes on
+            with transaction.atomic():
+                bulk_create(model, missing)
+        except IntegrityError:
+            # another request created some of them in the meantime, the
+            # unique index made this insert wait until it committed,
+            # they can be read now
+            if not retry:
+                raise
+            return get_or_create_named(
+                model, user_id, list(spellings.values()), retry=False
+            )
+        ids.update((obj.name.lower(), obj.id) for obj in missing)
+
+    return [ids[key] for key in keys]
+
+
+def _send_m2m_changed(field, action, changes):
+    """Send m2m_changed for every instance with a non empty pk set"""
+    for instance, pk_set in changes.items():
+        if pk_set:
+            m2m_changed.send(
+                sender=field.remote_field.through,
+                instance=instance,
+                action=action,
+                reverse=False,
+                model=field.related_model,
+                pk_set=pk_set,
+                using=connection.alias,
+                bulk=True,
+            )
+
+
+def set_relations(instances, field_name, wanted, created=False):
+    """Set the related ids of a m2m field on many instances at once"""
+    # wanted: {instance: {ids}} the ids each instance should end up with
+    # only the difference with the current rows is written: one select,
+    # one delete and one bulk insert whatever the number of instances,
+    # nothing at all when every instance already has its ids
+    # updated_at is left to the caller, see touch()
+    # the recipe_count of the related objects is adjusted here, one
+    # update per different change (see core.counts.adjust)
+    if not instances:
+        return set()
+
+    model = type(instances[0])
+    field = model._meta.get_field(field_name)
+    through = field.remote_field.through
+    # the foreign key columns of the through table eg. recipe_id, tag_id
+    source = field.m2m_column_name()
+    target = field.m2m_reverse_name()
+
+    current = defaultdict(dict)
+    if not created:
+        rows = through.objects.filter(
+            **{f"{source}__in": [instance.pk for instance in instances]}
+        ).values_list("id", source, target)
+        for row_id, source_id, target_id in rows:
+            current[source_id][target_id] = row_id
+
+    removed, added = {}, {}
+    for instance in instances:
+        have = current[instance.pk]
+        removed[instance] = set(have) - wanted[instance]
+        added[instance] = wanted[instance] - set(have)
+
+    row_ids = [
+        current[instance.pk][target_id]
+        for instance, target_ids in removed.items()
+        for target_id in target_ids
+    ]
+    if row_ids:
+        _send_m2m_changed(field, "pre_remove", removed)
+        # delete() would select the rows first: the through model has
+        # m2m_changed receivers, which rules out the fast delete path.
+        # the signals are sent by hand anyway, a single DELETE is enough
+        queryset = through.objects.filter(id__in=row_ids)
+        queryset._raw_delete(queryset.db)
+        _send_m2m_changed(field, "post_remove", removed)
+
+    rows = [
+        through(**{source: instance.pk, target: target_id})
+        for instance, target_ids in added.items()
+        for target_id in target_ids
+    ]
+    if rows:
+        _send_m2m_changed(field, "pre_add", added)
+        through.objects.bulk_create(rows)
+        _send_m2m_changed(field, "post_add", added)
+
+    counts = defaultdict(int)
+    for instance in instances:
+        for target_id in added[instance]:
+            counts[target_id] += 1
+        for target_id in removed[instance]:
+            counts[target_id] -= 1
+    adjust(field.related_model, counts)
+
+    # the ids of the instances whose relations changed
+    return {
+        instance.pk
+        for instance in instances
+        if removed[instance] or added[instance]
+    }
+
+
+def touch(model, ids):
+    """Set updated_at of the given objects in one query"""
+    if ids:
+        model.objects.filter(pk__in=ids).update(updated_at=timezone.now())
+
+
+class BulkModelMixin:
+    """Create, update and delete many objects in a single request"""
+
+    # serializer used to validate each item of a batch
+    bulk_serializer_class = None
+    # m2m fields of the items, {field name: related model}
+    # their ids are validated for the whole batch at once
+    bulk_relations = {}
+    # whether the items have a name unique per user whatever its case
+    # checked for the whole batch at once too
+    bulk_unique_names = False
+
+    def get_bulk_serializer(self, *args, **kwargs):
+        kwargs["context"] = self.get_serializer_context()
+        # the checks made for the whole batch are skipped per item
+        kwargs["context"]["bulk"] = True
+        return self.bulk_serializer_class(*args, **kwargs)
+
+    def _bulk_items(self, request):
+        """Return the items of the request or raise an error response"""
+        items = request.data
+        if not isinstance(items, list):
+            message = NOT_A_LIST.format(input_type=type(items).__name__)
+            return None, {"non_field_errors": [message]}
+        max_size = settings.RECIPE_API_MAX_BATCH_SIZE
+        if len(items) > max_size:
+            message = TOO_MANY.format(max_size=max_size)
+            return None, {"non_field_errors": [message]}
+        return items, None
+
+    def _validate_relations(self, serializers, errors):
+        """Check all the related ids of the batch, one query per model"""
+        for field_name, related_model in self.bulk_relations.items():
+            ids = {
+                pk
+                for serializer in serializers
+                if serializer is not None
+                for pk in serializer.validated_data.get(field_name, ())
+            }
+            if not ids:
+                continue
+            found = set(
+                related_model.objects.filter(
+                    user=self.request.user, id__in=ids
+                ).values_list("id", flat=True)
+            )
+            for index, serializer in enumerate(serializers):
+                if serializer is None:
+                    continue
+                missing = [
+                    DOES_NOT_EXIST.format(pk_value=pk)
+                    for pk in serializer.validated_data.get(field_name, ())
+                    if pk not in found
+                ]
+                if missing:
+                    errors[index][field_name] = missing
+
+    def _validate_names(self, serializers, instances, errors):
+        """Check the names of the batch aren't taken, in one query"""
+        names = [
+            serializer.validated_data.get("name")
+            if serializer is not None
+            else None
+            for serializer in serializers
+        ]
+        keys = {name.lower() for name in names if name is not None}
+        if not keys:
+            return
+        model = self.queryset.model
+        # the lower(name) index of core.0018 finds them
+        taken = dict(
+            model.objects.annotate(key=Lower("name"))
+            .filter(user=self.request.user, key__in=keys)
+            .values_list("key", "id")
+        )
+        for index, name in enumerate(names):
+            if name is None:
+                continue
+            pk = taken.get(name.lower())
+            # renaming an object to its own name in another case is fine
+            own = instances[index].pk if instances is not None else None
+            if pk is not None and pk != own:
+                errors[index]["name"] = [
+                    NAME_TAKEN.format(model_name=model._meta.verbose_name)
+                ]
+
+    def _validate_batch(self, items, instances=None):
+        """Validate every item, return the serializers and the errors"""
+        serializers, errors = [], []
+        for index, item in enumerate(items):
+            if instances is None:
+                serializer = self.get_bulk_serializer(data=item)
+            else:
+                instance = instances[index]
+                if instance is None:
+                    serializers.append(None)
+                    pk = item.get("id") if isinstance(item, dict) else None
+                    errors.append({"id": _pk_errors(pk, ())})
+                    continue
+                serializer = self.get_bulk_serializer(
+                    instance, data=item, partial=True
+                )
+            serializer.is_valid()
+            serializers.append(serializer)
+            errors.append(dict(serializer.errors))
+
+        valid = [
+            serializer if serializer is not None and not error else None
+            for serializer, error in zip(serializers, errors)
+        ]
+        self._validate_relations(valid, errors)
+        if self.bulk_unique_names:
+            self._validate_names(valid, instances, errors)
+        return serializers, errors
+
+    def _write_relations(self, objs, serializers, created):
+        """Set the m2m fields given in the items"""
+        changed = set()
+        for field_name in self.bulk_relations:
+            wanted = {
+                obj: set(serializer.validated_data[field_name])
+                for obj, serializer in zip(objs, serializers)
+                if field_name in serializer.validated_data
+            }
+            changed |= set_relations(
+                list(wanted), field_name, wanted, created=created
+            )
+        if not created:
+            # one update for all of them instead of one per m2m_changed
+            touch(self.queryset.model, changed)
+
+    def _bulk_response(self, objs, status_code):
+        if self.bulk_relations:
+            # read the related ids of all the objects in one query each
+            prefetch_related_objects(objs, *self.bulk_relations)
+        serializer = self.get_serializer(objs, many=True)
+        return Response(serializer.data, status=status_code)
+
+    def bulk_create(self, request):
+        items, error = self._bulk_items(request)
+        if error:
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+        serializers, errors = self._validate_batch(items)
+        if any(errors):
+            return Response(
+                {"errors": errors}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        model = self.queryset.model
+        try:
+            objs = self._bulk_insert(model, serializers)
+        except IntegrityError:
+            # eg. the same unique name twice in the batch
+            return Response(
+                {"non_field_errors": [CONFLICT]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return self._bulk_response(objs, status.HTTP_201_CREATED)
+
+    def _bulk_insert(self, model, serializers):
+        """Create the objects of the validated items"""
+        with transaction.atomic():
+            objs = [
+                model(
+                    user=self.request.user,
+                    **{
+                        key: value
+                        for key, value in serializer.validated_data.items()
+                        if key not in self.bulk_relations
+                    },
+                )
+                for serializer in serializers
+            ]
+            bulk_create(model, objs)
+            self._write_relations(objs, serializers, created=True)
+        return objs
+
+    def bulk_update(self, request):
+        items, error = self._bulk_items(request)
+        if error:
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+        model = self.queryset.model
+        ids = [
+            item.get("id") if isinstance(item, dict) else None
+            for item in items
+        ]
+        found = model.objects.filter(
+            user=self.request.user, id__in=[pk for pk in ids if _is_pk(pk)]
+        ).in_bulk()
+        instances = [found.get(pk) if _is_pk(pk) else None for pk in ids]
+        serializers, errors = self._validate_batch(items, instances)
+        if any(errors):
+            return Response(
+                {"errors": errors}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            self._bulk_save(instances, serializers)
+        except IntegrityError:
+            # eg. two items renamed to the same unique name
+            return Response(
+                {"non_field_errors": [CONFLICT]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return self._bulk_response(instances, status.HTTP_200_OK)
+
+    def _bulk_save(self, instances, serializers):
+        """Update the objects with their validated items"""
+        with transaction.atomic():
+            for instance, serializer in zip(instances, serializers):
+                fields = [
+                    key
+                    for key in serializer.validated_data
+                    if key not in self.bulk_relations
+                ]
+                if not fields:
+                    continue
+                for key in fields:
+                    setattr(instance, key, serializer.validated_data[key])
+                # auto_now fields are only saved when listed
+                instance.save(update_fields=fields + ["updated_at"])
+            self._write_relations(instances, serializers, created=False)
+
+    def bulk_destroy(self, request):
+        items, error = self._bulk_items(request)
+        if error:
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+        model = self.queryset.model
+        queryset = model.objects.filter(
+            user=self.request.user,
+            id__in=[pk for pk in items if _is_pk(pk)],
+        )
+        found = set(queryset.values_list("id", flat=True))
+        errors = [_pk_errors(pk, found) for pk in items]
+        if any(errors):
+            return Response(
+                {"errors": errors}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        with transaction.atomic():
+            # queryset.delete() sends pre/post_delete for every object
+            queryset.delete()
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(methods=["POST", "PATCH", "DELETE"], detail=False)
+    def bulk(self, request):
+        """Create, update or delete a batch of objects"""
+        if request.method == "POST":
+            return self.bulk_create(request)
+        elif request.method == "PATCH":
+            return self.bulk_update(request)
+
+        return self.bulk_destroy(request)
@@ -0,0 +1,83 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+# https://docs.djangoproject.com/en/2.1/topics/cache/#the-low-level-cache-api
+# every user has a version number in the cache that is bumped whenever
+# one of their tags, ingredients or recipes changes (see recipe.signals)
+# the version is part of every cache key of the user, so bumping it
+# makes all their cached entries unreachable at once, they are never
+# looked up again and simply expire. no need to know which keys exist,
+# which also works with shared backends like memcached
+# other namespaces version narrower parts of the data of a user,
+# eg. "ingredients" for the recipe ingredients (see recipe.coverage)
+
+
+def get_cache():
+    """Return the cache used by the recipe api"""
+    return caches[settings.RECIPE_API_CACHE_ALIAS]
+
+
+def _version_key(user_id, namespace=None):
+    if namespace:
+        return f"recipe:version:{namespace}:{user_id}"
+    return f"recipe:version:{user_id}"
+
+
+def _new_version():
+    # start from the current time in microseconds rather than 1
+    # so a version that was evicted from the cache never comes back
+    # with a value that was already used for older entries
+    return int(time.time() * 1000000)
+
+
+def get_user_version(user_id, namespace=None):
+    """Return the current version of the data of the user"""
+    cache = get_cache()
+    key = _version_key(user_id, namespace)
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        # add() does nothing if another request set it in the meantime
+        cache.add(key, version, timeout=None)
+        version = cache.get(key, version)
+
+    return version
+
+
+def bump_user_version(user_id, namespace=None):
+    """Invalidate everything cached for the user"""
+    cache = get_cache()
+    key = _version_key(user_id, namespace)
+    try:
+        # atomic on the shared backends
+        return cache.incr(key)
+    except ValueError:
+        # the key doesn't exist (yet or anymore)
+        version = _new_version()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def bump_user_version_on_commit(user_id, namespace=None):
+    """Invalidate everything cached for the user once the changes commit"""
+    # bumped before the commit, a concurrent request could read the new
+    # version along with the old rows and cache them under it for good
+    # runs right away outside of a transaction
+    transaction.on_commit(lambda: bump_user_version(user_id, namespace))
+
+
+def response_cache_key(request, scope):
+    """Return the cache key of a response for the request's user"""
+    user_id = request.user.id
+    # the full url covers the endpoint and all the query params
+    # the accepted format is needed since json and the browsable api
+    # share the url
+    url = request.build_absolute_uri()
+    media_type = getattr(request, "accepted_media_type", "")
+    digest = hashlib.md5(f"{url}|{media_type}".encode()).hexdigest()
+    version = get_user_version(user_id)
+    return f"recipe:{scope}:{user_id}:{version}:{digest}"
@@ -0,0 +1,64 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from core.models import Recipe
+
+from recipe.cache import response_cache_key
+
+# https://developer.mozilla.org/en-US/docs/Web/HTTP/Conditional_requests
+# every response of the recipe api that can be polled has an ETag, a
+# client sending it back in If-None-Match gets a 304 Not Modified
+# without a body when nothing changed, the etag is known before
+# anything is read or serialized:
+# - lists: the per-user version of recipe.cache, bumped on every change
+#   of the user's data, no query at all
+# - a recipe: its updated_at, one lookup by primary key
+# the url and the accepted format are part of both, eg. ?fields= or
+# ?format=api give other etags
+
+
+def _etag(*parts):
+    value = "|".join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(value.encode()).hexdigest())
+
+
+def collection_etag(request, scope):
+    """Return the etag of a list of the user's data"""
+    # the cache key of the response holds the version of the user
+    return _etag(response_cache_key(request, scope))
+
+
+def recipe_etag(request, pk):
+    """Return the etag of a recipe of the user, None if there is none"""
+    try:
+        found = list(
+            Recipe.objects.filter(user=request.user, pk=pk).values_list(
+                "updated_at", flat=True
+            )
+        )
+    except (TypeError, ValueError):
+        # not a valid id, let the view answer the 404
+        return None
+    if not found:
+        return None
+    updated_at = found[0]
+
+    url = request.build_absolute_uri()
+    media_type = getattr(request, "accepted_media_type", "")
+    return _etag(pk, updated_at.isoformat(), url, media_type)
+
+
+def conditional(request, etag, handler, *args, **kwargs):
+    """Answer 304 if the client has the etag, else call the handler"""
+    if etag is None:
+        return handler(request, *args, **kwargs)
+
+    # also checks If-Match, 412 Precondition Failed if it differs
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = handler(request, *args, **kwargs)
+    if response.status_code in (200, 304):
+        response["ETag"] = etag
+    return response
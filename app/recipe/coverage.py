@@ -0,0 +1,156 @@
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+
+from core.models import Recipe
+
+from recipe.cache import bump_user_version, get_user_version
+
+# "what can I cook with these ingredients"
+# every process keeps, for the users that asked recently, a posting
+# list of their recipes per ingredient: {ingredient id: {recipe ids}}
+# the recipes using any of the given ingredients are counted with one
+# pass over their posting lists, the recipes using most of them and
+# missing fewest come first, without going through the database
+#
+# the index of a user is tagged with the version of their ingredient
+# assignments (recipe.cache, namespace "ingredients"), which every
+# change bumps, whatever the process it happens in:
+# - a change made in this process is versioned and applied to the
+#   index once committed, if the index was in sync before it
+#   (version + 1). applying a change twice leaves the index the same
+# - any other change makes the versions differ, the index is then
+#   built again from the database on the next query
+
+NAMESPACE = "ingredients"
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+class IngredientIndex:
+    """Posting lists of the recipes of a user by ingredient"""
+
+    def __init__(self, version, links=()):
+        self.version = version
+        # ingredient id -> recipe ids
+        self.postings = defaultdict(set)
+        # recipe id -> ingredient ids
+        self.recipes = defaultdict(set)
+        for recipe_id, ingredient_id in links:
+            self.add(recipe_id, [ingredient_id])
+
+    def add(self, recipe_id, ingredient_ids):
+        for ingredient_id in ingredient_ids:
+            self.postings[ingredient_id].add(recipe_id)
+            self.recipes[recipe_id].add(ingredient_id)
+
+    def remove(self, recipe_id, ingredient_ids):
+        for ingredient_id in ingredient_ids:
+            self.postings[ingredient_id].discard(recipe_id)
+            self.recipes[recipe_id].discard(ingredient_id)
+
+    def remove_recipe(self, recipe_id):
+        self.remove(recipe_id, list(self.recipes.pop(recipe_id, ())))
+
+    def remove_ingredient(self, ingredient_id):
+        for recipe_id in self.postings.pop(ingredient_id, ()):
+            self.recipes[recipe_id].discard(ingredient_id)
+
+    def coverage(self, ingredient_ids, max_missing=None):
+        """Return (recipe id, covered, missing) for the matching recipes"""
+        # covered: how many of the ingredients the recipe uses
+        # missing: how many of its ingredients aren't in the list
+        covered = Counter()
+        for ingredient_id in set(ingredient_ids):
+            covered.update(self.postings.get(ingredient_id, ()))
+
+        matches = []
+        for recipe_id, count in covered.items():
+            missing = len(self.recipes[recipe_id]) - count
+            if max_missing is None or missing <= max_missing:
+                matches.append((recipe_id, count, missing))
+        # fewest missing, then most covered, then newest
+        matches.sort(key=lambda match: (match[2], -match[1], -match[0]))
+        return matches
+
+
+def build_index(user_id, version=None):
+    """Build the index of a user from the database"""
+    through = Recipe.ingredients.through
+    links = through.objects.filter(recipe__user_id=user_id).values_list(
+        "recipe_id", "ingredient_id"
+    )
+    return IngredientIndex(version, links.iterator())
+
+
+def coverage_sql(user_id, ingredient_ids, max_missing=None):
+    """Same as IngredientIndex.coverage() with one aggregate query"""
+    # the way to do it in the database, used by the benchmark and tests
+    queryset = (
+        Recipe.objects.filter(user_id=user_id)
+        .annotate(
+            covered=Count(
+                "ingredients",
+                filter=Q(ingredients__in=set(ingredient_ids)),
+            ),
+            missing=Count("ingredients") - F("covered"),
+        )
+        .filter(covered__gt=0)
+    )
+    if max_missing is not None:
+        queryset = queryset.filter(missing__lte=max_missing)
+    return queryset.order_by("missing", "-covered", "-id").values_list(
+        "id", "covered", "missing"
+    )
+
+
+def get_index(user_id):
+    """Return the up to date index of a user"""
+    version = get_user_version(user_id, NAMESPACE)
+    with _lock:
+        index = _indexes.get(user_id)
+        if index is not None and index.version == version:
+            _indexes.move_to_end(user_id)
+            return index
+
+    index = build_index(user_id, version)
+    if connection.in_atomic_block:
+        # it may contain changes that will be rolled back
+        return index
+    with _lock:
+        _indexes[user_id] = index
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > settings.RECIPE_COVERAGE_INDEX_USERS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def clear_indexes():
+    """Forget the index of every user"""
+    with _lock:
+        _indexes.clear()
+
+
+def record_change(user_id, apply):
+    """Version a change of the ingredients of a user and index it"""
+    # once committed: bumped before, another process could build the
+    # index at the new version while the change can't be read yet
+
+    def on_commit():
+        version = bump_user_version(user_id, NAMESPACE)
+        with _lock:
+            index = _indexes.get(user_id)
+            if index is None:
+                return
+            if index.version == version - 1:
+                apply(index)
+                index.version = version
+            else:
+                # missed a change, build it again on the next query
+                del _indexes[user_id]
+
+    transaction.on_commit(on_commit)
@@ -0,0 +1,88 @@
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+# https://www.django-rest-framework.org/api-guide/relations/#custom-relational-fields
+# PrimaryKeyRelatedField(many=True) validates every id of the list with
+# its own queryset.get(pk=...), and the queryset is the same for every
+# user so the ids of other users' objects are accepted too.
+# UserPrimaryKeyRelatedField only accepts the objects of request.user and
+# with many=True looks the whole list up in a single query:
+# WHERE id IN (...) AND user_id = ...
+
+
+def to_pk(value):
+    """Return the primary key given by the client, like int() would"""
+    # int() quietly takes True for 1 and 1.9 for 1, the client surely
+    # didn't mean those
+    if isinstance(value, bool):
+        raise TypeError(value)
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(value)
+    return int(value)
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Many related field resolving all the primary keys in one query"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, "__iter__"):
+            self.fail("not_a_list", input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail("empty")
+
+        child = self.child_relation
+        pks, errors = [], []
+        for item in data:
+            try:
+                if child.pk_field is not None:
+                    item = child.pk_field.to_internal_value(item)
+                # form data sends the ids as strings
+                pks.append(to_pk(item))
+            except (TypeError, ValueError):
+                errors.append(
+                    child.error_messages["incorrect_type"].format(
+                        data_type=type(item).__name__
+                    )
+                )
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        objects = child.get_queryset().in_bulk(pks)
+        # report every missing id at once, not just the first one
+        missing = [
+            child.error_messages["does_not_exist"].format(pk_value=pk)
+            for pk in pks
+            if pk not in objects
+        ]
+        if missing:
+            raise serializers.ValidationError(missing)
+
+        return [objects[pk] for pk in pks]
+
+
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key related field limited to the objects of request.user"""
+
+    def __init__(self, **kwargs):
+        # name of the foreign key to the owner on the related model
+        self.owner_field = kwargs.pop("owner_field", "user")
+        super().__init__(**kwargs)
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        """Return a BulkManyRelatedField when many=True is passed"""
+        list_kwargs = {"child_relation": cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        """Return the related objects owned by the request user"""
+        queryset = super().get_queryset()
+        request = self.context.get("request")
+        if request is None:
+            # no user to scope to, accept nothing
+            return queryset.none()
+
+        return queryset.filter(**{self.owner_field: request.user})
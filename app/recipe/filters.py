@@ -0,0 +1,256 @@
+from django.db.models import Count, Exists, OuterRef, Q
+
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from core.models import Recipe
+
+# filtering on a m2m field with a join eg. filter(tags__id__in=[1, 2])
+# returns one row per matching (recipe, tag) pair, so a recipe with
+# both tags comes back twice. the filters below never join the
+# through table into the main query, they compile to subqueries:
+# any of:  WHERE id IN (SELECT recipe_id ... WHERE tag_id IN (...))
+# none of: WHERE NOT (id IN (SELECT recipe_id ... WHERE tag_id IN (...)))
+# all of:  WHERE id IN (SELECT recipe_id ... WHERE tag_id IN (...)
+#                       GROUP BY recipe_id HAVING COUNT(tag_id) = n)
+# so every recipe is returned at most once
+# postgres runs IN (subquery) as a semi join, ie. like EXISTS.
+# Exists() itself can only be filtered on through an annotation in
+# django 2.1 (WHERE EXISTS(...) = true), which postgres can't turn
+# into a semi join and runs once per recipe instead
+
+
+def params_to_ints(qs):
+    """Convert a comma separated string of IDs to a set of integers"""
+    # our_string = '1,2,3' => {1, 2, 3}
+    try:
+        return {int(str_id) for str_id in qs.split(",")}
+    except ValueError:
+        raise ValidationError(f"Invalid list of ids: '{qs}'")
+
+
+def params_to_bool(query_params, param):
+    """Return the 0/1 flag of a query param, False when not given"""
+    # ?with_counts=1 => True
+    value = query_params.get(param, "")
+    try:
+        return bool(int(value or 0))
+    except ValueError:
+        raise ValidationError(
+            {param: [f"Invalid flag: '{value}', use 0 or 1."]}
+        )
+
+
+def params_to_names(query_params, param, choices):
+    """Return the set of names of a comma separated param, or None"""
+    # ?fields=id,title => {"id", "title"}
+    value = query_params.get(param, "")
+    if not value:
+        return None
+    names = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = names - set(choices)
+    if unknown:
+        raise ValidationError(
+            {
+                param: [
+                    f"Unknown names: {', '.join(sorted(unknown))}. "
+                    f"Choose from: {', '.join(choices)}."
+                ]
+            }
+        )
+    return names
+
+
+class RelationFilter:
+    """Set-semantics filter on one many to many field of a recipe"""
+
+    def __init__(self, field_name):
+        # eg. "tags"
+        self.field_name = field_name
+        field = Recipe._meta.get_field(field_name)
+        # the auto created model for the join table
+        # eg. core_recipe_tags (id, recipe_id, tag_id)
+        self.through = field.remote_field.through
+        # names of the foreign keys of the through model
+        # eg. "recipe" and "tag"
+        self.source_name = field.m2m_field_name()
+        self.target_name = field.m2m_reverse_field_name()
+
+    def _links(self, ids):
+        """Return the through rows linking a recipe to any of the ids"""
+        return self.through.objects.filter(
+            **{f"{self.target_name}__in": ids}
+        )
+
+    def any_of(self, queryset, ids):
+        """Keep the recipes linked to at least one of the ids"""
+        return queryset.filter(
+            pk__in=self._links(ids).values(self.source_name)
+        )
+
+    def none_of(self, queryset, ids):
+        """Keep the recipes linked to none of the ids"""
+        return queryset.exclude(
+            pk__in=self._links(ids).values(self.source_name)
+        )
+
+    def all_of(self, queryset, ids):
+        """Keep the recipes linked to every one of the ids"""
+        # one row per (recipe, target) pair thanks to the unique
+        # constraint of the through table, so a recipe linked to all
+        # of them has exactly len(ids) rows
+        recipe_ids = (
+            self._links(ids)
+            .values(self.source_name)
+            .annotate(matches=Count(self.target_name))
+            .filter(matches=len(ids))
+            .values(self.source_name)
+        )
+        return queryset.filter(pk__in=recipe_ids)
+
+    def filter(self, queryset, any_of=None, all_of=None, none_of=None):
+        """Apply each of the given modes to the queryset"""
+        if any_of:
+            queryset = self.any_of(queryset, any_of)
+        if all_of:
+            queryset = self.all_of(queryset, all_of)
+        if none_of:
+            queryset = self.none_of(queryset, none_of)
+        return queryset
+
+
+RELATION_FILTERS = (RelationFilter("tags"), RelationFilter("ingredients"))
+
+
+# the other way around, the tags (or ingredients) used by the recipes
+# eg. ?assigned_only=1 on the tag list
+# filter(recipe__isnull=False) joins the through table, which returns a
+# tag once per recipe using it, and DISTINCT then has to sort all these
+# rows away: the cost grows with the number of recipes of each tag.
+# EXISTS stops at the first through row instead, a single probe of the
+# (tag_id, recipe_id) index of core.0007 per tag, however many recipes
+# use it. django 2.1 only filters on Exists() through an annotation,
+# which postgres runs once per row: here the rows are the tags of one
+# user, which is what the probe needs anyway
+# the views now read the stored recipe_count instead (see core.counts),
+# this stays as the reference the counter is benchmarked against
+
+
+def filter_assigned(queryset, field_name):
+    """Keep the tags or ingredients used by at least one recipe"""
+    # field_name: the m2m field of the recipes, eg. "tags"
+    field = Recipe._meta.get_field(field_name)
+    links = field.remote_field.through.objects.filter(
+        **{field.m2m_reverse_field_name(): OuterRef("pk")}
+    )
+    return queryset.annotate(assigned=Exists(links)).filter(assigned=True)
+
+
+# fields of the recipes that can be filtered on a range and sorted by
+# each has an index on (user, field, id), so whatever the combination
+# the database reads a range of one index instead of every recipe
+# the values are validated with the serializer field of the same type
+RANGE_FIELDS = {
+    "time_minutes": serializers.IntegerField(min_value=0),
+    "price": serializers.DecimalField(max_digits=5, decimal_places=2),
+    "title": serializers.CharField(max_length=255),
+}
+ORDERING_PARAM = "ordering"
+DEFAULT_ORDERING = ("-id",)
+
+# the same for the tags and ingredients, sorted by name (unique per
+# user) or by popularity, each with an index on (user, field, id)
+# ?ordering=-recipe_count   the most used first
+ATTR_ORDERING_FIELDS = {
+    "recipe_count": serializers.IntegerField(min_value=0),
+}
+ATTR_UNIQUE_FIELDS = ("name",)
+DEFAULT_ATTR_ORDERING = ("-name",)
+
+
+def _param_value(query_params, param, field):
+    """Return the validated value of a range param"""
+    try:
+        return field.run_validation(query_params[param])
+    except serializers.ValidationError as exc:
+        raise ValidationError({param: exc.detail})
+
+
+def filter_ranges(queryset, query_params):
+    """Keep the recipes within the ranges of the query params"""
+    # ?time_minutes_max=30           ready in 30 minutes or less
+    # ?price_min=5&price_max=10.50   bounds are included
+    # ?title_min=A&title_max=C       same for the titles
+    for name, field in RANGE_FIELDS.items():
+        for suffix, lookup in (("min", "gte"), ("max", "lte")):
+            param = f"{name}_{suffix}"
+            if query_params.get(param):
+                value = _param_value(query_params, param, field)
+                queryset = queryset.filter(**{f"{name}__{lookup}": value})
+    return queryset
+
+
+def get_ordering(
+    query_params,
+    default=DEFAULT_ORDERING,
+    fields=RANGE_FIELDS,
+    unique=("id",),
+):
+    """Return the ordering of the recipes asked for in the query params"""
+    # ?ordering=price      cheapest first
+    # ?ordering=-price     most expensive first
+    # the id, in the same direction, makes the ordering unique so the
+    # cursor pagination can resume exactly after the last recipe
+    # fields: the other ones allowed, unique: the ones needing no id
+    value = query_params.get(ORDERING_PARAM, "").strip()
+    if not value:
+        return default
+    name = value.lstrip("-")
+    if name in unique and value.count("-") <= 1:
+        return (value,)
+    if name not in fields or value.count("-") > 1:
+        choices = ", ".join([*unique, *fields])
+        raise ValidationError(
+            {ORDERING_PARAM: [f"Invalid ordering, choose from: {choices}."]}
+        )
+    return (value, "-id" if value.startswith("-") else "id")
+
+
+def filter_after(queryset, ordering, value, pk, reverse=False):
+    """Keep the rows after (value, pk) in the given ordering"""
+    # the keyset of a (field, id) ordering, ie. for ?ordering=price:
+    # WHERE price >= value AND (price > value OR id > pk)
+    # the first condition alone is a range of the (user, price, id)
+    # index, the second skips the few recipes at the same price
+    field = ordering[0].lstrip("-")
+    if reverse != ordering[0].startswith("-"):
+        lookup = "lt"
+    else:
+        lookup = "gt"
+    return queryset.filter(
+        Q(**{f"{field}__{lookup}e": value}),
+        Q(**{f"{field}__{lookup}": value}) | Q(**{f"id__{lookup}": pk}),
+    )
+
+
+def filter_recipes(queryset, query_params):
+    """Filter recipes by the tag and ingredient ids in the query params"""
+    # ?tags=1,2          recipes with tag 1 or tag 2
+    # ?tags_all=1,2      recipes with both tag 1 and tag 2
+    # ?tags_none=1,2     recipes with neither tag 1 nor tag 2
+    # same for ingredients, ingredients_all and ingredients_none
+    # and the ranges of filter_ranges()
+    for relation_filter in RELATION_FILTERS:
+        name = relation_filter.field_name
+        modes = {}
+        for mode, param in (
+            ("any_of", name),
+            ("all_of", f"{name}_all"),
+            ("none_of", f"{name}_none"),
+        ):
+            value = query_params.get(param)
+            if value:
+                modes[mode] = params_to_ints(value)
+        queryset = relation_filter.filter(queryset, **modes)
+
+    return filter_ranges(queryset, query_params)
@@ -0,0 +1,246 @@
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+
+from PIL import Image
+
+from core.blobs import release, store
+from core.models import Recipe, RecipeImageVariant
+
+from recipe.cache import bump_user_version
+
+# the upload request only stores the file and returns straight away
+# (with image_status "processing"), the resizing happens afterwards
+# in a pool of background threads:
+# - the image is decoded once, turned the right way up and its
+#   metadata (eg. the gps position of phone photos) is dropped
+# - the original is stored again without the metadata
+# - every size of settings.RECIPE_IMAGE_SIZES is made from the
+#   previous, larger, one and saved in every format
+# - the copies are recorded as RecipeImageVariant rows and the
+#   recipe is marked "ready" (or "failed")
+# the files are content addressed (see core.blobs), the same image
+# uploaded twice gives the same copies, which are stored only once
+# pillow releases the gil while decoding, resizing and encoding,
+# so threads are enough to keep the work off the request workers
+
+logger = logging.getLogger(__name__)
+
+# exif tag telling how the camera was held
+ORIENTATION_TAG = 0x0112
+# same mapping as PIL.ImageOps.exif_transpose (pillow >= 6)
+ORIENTATION_TRANSPOSE = {
+    2: Image.FLIP_LEFT_RIGHT,
+    3: Image.ROTATE_180,
+    4: Image.FLIP_TOP_BOTTOM,
+    5: Image.TRANSPOSE,
+    6: Image.ROTATE_270,
+    7: Image.TRANSVERSE,
+    8: Image.ROTATE_90,
+}
+
+# errors pillow raises for files it can't read
+DECODE_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the pool of threads processing the images"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix="recipe-image",
+            )
+    return _executor
+
+
+def _formats():
+    """Return the configured formats pillow is able to write"""
+    Image.init()
+    return [
+        fmt
+        for fmt in settings.RECIPE_IMAGE_FORMATS
+        if fmt.upper() in Image.SAVE
+    ]
+
+
+def _orientation(image):
+    try:
+        # only jpeg files have _getexif()
+        exif = image._getexif() or {}
+    except (AttributeError, *DECODE_ERRORS):
+        return None
+    return exif.get(ORIENTATION_TAG)
+
+
+def decode(fileobj):
+    """Read an image the right way up and without its metadata"""
+    image = Image.open(fileobj)
+    # open() only reads the header, load() decodes the pixels
+    image.load()
+    source_format = image.format
+
+    method = ORIENTATION_TRANSPOSE.get(_orientation(image))
+    if method is not None:
+        image = image.transpose(method)
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = "A" in image.mode or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    # exif, icc profile, comments... are kept in info
+    # and written back by save() for some formats
+    image.info = {}
+    return image, source_format
+
+
+def encode(image, fmt):
+    """Return the bytes of the image in the given format"""
+    if fmt == "jpeg" and image.mode == "RGBA":
+        # jpeg has no transparency, use a white background
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[3])
+        image = background
+
+    buffer = io.BytesIO()
+    image.save(
+        buffer, format=fmt.upper(), quality=settings.RECIPE_IMAGE_QUALITY
+    )
+    return buffer.getvalue()
+
+
+def resize(image):
+    """Yield (name, image) for every size, largest first"""
+    sizes = sorted(
+        settings.RECIPE_IMAGE_SIZES.items(), key=lambda item: -item[1]
+    )
+    # each size is made from the previous one, so the full size
+    # image is only resized once and only one copy is kept in memory
+    image = image.copy()
+    for name, size in sizes:
+        # thumbnail() keeps the aspect ratio and never enlarges
+        image.thumbnail((size, size), Image.LANCZOS)
+        yield name, image
+
+
+def _strip_original(recipe, image, source_format):
+    """Store the original image without its metadata, return its path"""
+    if not source_format or source_format not in Image.SAVE:
+        return store(recipe.image.file, recipe.image.name)
+    content = ContentFile(encode(image, source_format.lower()))
+    return store(content, recipe.image.name)
+
+
+def make_variants(recipe):
+    """Decode the image of the recipe and store all its copies"""
+    with recipe.image.open("rb") as fileobj:
+        image, source_format = decode(fileobj)
+
+        original = _strip_original(recipe, image, source_format)
+
+    variants = []
+    formats = _formats()
+    for name, resized in resize(image):
+        for fmt in formats:
+            content = ContentFile(encode(resized, fmt))
+            variants.append(
+                RecipeImageVariant(
+                    recipe=recipe,
+                    name=name,
+                    format=fmt,
+                    width=resized.width,
+                    height=resized.height,
+                    file=store(content, f"{name}.{fmt}"),
+                )
+            )
+    return original, variants
+
+
+def delete_variants(variants):
+    """Delete the variants, recipe.signals releases their files"""
+    # queryset.delete() sends post_delete for every variant
+    variants.delete()
+
+
+def set_image(recipe, content, filename):
+    """Replace the image of a recipe and start processing it"""
+    previous = recipe.image.name
+    delete_variants(recipe.image_variants.all())
+    recipe.image = store(content, filename)
+    recipe.image_status = Recipe.IMAGE_PROCESSING
+    recipe.save(update_fields=["image", "image_status"])
+    if previous:
+        release(previous)
+    schedule_processing(recipe)
+    return recipe
+
+
+def process_image(recipe_id, name):
+    """Make the resized copies of the image of a recipe"""
+    # the image may have been replaced while the task was queued
+    recipe = Recipe.objects.filter(id=recipe_id, image=name).first()
+    if recipe is None:
+        return
+
+    try:
+        original, variants = make_variants(recipe)
+    except DECODE_ERRORS:
+        logger.exception("Could not process the image %s", name)
+        Recipe.objects.filter(id=recipe_id, image=name).update(
+            image_status=Recipe.IMAGE_FAILED
+        )
+        bump_user_version(recipe.user_id)
+        return
+
+    with transaction.atomic():
+        # lock the recipe so a new upload can't slip in between
+        current = (
+            Recipe.objects.select_for_update()
+            .filter(id=recipe_id, image=name)
+            .exists()
+        )
+        if current:
+            delete_variants(recipe.image_variants.all())
+            RecipeImageVariant.objects.bulk_create(variants)
+            # the stripped original replaces the uploaded file
+            Recipe.objects.filter(id=recipe_id).update(
+                image=original, image_status=Recipe.IMAGE_READY
+            )
+            release(name)
+        else:
+            # the references taken by store()
+            for stored in [original] + [v.file.name for v in variants]:
+                release(stored)
+    if not current:
+        return
+
+    # update() doesn't send post_save
+    bump_user_version(recipe.user_id)
+
+
+def _run(recipe_id, name):
+    try:
+        process_image(recipe_id, name)
+    except Exception:
+        # nothing would report the error of a background thread
+        logger.exception("Processing the image %s failed", name)
+    finally:
+        # every thread has its own database connection
+        connections.close_all()
+
+
+def schedule_processing(recipe):
+    """Process the image of the recipe once the upload is committed"""
+    name = recipe.image.name
+    # the worker must see the new image, so wait for the commit
+    transaction.on_commit(
+        lambda: get_executor().submit(_run, recipe.id, name)
+    )
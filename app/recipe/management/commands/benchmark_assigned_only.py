@@ -0,0 +1,112 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from core.counts import recipe_count
+from core.models import Recipe, Tag
+from core.seed import analyze, seed_user
+
+from recipe.filters import filter_assigned
+
+
+class Command(BaseCommand):
+    """Django command to compare the assigned_only tag queries"""
+
+    help = (
+        "Seed users with the same number of tags and more and more "
+        "recipes, and time ?assigned_only=1, ?with_counts=1 and "
+        "?ordering=-recipe_count of the tag list, read from the stored "
+        "counter, against the querysets counting the through rows. The "
+        "data is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--recipes",
+            type=int,
+            nargs="+",
+            default=[1000, 10000, 50000],
+            help="The number of recipes of each user.",
+        )
+        parser.add_argument("--tags", type=int, default=50)
+        parser.add_argument("--per-recipe", type=int, default=5)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with transaction.atomic():
+            self.stdout.write("Seeding data...")
+            users = [
+                seed_user(
+                    recipes=recipes,
+                    tags=options["tags"],
+                    ingredients=options["tags"],
+                    per_recipe=options["per_recipe"],
+                    rng=rng,
+                )
+                for recipes in options["recipes"]
+            ]
+            analyze()
+
+            for recipes, user in zip(options["recipes"], users):
+                fan_out = recipes * options["per_recipe"] // options["tags"]
+                self.stdout.write(
+                    self.style.MIGRATE_HEADING(
+                        f"{recipes} recipes, ~{fan_out} per tag"
+                    )
+                )
+                for label, queryset in self._cases(user):
+                    self.stdout.write(
+                        self._time(label, queryset, options["repeat"])
+                    )
+
+            # never keep the benchmark data
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("Done!"))
+
+    def _cases(self, user):
+        """Return the querysets to compare for the tags of the user"""
+        tags = Tag.objects.filter(user=user).order_by("-name")
+        joined = tags.filter(recipe__isnull=False)
+        assigned = filter_assigned(tags, "tags")
+        counted = assigned.annotate(
+            count=recipe_count(Recipe._meta.get_field("tags"))
+        )
+        stored = tags.filter(recipe_count__gt=0)
+        return (
+            ("assigned (join + distinct)", joined.distinct()),
+            ("assigned (exists)", assigned),
+            ("assigned (counter)", stored),
+            (
+                "counts (join + group by)",
+                joined.annotate(count=Count("recipe")),
+            ),
+            ("counts (exists + subquery)", counted),
+            ("counts (counter)", stored.values_list("id", "recipe_count")),
+            (
+                "popular (subquery)",
+                counted.order_by("-count", "-id")[:20],
+            ),
+            (
+                "popular (counter)",
+                stored.order_by("-recipe_count", "-id")[:20],
+            ),
+        )
+
+    def _time(self, label, queryset, repeat):
+        """Run the queryset a few times and return a report line"""
+        # values_list() so we time the database, not the models
+        if queryset._fields is None:
+            columns = ["id", *queryset.query.annotation_select]
+            queryset = queryset.values_list(*columns)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = len(queryset.all())
+            timings.append(time.perf_counter() - start)
+        best = min(timings) * 1000
+        return f"{label:<28} {rows:>8} rows {best:>10.1f} ms"
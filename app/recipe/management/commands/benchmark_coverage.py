@@ -0,0 +1,80 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.seed import analyze, seed_user
+
+from recipe.coverage import build_index, coverage_sql
+
+
+class Command(BaseCommand):
+    """Django command to compare the ingredient index with sql"""
+
+    help = (
+        "Seed a lot of recipes and time the coverage queries of the "
+        "in memory ingredient index against the equivalent aggregate "
+        "query. The data is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recipes", type=int, default=50000)
+        parser.add_argument("--ingredients", type=int, default=500)
+        parser.add_argument("--per-recipe", type=int, default=8)
+        parser.add_argument("--have", type=int, default=20)
+        parser.add_argument("--max-missing", type=int, default=6)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with transaction.atomic():
+            self.stdout.write("Seeding data...")
+            user = seed_user(
+                recipes=options["recipes"],
+                tags=10,
+                ingredients=options["ingredients"],
+                per_recipe=options["per_recipe"],
+                rng=rng,
+            )
+            analyze()
+            ingredient_ids = rng.sample(
+                list(user.ingredient_set.values_list("id", flat=True)),
+                options["have"],
+            )
+            max_missing = options["max_missing"]
+
+            start = time.perf_counter()
+            index = build_index(user.id)
+            built = (time.perf_counter() - start) * 1000
+            self.stdout.write(f"{'build index':<28} {built:>24.1f} ms")
+
+            cases = (
+                (
+                    "sql (count + having)",
+                    lambda: list(
+                        coverage_sql(user.id, ingredient_ids, max_missing)
+                    ),
+                ),
+                (
+                    "index (posting lists)",
+                    lambda: index.coverage(ingredient_ids, max_missing),
+                ),
+            )
+            for label, run in cases:
+                self.stdout.write(self._time(label, run, options["repeat"]))
+
+            # never keep the benchmark data
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("Done!"))
+
+    def _time(self, label, run, repeat):
+        """Run the query a few times and return a report line"""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = len(run())
+            timings.append(time.perf_counter() - start)
+        best = min(timings) * 1000
+        return f"{label:<28} {rows:>8} rows {best:>10.1f} ms"
@@ -0,0 +1,85 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Recipe
+from core.seed import analyze, seed_user
+
+from recipe.filters import RelationFilter
+
+
+class Command(BaseCommand):
+    """Django command to compare the recipe filters with m2m joins"""
+
+    help = (
+        "Seed a lot of recipes and time the tag filters of the recipe "
+        "api against the equivalent join based querysets. The data is "
+        "rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recipes", type=int, default=50000)
+        parser.add_argument("--tags", type=int, default=20)
+        parser.add_argument("--per-recipe", type=int, default=5)
+        parser.add_argument("--filter-size", type=int, default=3)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with transaction.atomic():
+            self.stdout.write("Seeding data...")
+            user = seed_user(
+                recipes=options["recipes"],
+                tags=options["tags"],
+                ingredients=options["tags"],
+                per_recipe=options["per_recipe"],
+                rng=rng,
+            )
+            analyze()
+            tag_ids = set(
+                user.tag_set.values_list("id", flat=True)[
+                    : options["filter_size"]
+                ]
+            )
+            recipes = Recipe.objects.filter(user=user)
+            tags = RelationFilter("tags")
+
+            # the chained filters run one join per tag
+            all_of_join = recipes
+            for tag_id in tag_ids:
+                all_of_join = all_of_join.filter(tags__id=tag_id)
+
+            cases = (
+                ("any of (join)", recipes.filter(tags__id__in=tag_ids)),
+                (
+                    "any of (join + distinct)",
+                    recipes.filter(tags__id__in=tag_ids).distinct(),
+                ),
+                ("any of (semi join)", tags.any_of(recipes, tag_ids)),
+                ("all of (join per tag)", all_of_join),
+                ("all of (group by)", tags.all_of(recipes, tag_ids)),
+                ("none of (exclude)", recipes.exclude(tags__id__in=tag_ids)),
+                ("none of (anti join)", tags.none_of(recipes, tag_ids)),
+            )
+            for label, queryset in cases:
+                self.stdout.write(
+                    self._time(label, queryset, options["repeat"])
+                )
+
+            # never keep the benchmark data
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("Done!"))
+
+    def _time(self, label, queryset, repeat):
+        """Run the queryset a few times and return a report line"""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            # values_list() so we time the database, not the models
+            rows = len(queryset.values_list("id", flat=True))
+            timings.append(time.perf_counter() - start)
+        best = min(timings) * 1000
+        return f"{label:<28} {rows:>8} rows {best:>10.1f} ms"
@@ -0,0 +1,107 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Tag, Ingredient, Recipe
+from core.seed import seed_user
+
+from recipe.readers import ValuesReader
+from recipe.renderers import FastJSONRenderer
+from recipe.serializers import RecipeSerializer, TagSerializer
+
+
+class Command(BaseCommand):
+    """Django command to compare the serializers with the fast reads"""
+
+    help = (
+        "Seed recipes and time the list serializers against the "
+        "values() readers of recipe.readers, and JSONRenderer against "
+        "FastJSONRenderer. The data is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000)
+        parser.add_argument("--per-recipe", type=int, default=5)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        with transaction.atomic():
+            self.stdout.write("Seeding data...")
+            user = seed_user(
+                recipes=rows,
+                tags=rows,
+                ingredients=50,
+                per_recipe=options["per_recipe"],
+                rng=random.Random(0),
+            )
+            recipes = (
+                Recipe.objects.filter(user=user)
+                .order_by("-id")
+                .prefetch_related(
+                    Prefetch(
+                        "tags", queryset=Tag.objects.only("id").order_by("id")
+                    ),
+                    Prefetch(
+                        "ingredients",
+                        queryset=Ingredient.objects.only("id").order_by("id"),
+                    ),
+                )
+            )
+            tags = Tag.objects.filter(user=user).order_by("-name")
+
+            for label, serializer_class, queryset in (
+                ("recipes", RecipeSerializer, recipes),
+                ("tags", TagSerializer, tags),
+            ):
+                reader = ValuesReader(serializer_class(context={}))
+                cases = (
+                    (
+                        "serializer",
+                        lambda: serializer_class(
+                            queryset.all(), many=True, context={}
+                        ).data,
+                    ),
+                    ("values reader", lambda: reader.read(reader.values(
+                        queryset.all()
+                    ))),
+                )
+                for name, run in cases:
+                    self.stdout.write(
+                        self._time(f"{label} {name}", run, rows, options)
+                    )
+
+            data = RecipeSerializer(recipes.all(), many=True).data
+            for name, renderer in (
+                ("JSONRenderer", JSONRenderer()),
+                ("FastJSONRenderer", FastJSONRenderer()),
+            ):
+                self.stdout.write(
+                    self._time(
+                        f"render {name}",
+                        lambda: renderer.render(data),
+                        rows,
+                        options,
+                    )
+                )
+
+            # never keep the benchmark data
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("Done!"))
+
+    def _time(self, label, run, rows, options):
+        """Run a few times and return a report line with the time per row"""
+        timings = []
+        for _ in range(options["repeat"]):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        per_row = best / rows * 1000000
+        return f"{label:<28} {best * 1000:>10.1f} ms {per_row:>8.1f} us/row"
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import ImageUpload
+
+from recipe.uploads import discard
+
+
+class Command(BaseCommand):
+    """Django command to delete the abandoned image uploads"""
+
+    help = (
+        "Delete the resumable image uploads started more than "
+        "RECIPE_IMAGE_UPLOAD_EXPIRY seconds ago and their files."
+    )
+
+    def handle(self, *args, **options):
+        expiry = timedelta(seconds=settings.RECIPE_IMAGE_UPLOAD_EXPIRY)
+        expired = ImageUpload.objects.filter(
+            created__lt=timezone.now() - expiry
+        )
+        count = 0
+        for upload in expired.iterator():
+            discard(upload)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"{count} uploads deleted"))
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Tombstone
+
+
+class Command(BaseCommand):
+    """Django command to delete the tombstones no sync needs anymore"""
+
+    help = (
+        "Delete the tombstones older than RECIPE_SYNC_TOMBSTONE_DAYS "
+        "and the ones of deleted users."
+    )
+
+    def handle(self, *args, **options):
+        # clients syncing from before get everything anyway
+        horizon = timezone.now() - timedelta(
+            days=settings.RECIPE_SYNC_TOMBSTONE_DAYS
+        )
+        count, _ = Tombstone.objects.filter(deleted_at__lt=horizon).delete()
+        users = get_user_model().objects.all()
+        orphans, _ = Tombstone.objects.exclude(user__in=users).delete()
+        self.stdout.write(
+            self.style.SUCCESS(f"{count + orphans} tombstones deleted")
+        )
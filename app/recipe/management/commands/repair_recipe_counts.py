@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from core.counts import find_wrong_counts, repair
+from core.models import Recipe
+
+from recipe.cache import bump_user_version
+
+
+class Command(BaseCommand):
+    """Django command to fix the recipe_count of tags and ingredients"""
+
+    help = (
+        "Count the recipes of every tag and ingredient again and fix the "
+        "stored recipe_count where it differs, eg. after through rows "
+        "were written without signals (raw SQL, bulk_create())."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the wrong ones.",
+        )
+
+    def handle(self, *args, **options):
+        for name in ("tags", "ingredients"):
+            field = Recipe._meta.get_field(name)
+            model = field.related_model
+            if options["dry_run"]:
+                wrong = find_wrong_counts(model, field)
+            else:
+                wrong = repair(model, field)
+                # the cached lists show the counts with ?with_counts=1
+                for user_id in set(wrong.values()):
+                    bump_user_version(user_id)
+            self.stdout.write(f"{name}: {len(wrong)} wrong counts")
+
+        self.stdout.write(self.style.SUCCESS("Done!"))
@@ -0,0 +1,144 @@
+from collections import OrderedDict
+
+from django.conf import settings
+
+from rest_framework.pagination import CursorPagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+
+from recipe.filters import (
+    ATTR_ORDERING_FIELDS,
+    ATTR_UNIQUE_FIELDS,
+    DEFAULT_ATTR_ORDERING,
+    DEFAULT_ORDERING,
+    RANGE_FIELDS,
+    filter_after,
+    get_ordering,
+    params_to_bool,
+)
+
+# https://www.django-rest-framework.org/api-guide/pagination/#cursorpagination
+# cursor (keyset) pagination filters on the position of the last item
+# eg. WHERE name < 'Lunch' ORDER BY name DESC LIMIT 100
+# instead of OFFSET, so the database never has to walk through
+# the skipped rows and a page deep in the list costs the same as page 1
+
+
+class BaseCursorPagination(CursorPagination):
+    """Cursor pagination for the recipe api list endpoints"""
+
+    page_size = settings.RECIPE_API_PAGE_SIZE
+    # client can ask for smaller/bigger pages eg. ?page_size=20
+    page_size_query_param = "page_size"
+    max_page_size = settings.RECIPE_API_MAX_PAGE_SIZE
+    # ?unpaginated=1 returns the plain list like before pagination
+    # was added, for clients that still expect that shape
+    unpaginated_query_param = "unpaginated"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Paginate the queryset unless the client opted out"""
+        unpaginated = params_to_bool(
+            request.query_params, self.unpaginated_query_param
+        )
+        if unpaginated:
+            # returning None makes the viewset serialize the whole queryset
+            return None
+
+        return super().paginate_queryset(queryset, request, view)
+
+
+class KeysetPagination(BaseCursorPagination):
+    """Paginate in the ?ordering= asked for, by (field, id) keysets"""
+
+    # drf filters on the first field of the ordering only and counts
+    # the rows to skip with the same value, eg. OFFSET 1000 when
+    # a thousand recipes take 10 minutes. for (field, id) orderings
+    # the cursor holds both values instead, see filter_after()
+
+    # the default ordering, and the arguments of filters.get_ordering()
+    ordering = DEFAULT_ORDERING
+    ordering_fields = RANGE_FIELDS
+    unique_fields = ("id",)
+
+    def get_ordering(self, request, queryset, view):
+        return get_ordering(
+            request.query_params,
+            self.ordering,
+            self.ordering_fields,
+            self.unique_fields,
+        )
+
+    keyset = None
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if self.keyset is not None:
+            # already applied by paginate_queryset()
+            return cursor._replace(position=None)
+        return cursor
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        ordering = self.get_ordering(request, queryset, view)
+        cursor = self.decode_cursor(request)
+        if len(ordering) > 1 and cursor and cursor.position is not None:
+            value, _, pk = cursor.position.rpartition("|")
+            field = self.ordering_fields[ordering[0].lstrip("-")]
+            try:
+                value = field.to_internal_value(value)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            if not pk.isdigit():
+                raise NotFound(self.invalid_cursor_message)
+            queryset = filter_after(
+                queryset, ordering, value, int(pk), cursor.reverse
+            )
+            self.keyset = cursor
+
+        page = super().paginate_queryset(queryset, request, view)
+        if self.keyset is not None:
+            # super() didn't see the position, it leads to the other page
+            self.cursor = cursor
+            if cursor.reverse:
+                self.has_next, self.next_position = True, cursor.position
+            else:
+                self.has_previous = True
+                self.previous_position = cursor.position
+            self.display_page_controls = True
+        return page
+
+    def _get_position_from_instance(self, instance, ordering):
+        position = super()._get_position_from_instance(instance, ordering)
+        if len(ordering) > 1:
+            # the fast list path reads values() rows, see recipe.readers
+            pk = instance["id"] if isinstance(instance, dict) else instance.pk
+            return f"{position}|{pk}"
+        return position
+
+
+class RecipeAttrPagination(KeysetPagination):
+    """Paginate tags and ingredients by name or by popularity"""
+
+    ordering = DEFAULT_ATTR_ORDERING
+    ordering_fields = ATTR_ORDERING_FIELDS
+    unique_fields = ATTR_UNIQUE_FIELDS
+
+
+class RecipePagination(KeysetPagination):
+    """Paginate recipes, newest first or in the ?ordering= asked for"""
+
+
+class SearchPagination(BaseCursorPagination):
+    """Best matches of a search, in a single page"""
+
+    # the rank is neither unique nor stable, there is no cursor to the
+    # next page, the client asks for more results with ?page_size=
+    page_size = settings.RECIPE_SEARCH_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return list(queryset[: self.get_page_size(request)])
+
+    def get_paginated_response(self, data):
+        # same shape as the other pages
+        page = [("next", None), ("previous", None), ("results", data)]
+        return Response(OrderedDict(page))
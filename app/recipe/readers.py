@@ -0,0 +1,161 @@
+from collections import defaultdict
+
+from django.conf import settings
+
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+
+from recipe.renderers import FastJSONRenderer
+
+# fast read path of the list endpoints
+# a ModelSerializer builds every object of the list field by field:
+# get_attribute(), to_representation(), SkipField checks, the related
+# managers of the m2m fields... most of the time of a list goes there.
+# ValuesReader outputs the same data from values() rows instead:
+# - the fields are looked at once, each becomes a function of the
+#   column value, most of them returning it as is
+# - the ids of the m2m fields come from their through table, one query
+#   per relation for the whole page, without joining the related table
+# only plain model fields and primary key relations are supported,
+# any other field (eg. nested serializers) falls back to the serializer
+
+# fields whose to_representation() returns the database value unchanged
+# eg. IntegerField: int(value), CharField: str(value)
+IDENTITY_FIELDS = (serializers.IntegerField, serializers.CharField)
+SUPPORTED_FIELDS = IDENTITY_FIELDS + (serializers.DecimalField,)
+
+
+def _extractor(field):
+    """Return the function turning a column value into the output"""
+    if isinstance(field, IDENTITY_FIELDS):
+        return None
+    to_representation = field.to_representation
+
+    def extract(value):
+        # like Serializer.to_representation(), None stays None
+        return None if value is None else to_representation(value)
+
+    return extract
+
+
+class ValuesReader:
+    """Read only version of a ModelSerializer working on values() rows"""
+
+    def __init__(self, serializer):
+        self.model = serializer.Meta.model
+        # [(name, extractor)] for the columns, in the output order
+        self.fields = []
+        # {name: (through model, source column, target column)}
+        self.relations = {}
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                # never output
+                continue
+            if isinstance(field, ManyRelatedField):
+                model_field = self.model._meta.get_field(field.source)
+                self.relations[name] = (
+                    model_field.remote_field.through,
+                    model_field.m2m_column_name(),
+                    model_field.m2m_reverse_name(),
+                )
+                self.fields.append((name, None))
+            else:
+                self.fields.append((name, _extractor(field)))
+        # the relations are looked up by the id of the row
+        self.columns = [
+            name for name, _ in self.fields if name not in self.relations
+        ]
+        if self.relations and "id" not in self.columns:
+            self.columns.append("id")
+
+    @classmethod
+    def supports(cls, serializer):
+        """Tell whether every field of the serializer can be read fast"""
+        model = serializer.Meta.model
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if field.source != name:
+                return False
+            if isinstance(field, ManyRelatedField):
+                child = field.child_relation
+                supported = (
+                    isinstance(child, PrimaryKeyRelatedField)
+                    and child.pk_field is None
+                )
+            else:
+                supported = isinstance(field, SUPPORTED_FIELDS) and any(
+                    model_field.name == name and model_field.concrete
+                    for model_field in model._meta.get_fields()
+                )
+            if not supported:
+                return False
+        return True
+
+    def values(self, queryset):
+        """Return the rows of the queryset with the columns needed"""
+        # the ordering columns too, the cursor pagination reads them
+        ordering = [name.lstrip("-") for name in queryset.query.order_by]
+        columns = list(dict.fromkeys(self.columns + ordering))
+        return queryset.prefetch_related(None).values(*columns)
+
+    def _related_ids(self, rows):
+        """Return {relation name: {row id: [related ids]}}"""
+        ids = [row["id"] for row in rows]
+        related = {}
+        for name, (through, source, target) in self.relations.items():
+            related[name] = defaultdict(list)
+            links = (
+                through.objects.filter(**{f"{source}__in": ids})
+                .order_by(target)
+                .values_list(source, target)
+            )
+            for source_id, target_id in links:
+                related[name][source_id].append(target_id)
+        return related
+
+    def read(self, rows):
+        """Return the output of the serializer for the rows"""
+        rows = list(rows)
+        related = self._related_ids(rows) if self.relations and rows else {}
+        data = []
+        for row in rows:
+            item = {}
+            for name, extract in self.fields:
+                if name in related:
+                    item[name] = related[name].get(row["id"], [])
+                elif extract is None:
+                    item[name] = row[name]
+                else:
+                    item[name] = extract(row[name])
+            data.append(item)
+        return data
+
+
+class FastListMixin:
+    """List the objects with a ValuesReader when the serializer allows"""
+
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
+
+    def get_reader(self):
+        """Return the ValuesReader of the list, None to use serializers"""
+        if not settings.RECIPE_API_FAST_READS:
+            return None
+        serializer = self.get_serializer()
+        if not ValuesReader.supports(serializer):
+            return None
+        return ValuesReader(serializer)
+
+    def list(self, request, *args, **kwargs):
+        reader = self.get_reader()
+        if reader is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = reader.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(reader.read(page))
+
+        return Response(reader.read(queryset))
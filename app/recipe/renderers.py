@@ -0,0 +1,49 @@
+# several times faster than the json module
+import orjson
+
+from rest_framework.renderers import JSONRenderer
+
+# https://www.django-rest-framework.org/api-guide/renderers/#custom-renderers
+# the same bytes as JSONRenderer, written by orjson
+# JSONRenderer (with the default settings) writes compact json with
+# the unicode characters as is, except U+2028 and U+2029 which are
+# escaped so the output is valid javascript too. orjson writes the
+# same, the two characters are escaped after it the same way.
+# types orjson doesn't know (eg. Decimal, lazy strings, querysets)
+# go through the encoder of drf.
+# floats are written with the shortest repr by both, only very large
+# or very small ones differ in notation eg. 1e+16 and 1e16, and
+# NaN is written as null where drf refuses it
+
+LINE_SEPARATOR = "\u2028".encode()
+PARAGRAPH_SEPARATOR = "\u2029".encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSON renderer using orjson"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            data is None
+            # only the defaults of JSONRenderer are implemented
+            or self.ensure_ascii
+            or not self.compact
+            or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        encoder = self.encoder_class()
+        try:
+            ret = orjson.dumps(
+                data,
+                default=encoder.default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME
+                | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except TypeError:
+            # eg. an int over 64 bits, the json module handles everything
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace(LINE_SEPARATOR, b"\\u2028").replace(
+            PARAGRAPH_SEPARATOR, b"\\u2029"
+        )
@@ -0,0 +1,112 @@
+from django.contrib.postgres.lookups import PostgresSimpleLookup
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.db import connection
+from django.db.models import CharField, Case, FloatField, Q, Value, When
+
+from core.models import Recipe, Tag, Ingredient
+
+# ?search=chicken curry
+# a recipe matches when its title matches the words (full text search,
+# "curries" finds "curry"), when a word of its title looks like the
+# search (trigram similarity, "chiken" finds "chicken") or when one of
+# its tags or ingredients does
+# the matches are ranked by where they matched: title first, then the
+# tags, then the ingredients, newest first for the same rank. ts_rank()
+# would have to compute the vector of every matching recipe again,
+# which takes most of the time when thousands of them match
+# the title conditions use gin indexes (see core migration 0011), the
+# tags and ingredients of a user are few and their recipes are found
+# through the (tag_id, recipe_id) indexes of the through tables
+# without the pg_trgm extension only the full text search is used
+# other databases (sqlite) fall back to case insensitive contains
+
+SEARCH_CONFIG = "english"
+TITLE_WEIGHT = 1.0
+TAG_WEIGHT = 0.4
+INGREDIENT_WEIGHT = 0.2
+
+
+@CharField.register_lookup
+class TrigramWordSimilar(PostgresSimpleLookup):
+    """A word of the field looks like the value (pg_trgm %>)"""
+
+    lookup_name = "trigram_word_similar"
+    operator = "%%>"
+
+
+# {database alias: whether pg_trgm is installed}, looked up once per
+# process rather than on every search
+_trigram = {}
+
+
+def has_trigram():
+    """Tell whether the pg_trgm extension is installed"""
+    if connection.alias not in _trigram:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            )
+            _trigram[connection.alias] = cursor.fetchone() is not None
+    return _trigram[connection.alias]
+
+
+def _conditions(term):
+    """Return the conditions matching a title and a tag/ingredient name"""
+    if connection.vendor != "postgresql":
+        return Q(title__icontains=term), Q(name__icontains=term)
+
+    query = SearchQuery(term, config=SEARCH_CONFIG)
+    title = Q(title_search=query)
+    name = Q(name_search=query)
+    if has_trigram():
+        title |= Q(title__trigram_word_similar=term)
+        name |= Q(name__trigram_word_similar=term)
+    return title, name
+
+
+def _vector(field_name):
+    # the expression of the full text index
+    return SearchVector(field_name, config=SEARCH_CONFIG)
+
+
+def _linked(field_name, model, user, condition):
+    """Return the ids of the recipes with a tag/ingredient matching"""
+    names = (
+        model.objects.filter(user=user)
+        .annotate(name_search=_vector("name"))
+        .filter(condition)
+    )
+    field = Recipe._meta.get_field(field_name)
+    return field.remote_field.through.objects.filter(
+        **{f"{field.m2m_reverse_field_name()}__in": names}
+    ).values(field.m2m_field_name())
+
+
+def _weight(ids, weight):
+    return Case(
+        When(pk__in=ids, then=Value(weight)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def search_recipes(queryset, term, user):
+    """Filter the recipes matching the search, annotated with a rank"""
+    title, name = _conditions(term)
+    titled = (
+        Recipe.objects.filter(user=user)
+        .annotate(title_search=_vector("title"))
+        .filter(title)
+        .values("pk")
+    )
+    tagged = _linked("tags", Tag, user, name)
+    with_ingredient = _linked("ingredients", Ingredient, user, name)
+
+    # a union rather than OR: postgres can't use the indexes for an OR
+    # of subqueries and would compute the vector of every recipe
+    matched = titled.union(tagged, with_ingredient)
+    return queryset.filter(pk__in=matched).annotate(
+        rank=_weight(titled, TITLE_WEIGHT)
+        + _weight(tagged, TAG_WEIGHT)
+        + _weight(with_ingredient, INGREDIENT_WEIGHT)
+    )
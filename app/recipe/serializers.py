@@ -1,6 +1,21 @@
+from django.conf import settings
+from django.db import transaction
+
 from rest_framework import serializers
 
-from core.models import Tag, Ingredient, Recipe
+from core.models import (
+    Tag,
+    Ingredient,
+    Recipe,
+    RecipeImageVariant,
+    ImageUpload,
+)
+
+from recipe.bulk import NAME_TAKEN, get_or_create_named, set_relations
+from recipe.fields import UserPrimaryKeyRelatedField
+from recipe.uploads import received
+
+MAX_SIZE = "Ensure the image has no more than {max_size} bytes."
 
 # serialize: (TM)
 # - translates model into querydict (json representation)
@@ -21,7 +36,65 @@ from core.models import Tag, Ingredient, Recipe
 # implementer or Django eg. user field, created_at, etc
 
 
-class TagSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Output only the fields asked for by the client"""
+
+    # the context may hold, for read requests (see RecipeViewSet):
+    # "fields": the names of the fields to output, all of them if None
+    # "expand": the relations to nest instead of listing their ids
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the fields not asked for are removed before they are bound,
+        # so they cost nothing, not even a query for a relation
+        fields = self.context.get("fields")
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in self.context.get("expand") or ():
+            if name in self.fields and name in self.expandable_fields:
+                serializer_class = self.expandable_fields[name]
+                self.fields[name] = serializer_class(many=True, read_only=True)
+
+
+class UniqueNameMixin:
+    """Refuse the names the request user already has"""
+
+    # the names are unique per user whatever their case in the database,
+    # the user isn't a field of the serializer so drf doesn't add the
+    # validator itself. a batch is checked at once by BulkModelMixin
+    def validate_name(self, value):
+        request = self.context.get("request")
+        if request is None or self.context.get("bulk"):
+            return value
+        model = self.Meta.model
+        queryset = model.objects.filter(user=request.user, name__iexact=value)
+        if self.instance is not None:
+            queryset = queryset.exclude(pk=self.instance.pk)
+        if queryset.exists():
+            raise serializers.ValidationError(
+                NAME_TAKEN.format(model_name=model._meta.verbose_name)
+            )
+        return value
+
+
+class RecipeCountMixin:
+    """Output the number of recipes when the client asked for it"""
+
+    # the context holds "with_counts" for ?with_counts=1 (see the views)
+    # the stored recipe_count, kept up to date by recipe.signals
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.context.get("with_counts"):
+            self.fields["recipe_count"] = serializers.IntegerField(
+                read_only=True
+            )
+
+
+class TagSerializer(
+    RecipeCountMixin, UniqueNameMixin, serializers.ModelSerializer
+):
     """Serializer for tag objects"""
 
     class Meta:
@@ -36,7 +109,9 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ("id",)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(
+    RecipeCountMixin, UniqueNameMixin, serializers.ModelSerializer
+):
     """Serializer for ingredient objects"""
 
     class Meta:
@@ -45,9 +120,15 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ("id",)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serialize a recipe"""
 
+    # ?expand=tags,ingredients
+    expandable_fields = {
+        "tags": TagSerializer,
+        "ingredients": IngredientSerializer,
+    }
+
     # list items with the primary key id
     # https://www.django-rest-framework.org/
     # api-guide/relations/#primarykeyrelatedfield
@@ -74,13 +155,32 @@ class RecipeSerializer(serializers.ModelSerializer):
     # will update by .add(queryset.filter(...))
     # ie. if user input not in the queryset
     # then it is invalid
-    ingredients = serializers.PrimaryKeyRelatedField(
-        many=True, queryset=Ingredient.objects.all()
+    # UserPrimaryKeyRelatedField: only the ingredients of request.user
+    # and a single query for the whole list (see recipe.fields)
+    # not required: a new recipe can be given names only, or nothing
+    # a put still needs the ids or the names, see validate()
+    ingredients = UserPrimaryKeyRelatedField(
+        many=True, queryset=Ingredient.objects.all(), required=False
     )
     # By default this field is read-write, although
     # you can change this behavior using the read_only flag.
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True, queryset=Tag.objects.all()
+    tags = UserPrimaryKeyRelatedField(
+        many=True, queryset=Tag.objects.all(), required=False
+    )
+    # the tags and ingredients can be given by name too, eg.
+    # {"tags": [1], "tag_names": ["Vegan"], "ingredient_names": ["Tofu"]}
+    # the names the user doesn't have yet are created, all of them in
+    # one insert (see recipe.bulk.get_or_create_named)
+    # without "tags", a patch adds the names to the current tags
+    ingredient_names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        required=False,
+        write_only=True,
+    )
+    tag_names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        required=False,
+        write_only=True,
     )
 
     class Meta:
@@ -95,9 +195,98 @@ class RecipeSerializer(serializers.ModelSerializer):
             "time_minutes",
             "price",
             "link",
+            "ingredient_names",
+            "tag_names",
         )
         read_only_fields = ("id",)
 
+    # the default create() and update() call .set() on the m2m fields:
+    # a read, then a delete and an insert per changed field, outside
+    # of any transaction. only the difference with the current through
+    # rows is written instead (see recipe.bulk.set_relations), nothing
+    # at all when the ids didn't change, all in a single transaction
+    # {m2m field: the field of its names}
+    relation_fields = {
+        "tags": "tag_names",
+        "ingredients": "ingredient_names",
+    }
+
+    def validate(self, attrs):
+        # a put replaces the relations, leaving both the ids and the
+        # names out must not clear them
+        if self.instance is not None and not self.partial:
+            missing = {
+                name: [self.fields[name].error_messages["required"]]
+                for name, names_field in self.relation_fields.items()
+                if name not in attrs and names_field not in attrs
+            }
+            if missing:
+                raise serializers.ValidationError(missing)
+        return attrs
+
+    def _pop_relations(self, validated_data):
+        """Remove the m2m fields from the data, return {name: (objs, names)}"""
+        relations = {}
+        for name, names_field in self.relation_fields.items():
+            objs = validated_data.pop(name, None)
+            names = validated_data.pop(names_field, None)
+            if objs is None and names is not None and not self.partial:
+                # a put with only names: they replace the current ones
+                objs = []
+            if objs is not None or names:
+                relations[name] = (objs, names or [])
+        return relations
+
+    def _write_relations(self, instance, relations, created=False):
+        for name, (objs, names) in relations.items():
+            if objs is not None:
+                ids = {obj.pk for obj in objs}
+            else:
+                # a patch with only names, they are added
+                ids = set(getattr(instance, name).values_list("id", flat=True))
+            model = Recipe._meta.get_field(name).related_model
+            ids.update(get_or_create_named(model, instance.user_id, names))
+            set_relations([instance], name, {instance: ids}, created=created)
+
+    def create(self, validated_data):
+        relations = self._pop_relations(validated_data)
+        with transaction.atomic():
+            instance = super().create(validated_data)
+            # a new recipe has no rows yet, nothing to read
+            self._write_relations(instance, relations, created=True)
+        return instance
+
+    def update(self, instance, validated_data):
+        relations = self._pop_relations(validated_data)
+        with transaction.atomic():
+            self._write_relations(instance, relations)
+            # saved after the relations, its updated_at covers them too
+            instance = super().update(instance, validated_data)
+        return instance
+
+
+class RecipeBulkSerializer(RecipeSerializer):
+    """Serialize the recipes of a bulk request"""
+
+    # plain lists of ids, BulkModelMixin checks the ids of the whole
+    # batch in one query instead of one query per id
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(), required=False
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), required=False
+    )
+    # only ids in a batch
+    ingredient_names = None
+    tag_names = None
+
+    class Meta(RecipeSerializer.Meta):
+        fields = tuple(
+            name
+            for name in RecipeSerializer.Meta.fields
+            if name not in RecipeSerializer.relation_fields.values()
+        )
+
 
 class RecipeDetailSerializer(RecipeSerializer):
     """Serialize a recipe detail"""
@@ -126,12 +315,62 @@ class RecipeDetailSerializer(RecipeSerializer):
     # relationships should be saved:
     ingredients = IngredientSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
+    # already nested
+    expandable_fields = {}
+
+
+class RecipeImageVariantSerializer(serializers.ModelSerializer):
+    """Serializer for the resized copies of a recipe image"""
+
+    class Meta:
+        model = RecipeImageVariant
+        fields = ("name", "format", "width", "height", "file")
+        read_only_fields = fields
 
 
 class RecipeImageSerializer(serializers.ModelSerializer):
     """Serializer for uploading images to the recipes"""
 
+    # filled in by the background processing, see recipe.images
+    image_variants = RecipeImageVariantSerializer(many=True, read_only=True)
+
     class Meta:
         model = Recipe
-        fields = ("id", "image")
+        fields = ("id", "image", "image_status", "image_variants")
+        read_only_fields = ("id", "image_status")
+
+    def validate_image(self, value):
+        """Reject the images larger than the limit"""
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if value.size > max_size:
+            raise serializers.ValidationError(
+                MAX_SIZE.format(max_size=max_size)
+            )
+        return value
+
+
+class ImageUploadSerializer(serializers.ModelSerializer):
+    """Serializer for the resumable uploads of recipe images"""
+
+    recipe = UserPrimaryKeyRelatedField(queryset=Recipe.objects.all())
+    # bytes received so far
+    offset = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImageUpload
+        fields = ("id", "recipe", "length", "offset")
         read_only_fields = ("id",)
+
+    def get_offset(self, obj):
+        return received(obj)
+
+    def validate_length(self, value):
+        """Reject the uploads larger than the limit before they start"""
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if value > max_size:
+            raise serializers.ValidationError(
+                MAX_SIZE.format(max_size=max_size)
+            )
+        if value == 0:
+            raise serializers.ValidationError("The image is empty.")
+        return value
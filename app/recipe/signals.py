@@ -0,0 +1,228 @@
+from django.db.models.signals import (
+    post_save,
+    pre_delete,
+    post_delete,
+    m2m_changed,
+)
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.blobs import release
+from core.counts import adjust
+from core.models import (
+    Tag,
+    Ingredient,
+    Recipe,
+    RecipeImageVariant,
+    Tombstone,
+)
+
+from recipe.cache import bump_user_version_on_commit
+from recipe.coverage import record_change
+
+# https://docs.djangoproject.com/en/2.1/topics/signals/
+# connected in RecipeConfig.ready()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """Invalidate the cached responses of the owner of the object"""
+    bump_user_version_on_commit(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_user_cache_on_assign(sender, instance, action, **kwargs):
+    """Invalidate the cached responses when recipe assignments change"""
+    # instance is the recipe, or the tag/ingredient for reverse
+    # changes eg. tag.recipe_set.add(recipe), both have a user
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_user_version_on_commit(instance.user_id)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def leave_tombstone(sender, instance, **kwargs):
+    """Record the deletion for the clients to sync, see recipe.sync"""
+    Tombstone.objects.create(
+        user_id=instance.user_id,
+        model=sender._meta.model_name,
+        object_id=instance.pk,
+    )
+
+
+def touch_recipes(**filters):
+    """Set the updated_at of the recipes, like a save() would"""
+    now = timezone.now()
+    Recipe.objects.filter(**filters).update(updated_at=now)
+    return now
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_assigned_recipes(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """Mark the recipes whose tags or ingredients changed as updated"""
+    if kwargs.get("bulk"):
+        # done once for the whole batch, see recipe.bulk.touch
+        return
+    if not reverse:
+        # recipe.tags.add(...)
+        if action in ("post_add", "post_remove", "post_clear"):
+            instance.updated_at = touch_recipes(pk=instance.pk)
+    elif action in ("post_add", "post_remove"):
+        # tag.recipe_set.add(...), pk_set: the recipe ids
+        touch_recipes(pk__in=pk_set)
+    elif action == "pre_clear":
+        # the recipes can't be found anymore after the clear
+        field_name = "tags" if sender is Recipe.tags.through else "ingredients"
+        touch_recipes(**{field_name: instance})
+
+
+def _relation(sender):
+    """Return the m2m field of the recipes using the through model"""
+    if sender is Recipe.tags.through:
+        return Recipe._meta.get_field("tags")
+    return Recipe._meta.get_field("ingredients")
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def count_assigned_recipes(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """Keep the recipe_count of the tags and ingredients exact"""
+    if kwargs.get("bulk"):
+        # done once for the whole batch, see recipe.bulk.set_relations
+        return
+    field = _relation(sender)
+    model = field.related_model
+    source = field.m2m_field_name()
+    target = field.m2m_reverse_field_name()
+    # add() only sends the ids not linked yet, but remove() sends all
+    # the ones given: the rows that exist are counted before they go
+    if not reverse:
+        # recipe.tags.add(...), pk_set: the tag ids
+        links = sender.objects.filter(**{source: instance.pk})
+        if action == "post_add":
+            adjust(model, dict.fromkeys(pk_set, 1))
+        elif action in ("pre_remove", "pre_clear"):
+            if action == "pre_remove":
+                links = links.filter(**{f"{target}__in": pk_set})
+            model.objects.filter(pk__in=links.values(target)).update(
+                recipe_count=F("recipe_count") - 1
+            )
+    else:
+        # tag.recipe_set.add(...), pk_set: the recipe ids
+        if action == "post_add":
+            adjust(model, {instance.pk: len(pk_set)})
+        elif action == "pre_remove":
+            removed = sender.objects.filter(
+                **{target: instance.pk, f"{source}__in": pk_set}
+            ).count()
+            adjust(model, {instance.pk: -removed})
+        elif action == "post_clear":
+            model.objects.filter(pk=instance.pk).update(recipe_count=0)
+
+
+@receiver(pre_delete, sender=Recipe)
+def uncount_deleted_recipe(sender, instance, **kwargs):
+    """Take a deleted recipe off the recipe_count of its tags"""
+    # the through rows are deleted without m2m_changed
+    for field in Recipe._meta.many_to_many:
+        links = field.remote_field.through.objects.filter(
+            **{field.m2m_field_name(): instance.pk}
+        )
+        field.related_model.objects.filter(
+            pk__in=links.values(field.m2m_reverse_field_name())
+        ).update(recipe_count=F("recipe_count") - 1)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def touch_recipes_using(sender, instance, created=False, **kwargs):
+    """Mark the recipes as updated when one of their tags changes"""
+    # the recipe details show the names of their tags and ingredients
+    if not created:
+        field_name = "tags" if sender is Tag else "ingredients"
+        touch_recipes(**{field_name: instance})
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_image(sender, instance, **kwargs):
+    """Drop the reference of a deleted recipe to its image file"""
+    if instance.image:
+        release(instance.image.name)
+
+
+@receiver(post_delete, sender=RecipeImageVariant)
+def release_variant_file(sender, instance, **kwargs):
+    """Drop the reference of a deleted variant to its file"""
+    release(instance.file.name)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def index_ingredient_changes(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """Keep the ingredient indexes of recipe.coverage up to date"""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    pk_set = set(pk_set or ())
+    if not reverse:
+        # recipe.ingredients.add(...)
+        recipe_id = instance.pk
+        if action == "post_add":
+            def apply(index):
+                index.add(recipe_id, pk_set)
+        elif action == "post_remove":
+            def apply(index):
+                index.remove(recipe_id, pk_set)
+        else:
+            def apply(index):
+                index.remove_recipe(recipe_id)
+    else:
+        # ingredient.recipe_set.add(...)
+        ingredient_id = instance.pk
+        if action == "post_add":
+            def apply(index):
+                for recipe_id in pk_set:
+                    index.add(recipe_id, [ingredient_id])
+        elif action == "post_remove":
+            def apply(index):
+                for recipe_id in pk_set:
+                    index.remove(recipe_id, [ingredient_id])
+        else:
+            def apply(index):
+                index.remove_ingredient(ingredient_id)
+
+    record_change(instance.user_id, apply)
+
+
+@receiver(post_delete, sender=Recipe)
+def index_deleted_recipe(sender, instance, **kwargs):
+    """Remove a deleted recipe from the ingredient index"""
+    # the through rows are deleted without m2m_changed
+    record_change(
+        instance.user_id, lambda index: index.remove_recipe(instance.pk)
+    )
+
+
+@receiver(post_delete, sender=Ingredient)
+def index_deleted_ingredient(sender, instance, **kwargs):
+    """Remove a deleted ingredient from the ingredient index"""
+    record_change(
+        instance.user_id,
+        lambda index: index.remove_ingredient(instance.pk),
+    )
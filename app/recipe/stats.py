@@ -0,0 +1,122 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Avg, Count, F, Func, IntegerField, Max, Min
+from django.db.models.functions import Cast
+
+from core.models import Recipe
+
+# statistics of the recipes of a user, computed by the database
+# the queryset given is the filtered list of recipes, it is only ever
+# used as a subquery or aggregated, the recipes are never loaded:
+# - one aggregate query for the count, min, max and average
+# - one GROUP BY query per histogram, the bucket of every recipe is
+#   computed in sql: time_minutes / width (integer division)
+# - one GROUP BY query on each through table for the tag and
+#   ingredient counts
+
+CENT = Decimal("0.01")
+
+
+def _price(value):
+    """Format a price like the recipe serializers do, eg. "5.00" """
+    if value is None:
+        return None
+    return str(Decimal(value).quantize(CENT))
+
+
+def _histogram(queryset, expression, width):
+    """Return the number of recipes in each bucket of the given width"""
+    # expression: an integer expression, bucket = expression / width
+    # postgres and sqlite both divide integers without the remainder
+    rows = (
+        queryset.annotate(bucket=expression / width)
+        .values("bucket")
+        .annotate(count=Count("id"))
+        .order_by("bucket")
+    )
+    # only the non empty buckets are returned
+    return [
+        {
+            "start": row["bucket"] * width,
+            "end": (row["bucket"] + 1) * width,
+            "count": row["count"],
+        }
+        for row in rows
+    ]
+
+
+def _price_cents():
+    """Return the price of a recipe as a whole number of cents"""
+    # ROUND: sqlite stores decimals as floats eg. 12.35 * 100 = 1234.99
+    return Cast(Func(F("price") * 100, function="ROUND"), IntegerField())
+
+
+def _relation_counts(queryset, field_name):
+    """Return the number of recipes of each tag or ingredient"""
+    field = Recipe._meta.get_field(field_name)
+    through = field.remote_field.through
+    target = field.m2m_reverse_field_name()
+    rows = (
+        through.objects.filter(recipe__in=queryset.values("id"))
+        .values(f"{target}_id", f"{target}__name")
+        .annotate(count=Count("id"))
+        .order_by("-count", f"{target}__name")
+    )
+    return [
+        {
+            "id": row[f"{target}_id"],
+            "name": row[f"{target}__name"],
+            "count": row["count"],
+        }
+        for row in rows
+    ]
+
+
+def recipe_stats(queryset):
+    """Return the statistics of the recipes of the queryset"""
+    # any ordering would end up in the GROUP BY clauses
+    queryset = queryset.order_by()
+    summary = queryset.aggregate(
+        count=Count("id"),
+        time_minutes_min=Min("time_minutes"),
+        time_minutes_max=Max("time_minutes"),
+        time_minutes_avg=Avg("time_minutes"),
+        price_min=Min("price"),
+        price_max=Max("price"),
+        price_avg=Avg("price"),
+    )
+
+    time_width = settings.RECIPE_STATS_TIME_BUCKET
+    price_width = settings.RECIPE_STATS_PRICE_BUCKET
+    # the price buckets are counted in cents to stay in integers
+    price_cents = int(price_width * 100)
+    price_histogram = [
+        {
+            "start": _price(Decimal(bucket["start"]) * CENT),
+            "end": _price(Decimal(bucket["end"]) * CENT),
+            "count": bucket["count"],
+        }
+        for bucket in _histogram(queryset, _price_cents(), price_cents)
+    ]
+
+    time_avg = summary["time_minutes_avg"]
+    return {
+        "count": summary["count"],
+        "time_minutes": {
+            "min": summary["time_minutes_min"],
+            "max": summary["time_minutes_max"],
+            "avg": None if time_avg is None else round(time_avg, 1),
+            "histogram": _histogram(
+                queryset, F("time_minutes"), time_width
+            ),
+        },
+        "price": {
+            "min": _price(summary["price_min"]),
+            "max": _price(summary["price_max"]),
+            "avg": _price(summary["price_avg"]),
+            "histogram": price_histogram,
+        },
+        "tags": _relation_counts(queryset, "tags"),
+        "ingredients": _relation_counts(queryset, "ingredients"),
+    }
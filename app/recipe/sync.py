@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from rest_framework.exceptions import ValidationError
+
+from core.models import Tag, Ingredient, Recipe, Tombstone
+
+from recipe import serializers
+from recipe.readers import ValuesReader
+
+# incremental sync of the clients that keep a copy of the user's data
+# GET /api/recipe/sync/           everything, and a token
+# GET /api/recipe/sync/?since=t   what changed since the sync that
+#                                 returned the token t
+# the changes are found with updated_at (set on every save and when the
+# tags or ingredients of a recipe change, see recipe.signals) and the
+# tombstones left by the deleted objects, on (user, updated_at) and
+# (user, deleted_at) indexes, so a sync reads the changes only
+#
+# updated_at is the time of the save, not of the commit: a row saved
+# just before a sync may only be committed after it. the token is set
+# RECIPE_SYNC_MARGIN seconds in the past to catch those, so the
+# changes of the last seconds come again in the next sync and the
+# client must apply them idempotently: "updated" first, then "deleted"
+#
+# tombstones are kept RECIPE_SYNC_TOMBSTONE_DAYS, an older token gets
+# a full sync ("full": true), the client then replaces its copy
+
+SYNCED = (
+    ("recipes", Recipe, serializers.RecipeSerializer),
+    ("tags", Tag, serializers.TagSerializer),
+    ("ingredients", Ingredient, serializers.IngredientSerializer),
+)
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_token(moment):
+    """Return the token of a sync done at the moment"""
+    # the number of microseconds since 1970, exactly
+    return str((moment - EPOCH) // timedelta(microseconds=1))
+
+
+def decode_token(token):
+    """Return the moment of the token, or raise a ValidationError"""
+    try:
+        return EPOCH + timedelta(microseconds=int(token))
+    except (ValueError, OverflowError):
+        raise ValidationError({"since": ["Invalid sync token."]})
+
+
+def sync(user, since=None):
+    """Return the data of the user changed since the moment"""
+    now = timezone.now()
+    horizon = now - timedelta(days=settings.RECIPE_SYNC_TOMBSTONE_DAYS)
+    full = since is None or since < horizon
+
+    data = {
+        "token": encode_token(
+            now - timedelta(seconds=settings.RECIPE_SYNC_MARGIN)
+        ),
+        "full": full,
+    }
+    for name, model, serializer_class in SYNCED:
+        queryset = model.objects.filter(user=user).order_by("id")
+        deleted = []
+        if not full:
+            queryset = queryset.filter(updated_at__gt=since)
+            deleted = list(
+                Tombstone.objects.filter(
+                    user=user,
+                    model=model._meta.model_name,
+                    deleted_at__gt=since,
+                )
+                .order_by("object_id")
+                .values_list("object_id", flat=True)
+                .distinct()
+            )
+        # same output as the list endpoints, from values() rows
+        reader = ValuesReader(serializer_class(context={}))
+        data[name] = {
+            "updated": reader.read(reader.values(queryset)),
+            "deleted": deleted,
+        }
+    return data
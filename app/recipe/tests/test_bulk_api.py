@@ -0,0 +1,218 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+from recipe.tests.test_recipe_api import recipe_payload
+
+RECIPES_BULK_URL = reverse("recipe:recipe-bulk")
+TAGS_BULK_URL = reverse("recipe:tag-bulk")
+
+
+class PublicBulkApiTests(TestCase):
+    """Test unauthenticated bulk API access"""
+
+    def test_auth_required(self):
+        """Test that authentication is required"""
+        res = APIClient().post(RECIPES_BULK_URL, [], format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateBulkApiTests(TestCase):
+    """Test the authenticated bulk API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create_recipes(self):
+        """Test creating many recipes in one request"""
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        ingredient = Ingredient.objects.create(user=self.user, name="Tofu")
+        payload = [
+            recipe_payload(title="Tofu curry", tags=[tag.id]),
+            recipe_payload(title="Tofu stir fry", ingredients=[ingredient.id]),
+            recipe_payload(title="Salad"),
+        ]
+
+        res = self.client.post(RECIPES_BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data), 3)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        curry = Recipe.objects.get(title="Tofu curry")
+        self.assertEqual(list(curry.tags.all()), [tag])
+        stir_fry = Recipe.objects.get(title="Tofu stir fry")
+        self.assertEqual(list(stir_fry.ingredients.all()), [ingredient])
+        self.assertEqual(res.data[0]["tags"], [tag.id])
+
+    # other backends fall back to saving the recipes one by one
+    @skipUnlessDBFeature("can_return_ids_from_bulk_insert")
+    def test_bulk_create_queries_independent_of_size(self):
+        """Test the number of queries doesn't grow with the batch"""
+        tags = [
+            Tag.objects.create(user=self.user, name=f"Tag {i}")
+            for i in range(5)
+        ]
+
+        def create(count):
+            payload = [
+                recipe_payload(tags=[tag.id for tag in tags])
+                for _ in range(count)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.post(
+                    RECIPES_BULK_URL, payload, format="json"
+                )
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            return len(queries)
+
+        self.assertEqual(create(2), create(20))
+
+    def test_bulk_create_invalid_items(self):
+        """Test nothing is created when an item is invalid"""
+        other_user = get_user_model().objects.create_user(
+            "other@londonappdev.com", "testpass"
+        )
+        other_tag = Tag.objects.create(user=other_user, name="Fruity")
+        payload = [
+            recipe_payload(),
+            recipe_payload(title=""),
+            recipe_payload(tags=[other_tag.id, 9999]),
+        ]
+
+        res = self.client.post(RECIPES_BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = res.data["errors"]
+        self.assertEqual(errors[0], {})
+        self.assertIn("title", errors[1])
+        self.assertEqual(len(errors[2]["tags"]), 2)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_create_not_a_list(self):
+        """Test the payload must be a list"""
+        res = self.client.post(
+            RECIPES_BULK_URL, recipe_payload(), format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_update_recipes(self):
+        """Test updating many recipes in one request"""
+        tag1 = Tag.objects.create(user=self.user, name="Vegan")
+        tag2 = Tag.objects.create(user=self.user, name="Dessert")
+        recipe1 = Recipe.objects.create(
+            user=self.user, title="Cake", time_minutes=60, price=5
+        )
+        recipe1.tags.add(tag1)
+        recipe2 = Recipe.objects.create(
+            user=self.user, title="Soup", time_minutes=20, price=3
+        )
+        payload = [
+            {"id": recipe1.id, "tags": [tag2.id]},
+            {"id": recipe2.id, "title": "Tomato soup"},
+        ]
+
+        res = self.client.patch(RECIPES_BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe1.refresh_from_db()
+        recipe2.refresh_from_db()
+        self.assertEqual(recipe1.title, "Cake")
+        self.assertEqual(list(recipe1.tags.all()), [tag2])
+        self.assertEqual(recipe2.title, "Tomato soup")
+
+    def test_bulk_update_unknown_id(self):
+        """Test updating recipes of other users fails"""
+        other_user = get_user_model().objects.create_user(
+            "other@londonappdev.com", "testpass"
+        )
+        recipe = Recipe.objects.create(
+            user=other_user, title="Cake", time_minutes=60, price=5
+        )
+
+        res = self.client.patch(
+            RECIPES_BULK_URL,
+            [{"id": recipe.id, "title": "Mine"}],
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("id", res.data["errors"][0])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, "Cake")
+
+    def test_bulk_update_invalid_ids(self):
+        """Test ids of the wrong type are errors of their item"""
+        recipe = Recipe.objects.create(
+            user=self.user, title="Cake", time_minutes=60, price=5
+        )
+
+        res = self.client.patch(
+            RECIPES_BULK_URL,
+            [{"id": [recipe.id]}, {"id": True}, {"title": "No id"}],
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = [item["id"][0] for item in res.data["errors"]]
+        self.assertIn("Incorrect type", errors[0])
+        self.assertIn("Incorrect type", errors[1])
+        self.assertEqual(errors[2], "This field is required.")
+
+    def test_bulk_delete_recipes(self):
+        """Test deleting many recipes in one request"""
+        recipes = [
+            Recipe.objects.create(
+                user=self.user, title="Cake", time_minutes=60, price=5
+            )
+            for _ in range(3)
+        ]
+
+        res = self.client.delete(
+            RECIPES_BULK_URL,
+            [recipes[0].id, recipes[1].id],
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        remaining = Recipe.objects.values_list("id", flat=True)
+        self.assertEqual(list(remaining), [recipes[2].id])
+
+    def test_bulk_delete_invalid_ids(self):
+        """Test deleting with ids of the wrong type fails per item"""
+        recipe = Recipe.objects.create(
+            user=self.user, title="Cake", time_minutes=60, price=5
+        )
+
+        res = self.client.delete(
+            RECIPES_BULK_URL, [recipe.id, {"id": recipe.id}], format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data["errors"][0], [])
+        self.assertIn("Incorrect type", res.data["errors"][1][0])
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+    def test_bulk_create_tags(self):
+        """Test creating many tags in one request"""
+        payload = [{"name": "Vegan"}, {"name": "Dessert"}]
+
+        res = self.client.post(TAGS_BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        names = Tag.objects.filter(user=self.user).values_list(
+            "name", flat=True
+        )
+        self.assertEqual(set(names), {"Vegan", "Dessert"})
@@ -0,0 +1,124 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag
+
+from recipe.cache import get_cache
+from recipe.tests.test_recipe_api import (
+    detail_url,
+    run_commit_hooks,
+    sample_recipe,
+)
+
+RECIPES_URL = reverse("recipe:recipe-list")
+STATS_URL = reverse("recipe:recipe-stats")
+TAGS_URL = reverse("recipe:tag-list")
+
+
+class ConditionalGetApiTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+        self.client.force_authenticate(self.user)
+
+    def get_etag(self, url, params=None):
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn("ETag", res)
+        return res["ETag"]
+
+    def assertNotModified(self, url, etag, queries=0):
+        with self.assertNumQueries(queries):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b"")
+        self.assertEqual(res["ETag"], etag)
+
+    def test_lists_not_modified(self):
+        """Test the lists answer 304 without any query"""
+        sample_recipe(self.user)
+        Tag.objects.create(user=self.user, name="Vegan")
+
+        for url in (RECIPES_URL, STATS_URL, TAGS_URL):
+            self.assertNotModified(url, self.get_etag(url))
+
+    def test_list_modified(self):
+        """Test the list etag changes with the data of the user"""
+        etag = self.get_etag(RECIPES_URL)
+
+        sample_recipe(self.user)
+        run_commit_hooks()
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertNotEqual(res["ETag"], etag)
+
+    def test_list_etag_per_params(self):
+        """Test other query params give another etag"""
+        etag = self.get_etag(RECIPES_URL)
+
+        self.assertNotEqual(
+            self.get_etag(RECIPES_URL, {"ordering": "price"}), etag
+        )
+
+    def test_list_etag_per_user(self):
+        """Test the etag of another user's list doesn't match"""
+        etag = self.get_etag(TAGS_URL)
+        other = get_user_model().objects.create_user(
+            "other@londonappdev.com", "password123"
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_detail_not_modified(self):
+        """Test a recipe answers 304 with a single query"""
+        recipe = sample_recipe(self.user)
+        url = detail_url(recipe.id)
+
+        self.assertNotModified(url, self.get_etag(url), queries=1)
+
+    def test_detail_modified(self):
+        """Test the etag of a recipe changes with what it shows"""
+        recipe = sample_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        url = detail_url(recipe.id)
+
+        def rename_tag():
+            tag.name = "Vegetarian"
+            tag.save()
+
+        changes = (
+            lambda: recipe.tags.add(tag),
+            rename_tag,
+            lambda: self.client.patch(url, {"title": "New title"}),
+            lambda: tag.delete(),
+        )
+        etag = self.get_etag(url)
+        for change in changes:
+            change()
+            new_etag = self.get_etag(url)
+            self.assertNotEqual(new_etag, etag)
+            etag = new_etag
+
+    def test_detail_not_found(self):
+        """Test a missing recipe is still a 404"""
+        res = self.client.get(detail_url(0), HTTP_IF_NONE_MATCH='"x"')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_if_match_failed(self):
+        """Test a different If-Match etag fails the precondition"""
+        res = self.client.get(RECIPES_URL, HTTP_IF_MATCH='"outdated"')
+
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
@@ -0,0 +1,181 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Ingredient
+
+from recipe.cache import get_cache
+from recipe.coverage import (
+    _indexes,
+    clear_indexes,
+    coverage_sql,
+    get_index,
+)
+from recipe.tests.test_recipe_api import sample_recipe
+
+COVERAGE_URL = reverse("recipe:recipe-coverage")
+
+
+def recipe_using(user, title, ingredients=()):
+    """Create a sample recipe using the ingredients"""
+    recipe = sample_recipe(user, title=title)
+    recipe.ingredients.add(*ingredients)
+    return recipe
+
+
+class CoverageApiTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        clear_indexes()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+        self.client.force_authenticate(self.user)
+        self.egg, self.flour, self.milk, self.salt = (
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ("Egg", "Flour", "Milk", "Salt")
+        )
+
+    def test_coverage_ordered_by_missing(self):
+        """Test the recipes needing fewest other ingredients come first"""
+        omelette = recipe_using(self.user, "Omelette", [self.egg, self.salt])
+        pancakes = recipe_using(
+            self.user, "Pancakes", [self.egg, self.flour, self.milk]
+        )
+        bread = recipe_using(self.user, "Bread", [self.flour, self.salt])
+        recipe_using(self.user, "Milkshake", [self.milk])
+
+        res = self.client.get(
+            COVERAGE_URL, {"ingredients": f"{self.egg.id},{self.flour.id}"}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        results = [
+            (recipe["id"], recipe["covered"], recipe["missing"])
+            for recipe in res.data["results"]
+        ]
+        self.assertEqual(
+            results,
+            [(pancakes.id, 2, 1), (bread.id, 1, 1), (omelette.id, 1, 1)],
+        )
+        self.assertEqual(res.data["results"][0]["title"], "Pancakes")
+
+    def test_coverage_max_missing(self):
+        """Test recipes needing too many other ingredients are left out"""
+        omelette = recipe_using(self.user, "Omelette", [self.egg])
+        recipe_using(
+            self.user, "Pancakes", [self.egg, self.flour, self.milk]
+        )
+
+        res = self.client.get(
+            COVERAGE_URL, {"ingredients": self.egg.id, "max_missing": 1}
+        )
+
+        self.assertEqual(
+            [recipe["id"] for recipe in res.data["results"]], [omelette.id]
+        )
+
+    def test_coverage_matches_sql(self):
+        """Test the index gives the same answer as the database"""
+        ingredients = [self.egg, self.flour, self.milk, self.salt]
+        for i in range(12):
+            recipe_using(self.user, f"Recipe {i}", ingredients[i % 4:])
+
+        for ids, max_missing in (([self.egg.id], None), ([1, 2, 3], 1)):
+            self.assertEqual(
+                get_index(self.user.id).coverage(ids, max_missing),
+                list(coverage_sql(self.user.id, ids, max_missing)),
+            )
+
+    def test_coverage_limited_to_user(self):
+        """Test the recipes of other users are never matched"""
+        user2 = get_user_model().objects.create_user(
+            "other@londonappdev.com", "password123"
+        )
+        egg = Ingredient.objects.create(user=user2, name="Egg")
+        recipe_using(user2, "Omelette", [egg])
+
+        res = self.client.get(COVERAGE_URL, {"ingredients": egg.id})
+
+        self.assertEqual(res.data["results"], [])
+
+    def test_coverage_requires_ingredients(self):
+        """Test the ingredients param is required and validated"""
+        res = self.client.get(COVERAGE_URL)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(
+            COVERAGE_URL, {"ingredients": self.egg.id, "max_missing": "x"}
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+# TransactionTestCase: the index is only updated once the change is
+# committed, TestCase never commits
+class IngredientIndexTests(TransactionTestCase):
+    def setUp(self):
+        get_cache().clear()
+        clear_indexes()
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+        self.egg = Ingredient.objects.create(user=self.user, name="Egg")
+        self.milk = Ingredient.objects.create(user=self.user, name="Milk")
+        self.recipe = recipe_using(self.user, "Omelette", [self.egg])
+
+    def assertIndexed(self, index):
+        """Check the index is the cached one and matches the database"""
+        self.assertIs(get_index(self.user.id), index)
+        for ids in ([self.egg.id], [self.milk.id], [self.egg.id, 0]):
+            self.assertEqual(
+                index.coverage(ids), list(coverage_sql(self.user.id, ids))
+            )
+
+    def test_index_updated_incrementally(self):
+        """Test changes are applied to the index instead of rebuilding"""
+        index = get_index(self.user.id)
+
+        self.recipe.ingredients.add(self.milk)
+        self.assertIndexed(index)
+        self.milk.recipe_set.remove(self.recipe)
+        self.assertIndexed(index)
+        self.egg.recipe_set.add(recipe_using(self.user, "Egg"))
+        self.assertIndexed(index)
+        self.recipe.ingredients.clear()
+        self.assertIndexed(index)
+        self.egg.delete()
+        self.assertIndexed(index)
+        Recipe.objects.all().delete()
+        self.assertIndexed(index)
+
+    def test_index_ignores_rollback(self):
+        """Test changes rolled back never reach the index"""
+        index = get_index(self.user.id)
+
+        with transaction.atomic():
+            self.recipe.ingredients.add(self.milk)
+            transaction.set_rollback(True)
+
+        # nothing was versioned, the index is still in sync
+        self.assertIs(get_index(self.user.id), index)
+        self.assertEqual(index.coverage([self.milk.id]), [])
+
+    def test_index_rebuilt_after_missed_change(self):
+        """Test a change made by another process rebuilds the index"""
+        index = get_index(self.user.id)
+        # as if another process had the index in memory
+        del _indexes[self.user.id]
+        self.recipe.ingredients.add(self.milk)
+        _indexes[self.user.id] = index
+
+        new = get_index(self.user.id)
+
+        self.assertIsNot(new, index)
+        self.assertEqual(
+            new.coverage([self.milk.id]), [(self.recipe.id, 1, 1)]
+        )
@@ -0,0 +1,138 @@
+import io
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from PIL import Image
+
+from core.models import Recipe
+
+from recipe.images import process_image
+
+# exif block with the orientation tag set to 6, ie. the camera was
+# turned by 90 degrees: "Exif" + big endian tiff header + one entry
+EXIF_ROTATED = (
+    b"Exif\x00\x00MM\x00\x2a\x00\x00\x00\x08\x00\x01"
+    b"\x01\x12\x00\x03\x00\x00\x00\x01\x00\x06\x00\x00"
+    b"\x00\x00\x00\x00"
+)
+
+
+def image_url(recipe_id):
+    """Return URL for the image status of a recipe"""
+    return reverse("recipe:recipe-image", args=[recipe_id])
+
+
+def sample_jpeg(size=(2000, 1000), **kwargs):
+    """Return the content of a jpeg image"""
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buffer, "JPEG", **kwargs)
+    return ContentFile(buffer.getvalue())
+
+
+class ImageProcessingTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(
+            MEDIA_ROOT=self.media_root,
+            RECIPE_IMAGE_SIZES={"medium": 600, "thumbnail": 150},
+            RECIPE_IMAGE_FORMATS=("jpeg", "webp"),
+        )
+        self.settings.enable()
+        self.user = get_user_model().objects.create_user(
+            "user@londonappdev.com", "testpass"
+        )
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title="Sample recipe",
+            time_minutes=10,
+            price=5.00,
+            image_status=Recipe.IMAGE_PROCESSING,
+        )
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_process_image_variants(self):
+        """Test every size is saved in every format"""
+        self.recipe.image.save("photo.jpg", sample_jpeg())
+
+        process_image(self.recipe.id, self.recipe.image.name)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_READY)
+        variants = {
+            (variant.name, variant.format): variant
+            for variant in self.recipe.image_variants.all()
+        }
+        self.assertEqual(len(variants), 4)
+        medium = variants[("medium", "webp")]
+        self.assertEqual((medium.width, medium.height), (600, 300))
+        with Image.open(medium.file.path) as image:
+            self.assertEqual(image.format, "WEBP")
+            self.assertEqual(image.size, (600, 300))
+        thumbnail = variants[("thumbnail", "jpeg")]
+        self.assertEqual((thumbnail.width, thumbnail.height), (150, 75))
+
+    def test_process_image_strips_metadata(self):
+        """Test the orientation is applied and the exif data dropped"""
+        content = sample_jpeg(size=(200, 100), exif=EXIF_ROTATED)
+        self.recipe.image.save("photo.jpg", content)
+
+        process_image(self.recipe.id, self.recipe.image.name)
+
+        # the stripped copy replaces the uploaded file
+        self.recipe.refresh_from_db()
+        with Image.open(self.recipe.image.path) as image:
+            self.assertEqual(image.size, (100, 200))
+            self.assertNotIn("exif", image.info)
+        variant = self.recipe.image_variants.get(
+            name="thumbnail", format="jpeg"
+        )
+        with Image.open(variant.file.path) as image:
+            self.assertEqual(image.size, (75, 150))
+            self.assertNotIn("exif", image.info)
+
+    def test_process_image_invalid(self):
+        """Test a file that isn't an image marks the recipe failed"""
+        self.recipe.image.save("photo.jpg", ContentFile(b"not an image"))
+
+        with self.assertLogs("recipe.images", level="ERROR"):
+            process_image(self.recipe.id, self.recipe.image.name)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_FAILED)
+        self.assertFalse(self.recipe.image_variants.exists())
+
+    def test_process_replaced_image(self):
+        """Test an image replaced before it was processed is skipped"""
+        self.recipe.image.save("photo.jpg", sample_jpeg())
+        name = self.recipe.image.name
+        self.recipe.image.save("other.jpg", sample_jpeg())
+
+        process_image(self.recipe.id, name)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_PROCESSING)
+        self.assertFalse(self.recipe.image_variants.exists())
+
+    def test_retrieve_image_status(self):
+        """Test the image status and variants of a recipe"""
+        self.recipe.image.save("photo.jpg", sample_jpeg())
+        process_image(self.recipe.id, self.recipe.image.name)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        res = client.get(image_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["image_status"], Recipe.IMAGE_READY)
+        self.assertEqual(len(res.data["image_variants"]), 4)
@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
 from django.test import TestCase
 
@@ -30,6 +31,8 @@ class PrivateIngredientsApiTests(TestCase):
     """Test the private ingredients API"""
 
     def setUp(self):
+        # cached responses would leak between the tests
+        cache.clear()
         self.client = APIClient()
         self.user = get_user_model().objects.create_user(
             "test@londonappdev.com", "testpass"
@@ -46,7 +49,7 @@ class PrivateIngredientsApiTests(TestCase):
         ingredients = Ingredient.objects.all().order_by("-name")
         serializer = IngredientSerializer(ingredients, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_ingredients_limited_to_user(self):
         """Test that ingredients for the authenticated user are returned"""
@@ -59,8 +62,8 @@ class PrivateIngredientsApiTests(TestCase):
         res = self.client.get(INGREDIENTS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]["name"], ingredient.name)
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertEqual(res.data["results"][0]["name"], ingredient.name)
 
     def test_create_ingredient_successful(self):
         """Test create a new ingredient"""
@@ -92,8 +95,26 @@ class PrivateIngredientsApiTests(TestCase):
 
         serializer1 = IngredientSerializer(ingredient1)
         serializer2 = IngredientSerializer(ingredient2)
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data["results"])
+        self.assertNotIn(serializer2.data, res.data["results"])
+
+    def test_retrieve_ingredients_with_counts(self):
+        """Test with_counts adds the number of recipes of each ingredient"""
+        salt = Ingredient.objects.create(user=self.user, name="Salt")
+        Ingredient.objects.create(user=self.user, name="Pepper")
+        for title in ("Soup", "Stew"):
+            Recipe.objects.create(
+                title=title, time_minutes=5, price=3.00, user=self.user
+            ).ingredients.add(salt)
+
+        res = self.client.get(
+            INGREDIENTS_URL, {"with_counts": 1, "assigned_only": 1}
+        )
+
+        self.assertEqual(
+            res.data["results"],
+            [{"id": salt.id, "name": "Salt", "recipe_count": 2}],
+        )
 
     def test_retrieve_ingredients_assigned_unique(self):
         """Test filtering ingredients by assigned returns unique items"""
@@ -114,4 +135,4 @@ class PrivateIngredientsApiTests(TestCase):
         # assigned_only is query param
         res = self.client.get(INGREDIENTS_URL, {"assigned_only": 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data["results"]), 1)
@@ -0,0 +1,194 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+from recipe.filters import filter_after, filter_recipes, get_ordering
+from recipe.tests.test_recipe_api import sample_recipe
+
+RECIPES_URL = reverse("recipe:recipe-list")
+
+
+class RecipeRangeApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+        self.client.force_authenticate(self.user)
+
+    def titles(self, params):
+        res = self.client.get(RECIPES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [recipe["title"] for recipe in res.data["results"]]
+
+    def test_filter_time_minutes_max(self):
+        """Test returning the recipes ready in time"""
+        sample_recipe(self.user, title="Salad", time_minutes=10)
+        sample_recipe(self.user, title="Soup", time_minutes=30)
+        sample_recipe(self.user, title="Roast", time_minutes=90)
+
+        titles = self.titles({"time_minutes_max": 30})
+
+        self.assertEqual(titles, ["Soup", "Salad"])
+
+    def test_filter_price_range(self):
+        """Test the bounds of a price range are included"""
+        sample_recipe(self.user, title="Cheap", price="4.99")
+        sample_recipe(self.user, title="Fair", price="5.00")
+        sample_recipe(self.user, title="Pricey", price="10.50")
+        sample_recipe(self.user, title="Luxury", price="10.51")
+
+        titles = self.titles({"price_min": "5", "price_max": "10.50"})
+
+        self.assertEqual(titles, ["Pricey", "Fair"])
+
+    def test_filter_title_range(self):
+        """Test filtering the titles alphabetically"""
+        for title in ("Apple pie", "Bread", "Cake", "Donut"):
+            sample_recipe(self.user, title=title)
+
+        titles = self.titles({"title_min": "B", "title_max": "C"})
+
+        self.assertEqual(titles, ["Bread"])
+
+    def test_filter_invalid_range(self):
+        """Test invalid bounds return an error for their param"""
+        for param, value in (
+            ("time_minutes_max", "soon"),
+            ("time_minutes_min", "-1"),
+            ("price_min", "1.234"),
+        ):
+            res = self.client.get(RECIPES_URL, {param: value})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(param, res.data)
+
+    def test_ordering(self):
+        """Test sorting the recipes by each field, both ways"""
+        sample_recipe(self.user, title="Bread", time_minutes=60, price="3.00")
+        sample_recipe(
+            self.user, title="Apple pie", time_minutes=45, price="8.00"
+        )
+        sample_recipe(self.user, title="Cake", time_minutes=30, price="12.00")
+
+        cases = (
+            ("title", ["Apple pie", "Bread", "Cake"]),
+            ("-title", ["Cake", "Bread", "Apple pie"]),
+            ("time_minutes", ["Cake", "Apple pie", "Bread"]),
+            ("price", ["Bread", "Apple pie", "Cake"]),
+            ("-price", ["Cake", "Apple pie", "Bread"]),
+            ("id", ["Bread", "Apple pie", "Cake"]),
+        )
+        for ordering, expected in cases:
+            self.assertEqual(self.titles({"ordering": ordering}), expected)
+
+    def test_ordering_invalid(self):
+        """Test only the indexed fields can be sorted by"""
+        for ordering in ("link", "--price", "user__email"):
+            res = self.client.get(RECIPES_URL, {"ordering": ordering})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ordering_pages_with_same_values(self):
+        """Test paging through recipes sharing the sorted value"""
+        recipes = [
+            sample_recipe(self.user, title=f"Recipe {i}", time_minutes=i // 3)
+            for i in range(8)
+        ]
+        expected = [recipe.title for recipe in recipes]
+
+        seen, pages = [], []
+        res = self.client.get(
+            RECIPES_URL, {"ordering": "time_minutes", "page_size": 2}
+        )
+        while True:
+            page = [recipe["title"] for recipe in res.data["results"]]
+            seen.extend(page)
+            pages.append(page)
+            if not res.data["next"]:
+                break
+            res = self.client.get(res.data["next"])
+        self.assertEqual(seen, expected)
+
+        # and back again
+        previous = []
+        while res.data["previous"]:
+            res = self.client.get(res.data["previous"])
+            previous.insert(0, [r["title"] for r in res.data["results"]])
+        self.assertEqual(previous, pages[:-1])
+
+    def test_ordering_invalid_cursor(self):
+        """Test a tampered cursor is rejected"""
+        sample_recipe(self.user, title="Soup")
+        # "p=x|1", the price isn't a number
+        res = self.client.get(
+            RECIPES_URL,
+            {"ordering": "price", "page_size": 1, "cursor": "cD14fDE="},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_range_query_sql(self):
+        """Test a range and an ordering compile to one index range"""
+        params = {"price_min": "5", "price_max": "10", "ordering": "price"}
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(RECIPES_URL, params)
+
+        sql = queries[0]["sql"]
+        self.assertIn('"core_recipe"."user_id" = ', sql)
+        self.assertIn('"core_recipe"."price" >= ', sql)
+        self.assertIn('"core_recipe"."price" <= ', sql)
+        self.assertIn(
+            'ORDER BY "core_recipe"."price" ASC, "core_recipe"."id" ASC', sql
+        )
+        self.assertIn("LIMIT", sql)
+        # the pagination never joins nor skips rows
+        self.assertNotIn("JOIN", sql)
+        self.assertNotIn("OFFSET", sql)
+
+
+@skipUnless(connection.vendor == "postgresql", "postgres query plans")
+class RecipeRangePlanTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+        with connection.cursor() as cursor:
+            # a handful of rows are read faster without an index,
+            # make the planner pick the plan it would for many rows
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_sort = off")
+
+    def plan(self, params, after=None):
+        ordering = get_ordering(params)
+        queryset = filter_recipes(
+            Recipe.objects.filter(user=self.user), params
+        ).order_by(*ordering)
+        if after is not None:
+            queryset = filter_after(queryset, ordering, *after)
+        return queryset[:100].explain()
+
+    def test_range_and_ordering_use_index(self):
+        """Test every field is filtered and sorted from its index"""
+        cases = (
+            ("time_minutes", "30", "core_recipe_user_time_idx"),
+            ("price", "10.00", "core_recipe_user_price_idx"),
+            ("title", "M", "core_recipe_user_title_idx"),
+        )
+        for field, value, index in cases:
+            for ordering in (field, f"-{field}"):
+                params = {f"{field}_max": value, "ordering": ordering}
+                for after in (None, (value, 10)):
+                    plan = self.plan(params, after)
+
+                    self.assertIn(index, plan)
+                    self.assertNotIn("Sort", plan)
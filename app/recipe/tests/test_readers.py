@@ -0,0 +1,154 @@
+from decimal import Decimal
+from unittest.mock import patch
+
+import orjson
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+from recipe import serializers
+from recipe.cache import get_cache
+from recipe.readers import ValuesReader
+from recipe.renderers import FastJSONRenderer
+
+RECIPES_URL = reverse("recipe:recipe-list")
+TAGS_URL = reverse("recipe:tag-list")
+INGREDIENTS_URL = reverse("recipe:ingredient-list")
+
+
+class FastReadParityTests(TestCase):
+    """Test the fast list path outputs the same bytes as the serializers"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+        self.client.force_authenticate(self.user)
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ("Vegan", "Crème brûlée", "Line\u2028break", '"')
+        ]
+        ingredients = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ("Salt", "日本酒", "Back\\slash")
+        ]
+        for i in range(7):
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=f"Recipe {i} \u2029 ü",
+                time_minutes=i * 7 % 5,
+                price=Decimal(i * 3 % 4) + Decimal("0.5"),
+                link="" if i % 2 else f"https://example.com/{i}",
+            )
+            recipe.tags.add(*tags[i % 4:])
+            recipe.ingredients.add(*ingredients[: i % 3])
+        Recipe.objects.create(
+            user=self.user, title="Plain", time_minutes=1, price=1
+        )
+
+    def get_both(self, url, params):
+        """Return the content of the response without and with fast reads"""
+        contents = []
+        for fast in (False, True):
+            get_cache().clear()
+            with override_settings(RECIPE_API_FAST_READS=fast):
+                res = self.client.get(url, params)
+            self.assertEqual(res.status_code, 200)
+            contents.append(res.content)
+        return contents
+
+    def assertParity(self, url, params=None):
+        slow, fast = self.get_both(url, params or {})
+        self.assertEqual(slow, fast)
+
+    def test_recipe_list_parity(self):
+        """Test the recipe list with the various params"""
+        for params in (
+            {},
+            {"page_size": 3},
+            {"unpaginated": 1},
+            {"ordering": "price"},
+            {"ordering": "-time_minutes", "page_size": 2},
+            {"fields": "title,tags"},
+            {"fields": "price"},
+            {"search": "Recipe"},
+            {"price_max": "2"},
+            {"format": "json"},
+        ):
+            self.assertParity(RECIPES_URL, params)
+
+    def test_recipe_list_next_page_parity(self):
+        """Test the cursors of the fast path lead to the same pages"""
+        params = {"ordering": "time_minutes", "page_size": 3}
+        slow, fast = self.get_both(RECIPES_URL, params)
+        self.assertEqual(slow, fast)
+
+        res = self.client.get(RECIPES_URL, params)
+        slow, fast = self.get_both(res.data["next"], {})
+        self.assertEqual(slow, fast)
+
+    def test_tag_and_ingredient_list_parity(self):
+        """Test the tag and ingredient lists"""
+        for url in (TAGS_URL, INGREDIENTS_URL):
+            self.assertParity(url)
+            self.assertParity(url, {"assigned_only": 1, "page_size": 2})
+
+    def test_expand_uses_serializers(self):
+        """Test nested fields are left to the serializers"""
+        serializer = serializers.RecipeSerializer(
+            context={"expand": {"tags"}}
+        )
+        self.assertFalse(ValuesReader.supports(serializer))
+        self.assertParity(RECIPES_URL, {"expand": "tags"})
+
+    def test_fast_list_queries(self):
+        """Test the fast list runs one query per relation for the page"""
+        serializer = serializers.RecipeSerializer(context={})
+        self.assertTrue(ValuesReader.supports(serializer))
+        with self.assertNumQueries(3):
+            self.client.get(RECIPES_URL)
+
+
+class FastJSONRendererTests(TestCase):
+    def assertSameBytes(self, data, media_type=None):
+        self.assertEqual(
+            FastJSONRenderer().render(data, media_type),
+            JSONRenderer().render(data, media_type),
+        )
+
+    def test_render_with_orjson(self):
+        """Test the default json is written by orjson"""
+        with patch.object(orjson, "dumps", wraps=orjson.dumps) as dumps:
+            self.assertSameBytes({"a": [1, 2]})
+
+        dumps.assert_called_once()
+
+    def test_render_parity(self):
+        """Test the renderer writes the same bytes as JSONRenderer"""
+        self.assertSameBytes(
+            {
+                "text": 'ü 日本 "quoted" \\ \n \t \u2028 \u2029 \x00',
+                "numbers": [0, -1, 2 ** 63 - 1, 1.5, 21.3, 0.1],
+                "decimal": Decimal("5.10"),
+                "nested": {"empty": [], "none": None, "bool": True},
+            }
+        )
+
+    def test_render_big_int(self):
+        """Test the json module is used for what orjson can't write"""
+        self.assertSameBytes({"big": 2 ** 70})
+
+    def test_render_indent(self):
+        """Test indented json is left to JSONRenderer"""
+        self.assertSameBytes({"a": [1, 2]}, "application/json; indent=4")
+
+    def test_render_none(self):
+        """Test an empty response has no content"""
+        self.assertEqual(FastJSONRenderer().render(None), b"")
@@ -4,18 +4,22 @@ import tempfile
 # create file name, check if file exists, etc
 import os
 
+from unittest.mock import patch
+
 # PIL: pillow requirement
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory
 
 from core.models import Recipe, Tag, Ingredient
 
+from recipe.pagination import RecipePagination
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
 
@@ -37,6 +41,15 @@ def detail_url(recipe_id):
     return reverse("recipe:recipe-detail", args=[recipe_id])
 
 
+def run_commit_hooks():
+    """Run the on_commit callbacks as if the test had committed"""
+    # a TestCase never commits, and django 2.1 has no
+    # captureOnCommitCallbacks() to run them
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, callback in callbacks:
+        callback()
+
+
 def sample_tag(user, name="Main course"):
     """Create and return a sample tag"""
     return Tag.objects.create(user=user, name=name)
@@ -57,6 +70,13 @@ def sample_recipe(user, **params):
     return Recipe.objects.create(user=user, **defaults)
 
 
+def recipe_payload(**params):
+    """Return the payload of a recipe"""
+    payload = {"title": "Sample recipe", "time_minutes": 10, "price": "5.00"}
+    payload.update(params)
+    return payload
+
+
 class PublicRecipeApiTests(TestCase):
     """Test unauthorized recipe API access"""
 
@@ -93,7 +113,7 @@ class PrivateRecipeApiTests(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         # what he sees == what's in the db
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_recipes_limited_to_user(self):
         user2 = get_user_model().objects.create_user(
@@ -108,8 +128,8 @@ class PrivateRecipeApiTests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_view_recipe_detail(self):
         """Test viewing a recipe detail"""
@@ -179,6 +199,85 @@ class PrivateRecipeApiTests(TestCase):
         self.assertIn(ingredient1, ingredients)
         self.assertIn(ingredient2, ingredients)
 
+    def test_create_recipe_with_other_users_tag(self):
+        """Test tags of other users can't be assigned"""
+        user2 = get_user_model().objects.create_user(
+            "other@londonappdev.com", "password123"
+        )
+        tag = sample_tag(user=user2, name="Fruity")
+        payload = {
+            "title": "Fruit salad",
+            "tags": [tag.id],
+            "time_minutes": 5,
+            "price": 3.00,
+        }
+
+        res = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_create_recipe_reports_all_missing_ids(self):
+        """Test every unknown id is reported in one response"""
+        tag = sample_tag(user=self.user)
+        payload = {
+            "title": "Fruit salad",
+            "tags": [tag.id, 9998, 9999],
+            "time_minutes": 5,
+            "price": 3.00,
+        }
+
+        res = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(res.data["tags"]), 2)
+
+    def test_create_recipe_ids_not_integers(self):
+        """Test ids int() would round or take from a bool are refused"""
+        tag = sample_tag(user=self.user)
+        payload = {
+            "title": "Fruit salad",
+            "tags": [tag.id + 0.5, True, str(tag.id)],
+            "time_minutes": 5,
+            "price": 3.00,
+        }
+
+        res = self.client.post(RECIPES_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            res.data["tags"],
+            [
+                "Incorrect type. Expected pk value, received float.",
+                "Incorrect type. Expected pk value, received bool.",
+            ],
+        )
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_validate_related_ids_single_query(self):
+        """Test the related ids are looked up in one query per field"""
+        tags = [sample_tag(user=self.user, name=f"Tag {i}") for i in range(5)]
+        ingredients = [
+            sample_ingredient(user=self.user, name=f"Ingredient {i}")
+            for i in range(5)
+        ]
+        request = APIRequestFactory().post(RECIPES_URL)
+        request.user = self.user
+        payload = {
+            "title": "Stew",
+            "tags": [tag.id for tag in tags],
+            "ingredients": [ingredient.id for ingredient in ingredients],
+            "time_minutes": 90,
+            "price": 8.00,
+        }
+        serializer = RecipeSerializer(
+            data=payload, context={"request": request}
+        )
+
+        with self.assertNumQueries(2):
+            self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.validated_data["tags"], tags)
+
     def test_partial_update_recipe(self):
         """Test updating a recipe with patch"""
         recipe = sample_recipe(user=self.user)
@@ -219,6 +318,162 @@ class PrivateRecipeApiTests(TestCase):
         tags = recipe.tags.all()
         self.assertEqual(len(tags), 0)
 
+    def test_list_recipes_constant_queries(self):
+        """Test listing recipes does not run a query per recipe"""
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        for _ in range(2):
+            recipe = sample_recipe(user=self.user)
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+
+        # recipes, tags and ingredients
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data["results"]), 2)
+
+        for _ in range(10):
+            recipe = sample_recipe(user=self.user)
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data["results"]), 12)
+
+    def test_list_recipes_paginated(self):
+        """Test recipes are returned one page at a time"""
+        recipe1 = sample_recipe(user=self.user, title="Recipe 1")
+        recipe2 = sample_recipe(user=self.user, title="Recipe 2")
+        recipe3 = sample_recipe(user=self.user, title="Recipe 3")
+
+        res = self.client.get(RECIPES_URL, {"page_size": 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [recipe["id"] for recipe in res.data["results"]]
+        self.assertEqual(ids, [recipe3.id, recipe2.id])
+        self.assertIsNotNone(res.data["next"])
+
+        # the next link carries the cursor and the page size
+        res = self.client.get(res.data["next"])
+
+        ids = [recipe["id"] for recipe in res.data["results"]]
+        self.assertEqual(ids, [recipe1.id])
+        self.assertIsNone(res.data["next"])
+
+    def test_list_recipes_max_page_size(self):
+        """Test the requested page size is capped"""
+        for _ in range(3):
+            sample_recipe(user=self.user)
+
+        with patch.object(RecipePagination, "max_page_size", 2):
+            res = self.client.get(RECIPES_URL, {"page_size": 100})
+
+        self.assertEqual(len(res.data["results"]), 2)
+
+    def test_list_recipes_unpaginated(self):
+        """Test the unpaginated list is returned when opted in"""
+        sample_recipe(user=self.user)
+        sample_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL, {"unpaginated": 1})
+
+        recipes = Recipe.objects.all().order_by("-id")
+        serializer = RecipeSerializer(recipes, many=True)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, serializer.data)
+
+    def test_list_recipes_unpaginated_invalid(self):
+        """Test an unpaginated flag other than 0 or 1 is refused"""
+        res = self.client.get(RECIPES_URL, {"unpaginated": "yes"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("unpaginated", res.data)
+
+    def test_filter_recipes_by_tags_unique(self):
+        """Test a recipe matching several tags is returned once"""
+        recipe = sample_recipe(user=self.user)
+        tag1 = sample_tag(user=self.user, name="Vegan")
+        tag2 = sample_tag(user=self.user, name="Dessert")
+        recipe.tags.add(tag1, tag2)
+
+        res = self.client.get(RECIPES_URL, {"tags": f"{tag1.id},{tag2.id}"})
+
+        self.assertEqual(len(res.data["results"]), 1)
+
+    def test_filter_recipes_by_all_tags(self):
+        """Test returning recipes that have every one of the tags"""
+        tag1 = sample_tag(user=self.user, name="Vegan")
+        tag2 = sample_tag(user=self.user, name="Dessert")
+        recipe1 = sample_recipe(user=self.user, title="Vegan brownies")
+        recipe1.tags.add(tag1, tag2)
+        recipe2 = sample_recipe(user=self.user, title="Chocolate mousse")
+        recipe2.tags.add(tag2)
+
+        res = self.client.get(
+            RECIPES_URL, {"tags_all": f"{tag1.id},{tag2.id}"}
+        )
+
+        ids = [recipe["id"] for recipe in res.data["results"]]
+        self.assertEqual(ids, [recipe1.id])
+
+    def test_filter_recipes_by_none_of_ingredients(self):
+        """Test excluding recipes that have any of the ingredients"""
+        ingredient1 = sample_ingredient(user=self.user, name="Peanuts")
+        ingredient2 = sample_ingredient(user=self.user, name="Milk")
+        recipe1 = sample_recipe(user=self.user, title="Satay")
+        recipe1.ingredients.add(ingredient1)
+        recipe2 = sample_recipe(user=self.user, title="Pancakes")
+        recipe2.ingredients.add(ingredient2)
+        recipe3 = sample_recipe(user=self.user, title="Fruit salad")
+
+        res = self.client.get(
+            RECIPES_URL,
+            {"ingredients_none": f"{ingredient1.id},{ingredient2.id}"},
+        )
+
+        ids = [recipe["id"] for recipe in res.data["results"]]
+        self.assertEqual(ids, [recipe3.id])
+
+    def test_filter_recipes_combined(self):
+        """Test combining tag and ingredient filters"""
+        tag = sample_tag(user=self.user, name="Dinner")
+        ingredient = sample_ingredient(user=self.user, name="Chicken")
+        recipe1 = sample_recipe(user=self.user, title="Roast chicken")
+        recipe1.tags.add(tag)
+        recipe1.ingredients.add(ingredient)
+        recipe2 = sample_recipe(user=self.user, title="Mushroom risotto")
+        recipe2.tags.add(tag)
+
+        res = self.client.get(
+            RECIPES_URL,
+            {"tags": str(tag.id), "ingredients_none": str(ingredient.id)},
+        )
+
+        ids = [recipe["id"] for recipe in res.data["results"]]
+        self.assertEqual(ids, [recipe2.id])
+
+    def test_filter_recipes_invalid_ids(self):
+        """Test filtering with ids that are not numbers fails"""
+        res = self.client.get(RECIPES_URL, {"tags_all": "1,abc"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_view_recipe_detail_constant_queries(self):
+        """Test retrieving a recipe prefetches the nested objects"""
+        recipe = sample_recipe(user=self.user)
+        for i in range(5):
+            recipe.tags.add(sample_tag(user=self.user, name=f"Tag {i}"))
+            recipe.ingredients.add(
+                sample_ingredient(user=self.user, name=f"Ingredient {i}")
+            )
+
+        # the etag, the recipe, its tags and its ingredients
+        with self.assertNumQueries(4):
+            res = self.client.get(detail_url(recipe.id))
+        self.assertEqual(len(res.data["tags"]), 5)
+        self.assertEqual(len(res.data["ingredients"]), 5)
+
 
 # add a new test class
 # there is some common functionalities in the class
@@ -258,10 +513,23 @@ class RecipeImageUploadTests(TestCase):
             # multipart: form that consists of json object
             res = self.client.post(url, {"image": ntf}, format="multipart")
         self.recipe.refresh_from_db()
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        # the resized copies are made in the background
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
         self.assertIn("image", res.data)
+        self.assertEqual(res.data["image_status"], Recipe.IMAGE_PROCESSING)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=10)
+    def test_upload_image_too_large(self):
+        """Test uploading an image larger than the limit"""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as ntf:
+            Image.new("RGB", (10, 10)).save(ntf, format="JPEG")
+            ntf.seek(0)
+            res = self.client.post(url, {"image": ntf}, format="multipart")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_upload_image_bad_request(self):
         """Test uploading an invalid image"""
         # http://localhost:8000/api/recipe/recipes/1/upload-image
@@ -285,9 +553,9 @@ class RecipeImageUploadTests(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data["results"])
+        self.assertIn(serializer2.data, res.data["results"])
+        self.assertNotIn(serializer3.data, res.data["results"])
 
     def test_filter_recipes_by_ingredients(self):
         """Test returning recipes with specific ingredients"""
@@ -306,6 +574,6 @@ class RecipeImageUploadTests(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data["results"])
+        self.assertIn(serializer2.data, res.data["results"])
+        self.assertNotIn(serializer3.data, res.data["results"])
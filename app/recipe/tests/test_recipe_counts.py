@@ -0,0 +1,200 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+from recipe.cache import get_cache
+from recipe.tests.test_recipe_api import detail_url, sample_recipe
+
+RECIPES_URL = reverse("recipe:recipe-list")
+RECIPES_BULK_URL = reverse("recipe:recipe-bulk")
+
+
+class RecipeCountTests(TestCase):
+    """Test the recipe_count of the tags follows every change"""
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+        self.vegan = Tag.objects.create(user=self.user, name="Vegan")
+        self.quick = Tag.objects.create(user=self.user, name="Quick")
+        self.curry = sample_recipe(self.user, title="Curry")
+        self.salad = sample_recipe(self.user, title="Salad")
+
+    def assertCounts(self, vegan, quick):
+        self.assertEqual(
+            [
+                Tag.objects.get(id=tag.id).recipe_count
+                for tag in (self.vegan, self.quick)
+            ],
+            [vegan, quick],
+        )
+
+    def test_add_and_remove(self):
+        """Test adding and removing tags of a recipe"""
+        self.curry.tags.add(self.vegan, self.quick)
+        # already there, not counted twice
+        self.curry.tags.add(self.vegan)
+        self.salad.tags.add(self.vegan)
+        self.assertCounts(2, 1)
+
+        # quick isn't a tag of the salad
+        self.salad.tags.remove(self.vegan, self.quick)
+        self.assertCounts(1, 1)
+
+        self.curry.tags.clear()
+        self.assertCounts(0, 0)
+
+    def test_reverse_add_and_remove(self):
+        """Test adding and removing recipes of a tag"""
+        self.vegan.recipe_set.add(self.curry, self.salad)
+        self.vegan.recipe_set.add(self.curry)
+        self.assertCounts(2, 0)
+
+        self.vegan.recipe_set.remove(self.curry)
+        self.vegan.recipe_set.remove(self.curry)
+        self.assertCounts(1, 0)
+
+        self.vegan.recipe_set.clear()
+        self.assertCounts(0, 0)
+
+    def test_set(self):
+        """Test replacing the tags of a recipe"""
+        self.curry.tags.set([self.vegan])
+        self.curry.tags.set([self.quick])
+
+        self.assertCounts(0, 1)
+
+    def test_recipe_deleted(self):
+        """Test a deleted recipe isn't counted anymore"""
+        self.curry.tags.add(self.vegan, self.quick)
+        self.salad.tags.add(self.vegan)
+
+        self.curry.delete()
+
+        self.assertCounts(1, 0)
+
+    def test_recipes_deleted_with_queryset(self):
+        """Test every recipe of a queryset delete is uncounted"""
+        self.curry.tags.add(self.vegan)
+        self.salad.tags.add(self.vegan)
+
+        Recipe.objects.filter(user=self.user).delete()
+
+        self.assertCounts(0, 0)
+
+    def test_save_keeps_count(self):
+        """Test saving a tag read earlier doesn't undo newer changes"""
+        tag = Tag.objects.get(id=self.vegan.id)
+        self.curry.tags.add(self.vegan)
+
+        tag.name = "Plant based"
+        tag.save()
+
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, "Plant based")
+        self.assertEqual(tag.recipe_count, 1)
+
+    def test_api_writes(self):
+        """Test the recipe endpoints keep the counts"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        res = client.post(
+            RECIPES_URL,
+            {
+                "title": "Tofu",
+                "time_minutes": 10,
+                "price": "5.00",
+                "tags": [self.vegan.id],
+                "tag_names": ["Quick", "Spicy"],
+            },
+            format="json",
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertCounts(1, 1)
+        self.assertEqual(Tag.objects.get(name="Spicy").recipe_count, 1)
+
+        res = client.patch(
+            detail_url(res.data["id"]),
+            {"tags": [self.quick.id]},
+            format="json",
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertCounts(0, 1)
+        self.assertEqual(Tag.objects.get(name="Spicy").recipe_count, 0)
+
+    def test_bulk_writes(self):
+        """Test a batch of recipes is counted once per recipe"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        recipe = {"time_minutes": 10, "price": "5.00"}
+
+        res = client.post(
+            RECIPES_BULK_URL,
+            [
+                {**recipe, "title": "Tofu", "tags": [self.vegan.id]},
+                {
+                    **recipe,
+                    "title": "Rice",
+                    "tags": [self.vegan.id, self.quick.id],
+                },
+            ],
+            format="json",
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertCounts(2, 1)
+
+        res = client.patch(
+            RECIPES_BULK_URL,
+            [{"id": item["id"], "tags": []} for item in res.data],
+            format="json",
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertCounts(0, 0)
+
+
+class RepairRecipeCountsTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+        self.tag = Tag.objects.create(user=self.user, name="Vegan")
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name="Tofu"
+        )
+        recipe = sample_recipe(self.user)
+        recipe.tags.add(self.tag)
+        recipe.ingredients.add(self.ingredient)
+        # eg. through rows written with raw sql
+        Tag.objects.update(recipe_count=5)
+
+    def test_repair(self):
+        """Test the wrong counts are fixed, the others left alone"""
+        out = StringIO()
+
+        call_command("repair_recipe_counts", stdout=out)
+
+        self.assertIn("tags: 1 wrong counts", out.getvalue())
+        self.assertIn("ingredients: 0 wrong counts", out.getvalue())
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, 1)
+
+    def test_dry_run(self):
+        """Test a dry run only counts the wrong ones"""
+        out = StringIO()
+
+        call_command("repair_recipe_counts", dry_run=True, stdout=out)
+
+        self.assertIn("tags: 1 wrong counts", out.getvalue())
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, 5)
@@ -0,0 +1,279 @@
+import threading
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+from recipe import bulk
+from recipe.bulk import get_or_create_named
+from recipe.tests.test_recipe_api import detail_url, recipe_payload
+
+RECIPES_URL = reverse("recipe:recipe-list")
+TAGS_URL = reverse("recipe:tag-list")
+TAGS_BULK_URL = reverse("recipe:tag-bulk")
+
+
+class RecipeNamesApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_create_recipe_with_names(self):
+        """Test the missing names are created, the others reused"""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        payload = recipe_payload(
+            tag_names=["Vegan", "Spicy", "Vegan"],
+            ingredient_names=["Tofu", "Rice"],
+        )
+
+        res = self.client.post(RECIPES_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn("tag_names", res.data)
+        recipe = Recipe.objects.get(id=res.data["id"])
+        self.assertEqual(
+            sorted(recipe.tags.values_list("name", flat=True)),
+            ["Spicy", "Vegan"],
+        )
+        self.assertIn(vegan, recipe.tags.all())
+        self.assertEqual(
+            sorted(res.data["tags"]),
+            sorted(recipe.tags.values_list("id", flat=True)),
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(recipe.ingredients.count(), 2)
+
+    def test_names_ignore_case(self):
+        """Test a name in another case finds the existing row"""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+
+        res = self.client.post(
+            RECIPES_URL,
+            recipe_payload(tag_names=["vegan", "QUICK", "Quick"]),
+            format="json",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertIn(vegan.id, res.data["tags"])
+        names = Tag.objects.filter(user=self.user).values_list(
+            "name", flat=True
+        )
+        # the first spelling given
+        self.assertEqual(sorted(names), ["QUICK", "Vegan"])
+
+    def test_names_unique_ignoring_case(self):
+        """Test the database refuses a name differing only by case"""
+        Tag.objects.create(user=self.user, name="Vegan")
+
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Tag.objects.create(user=self.user, name="VEGAN")
+
+    def test_names_of_other_users_not_reused(self):
+        """Test the names are only looked up among the user's own rows"""
+        other = get_user_model().objects.create_user(
+            "other@londonappdev.com", "testpass"
+        )
+        Tag.objects.create(user=other, name="Vegan")
+
+        res = self.client.post(
+            RECIPES_URL, recipe_payload(tag_names=["Vegan"]), format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        tag = Tag.objects.get(id=res.data["tags"][0])
+        self.assertEqual(tag.user, self.user)
+
+    def test_ids_and_names_combined(self):
+        """Test the tags are the ids given plus the names"""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        payload = recipe_payload(tags=[vegan.id], tag_names=["Quick"])
+
+        res = self.client.post(RECIPES_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data["tags"]), 2)
+
+    def test_patch_names_added(self):
+        """Test a patch with only names keeps the current tags"""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        recipe = Recipe.objects.create(
+            user=self.user, title="Curry", time_minutes=10, price=5.00
+        )
+        recipe.tags.add(vegan)
+
+        res = self.client.patch(
+            detail_url(recipe.id), {"tag_names": ["Quick"]}, format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(recipe.tags.values_list("name", flat=True)),
+            ["Quick", "Vegan"],
+        )
+
+    @skipUnlessDBFeature("can_return_ids_from_bulk_insert")
+    def test_names_resolved_in_bulk(self):
+        """Test the queries don't depend on the number of names"""
+        Tag.objects.create(user=self.user, name="Tag 0")
+        names = [f"Tag {i}" for i in range(10)]
+
+        # a savepoint around the recipe and its relations, for each
+        # relation: the names looked up, the missing ones inserted in a
+        # savepoint of their own, the through rows inserted and their
+        # recipe_count, then the tags and ingredients of the output
+        with self.assertNumQueries(17):
+            res = self.client.post(
+                RECIPES_URL,
+                recipe_payload(tag_names=names, ingredient_names=names),
+                format="json",
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data["tags"]), 10)
+        self.assertEqual(len(res.data["ingredients"]), 10)
+
+    def test_create_tag_name_taken(self):
+        """Test a tag can't be created twice with the same name"""
+        Tag.objects.create(user=self.user, name="Vegan")
+
+        res = self.client.post(TAGS_URL, {"name": "Vegan"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("name", res.data)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_create_tag_name_taken_other_case(self):
+        """Test a tag can't be created with a name differing by case"""
+        Tag.objects.create(user=self.user, name="Vegan")
+
+        res = self.client.post(TAGS_URL, {"name": "vEgAn"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_ingredient_same_name_other_user(self):
+        """Test the names are only unique per user"""
+        other = get_user_model().objects.create_user(
+            "other@londonappdev.com", "testpass"
+        )
+        Ingredient.objects.create(user=other, name="Salt")
+
+        res = self.client.post(
+            reverse("recipe:ingredient-list"), {"name": "Salt"}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_bulk_create_tags_same_name(self):
+        """Test a batch with a name twice is refused as a whole"""
+        payload = [{"name": "Vegan"}, {"name": "Vegan"}]
+
+        res = self.client.post(TAGS_BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Tag.objects.filter(user=self.user).exists())
+
+    def test_bulk_create_tags_name_taken(self):
+        """Test the taken names of a batch are refused per item"""
+        Tag.objects.create(user=self.user, name="Vegan")
+        payload = [{"name": "Quick"}, {"name": "vEgAn"}]
+
+        res = self.client.post(TAGS_BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data["errors"][0], {})
+        self.assertIn("name", res.data["errors"][1])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_bulk_update_tags_own_name(self):
+        """Test a tag of a batch can change the case of its name"""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        Tag.objects.create(user=self.user, name="Quick")
+
+        res = self.client.patch(
+            TAGS_BULK_URL, [{"id": vegan.id, "name": "VEGAN"}], format="json"
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.patch(
+            TAGS_BULK_URL, [{"id": vegan.id, "name": "quick"}], format="json"
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("name", res.data["errors"][0])
+
+    # other backends fall back to saving the tags one by one
+    @skipUnlessDBFeature("can_return_ids_from_bulk_insert")
+    def test_bulk_create_tags_queries_independent_of_size(self):
+        """Test the names of a batch are checked in one query"""
+
+        def create(count, prefix):
+            payload = [{"name": f"{prefix} {i}"} for i in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.post(TAGS_BULK_URL, payload, format="json")
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            return len(queries)
+
+        self.assertEqual(create(2, "Small"), create(20, "Large"))
+
+
+# TransactionTestCase: every thread has its own connection and
+# transaction, they only see each other's rows once committed
+@skipUnless(connection.vendor == "postgresql", "concurrent transactions")
+class ConcurrentNamesTests(TransactionTestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+
+    def test_same_names_created_concurrently(self):
+        """Test two requests creating the same names make them once"""
+        # both requests look the names up before either inserts them
+        barrier = threading.Barrier(2, timeout=10)
+        real_bulk_create = bulk.bulk_create
+        waited = threading.local()
+
+        def bulk_create(model, objs):
+            if not getattr(waited, "done", False):
+                waited.done = True
+                barrier.wait()
+            return real_bulk_create(model, objs)
+
+        results, errors = [], []
+
+        def create():
+            try:
+                with transaction.atomic():
+                    results.append(
+                        get_or_create_named(
+                            Tag, self.user.id, ["Vegan", "Quick"]
+                        )
+                    )
+            except Exception as error:  # pragma: no cover
+                errors.append(error)
+            finally:
+                connection.close()
+
+        with patch.object(bulk, "bulk_create", side_effect=bulk_create):
+            threads = [threading.Thread(target=create) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        tags = Tag.objects.filter(user=self.user)
+        self.assertEqual(tags.count(), 2)
+        expected = [tags.get(name="Vegan").id, tags.get(name="Quick").id]
+        self.assertEqual(results, [expected, expected])
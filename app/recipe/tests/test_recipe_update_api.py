@@ -0,0 +1,217 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+from recipe.cache import get_cache
+from recipe.tests.test_recipe_api import detail_url
+
+RECIPES_URL = reverse("recipe:recipe-list")
+THROUGH_TABLES = (
+    Recipe.tags.through._meta.db_table,
+    Recipe.ingredients.through._meta.db_table,
+)
+
+
+def through_writes(queries):
+    """Return the inserts and deletes on the through tables"""
+    return [
+        query["sql"]
+        for query in queries
+        if query["sql"].startswith(("INSERT", "DELETE"))
+        and any(table in query["sql"] for table in THROUGH_TABLES)
+    ]
+
+
+class RecipeUpdateApiTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+        self.client.force_authenticate(self.user)
+        self.tags = [
+            Tag.objects.create(user=self.user, name=f"Tag {i}")
+            for i in range(5)
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(user=self.user, name=f"Ingredient {i}")
+            for i in range(5)
+        ]
+        self.recipe = Recipe.objects.create(
+            user=self.user, title="Curry", time_minutes=10, price=5.00
+        )
+        self.recipe.tags.set(self.tags[:3])
+        self.recipe.ingredients.set(self.ingredients[:3])
+
+    def patch(self, payload, queries):
+        with CaptureQueriesContext(connection) as context:
+            with self.assertNumQueries(queries):
+                res = self.client.patch(detail_url(self.recipe.id), payload)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res, through_writes(context.captured_queries)
+
+    def test_unchanged_relations_not_written(self):
+        """Test the same ids only cost a read of the current rows"""
+        payload = {
+            "title": "Green curry",
+            "tags": [tag.id for tag in reversed(self.tags[:3])],
+            "ingredients": [obj.id for obj in self.ingredients[:3]],
+        }
+
+        # the recipe, the tags and ingredients checked, the savepoint,
+        # the current rows of each relation, the update of the recipe,
+        # the savepoint released, the tags and ingredients of the output
+        res, writes = self.patch(payload, 10)
+
+        self.assertEqual(writes, [])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, "Green curry")
+        self.assertEqual(
+            sorted(res.data["tags"]), [tag.id for tag in self.tags[:3]]
+        )
+
+    def test_changed_relations_one_delete_one_insert(self):
+        """Test only the difference is written, in two queries"""
+        payload = {
+            "tags": [tag.id for tag in self.tags[2:]],
+            "ingredients": [obj.id for obj in self.ingredients[:3]],
+        }
+
+        # the same as unchanged, plus a delete and an insert, and the
+        # recipe_count of the tags added and of the ones removed
+        res, writes = self.patch(payload, 14)
+
+        self.assertEqual(len(writes), 2)
+        self.assertEqual(
+            set(self.recipe.tags.values_list("id", flat=True)),
+            {tag.id for tag in self.tags[2:]},
+        )
+        self.assertEqual(self.recipe.ingredients.count(), 3)
+        counts = [
+            tag.recipe_count
+            for tag in Tag.objects.filter(user=self.user).order_by("id")
+        ]
+        self.assertEqual(counts, [0, 0, 1, 1, 1])
+
+    def test_relations_not_given_untouched(self):
+        """Test a patch without the relations doesn't read them"""
+        # the recipe, the savepoint, the update, the savepoint released,
+        # the tags and ingredients of the output
+        res, writes = self.patch({"time_minutes": 30}, 6)
+
+        self.assertEqual(writes, [])
+        self.assertEqual(self.recipe.tags.count(), 3)
+        self.assertEqual(self.recipe.ingredients.count(), 3)
+
+    def test_put_clears_relations(self):
+        """Test a put with empty lists removes every row"""
+        payload = {
+            "title": "Plain rice",
+            "time_minutes": 20,
+            "price": "2.00",
+            "tags": [],
+            "ingredients": [],
+        }
+
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.put(
+                detail_url(self.recipe.id), payload, format="json"
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(through_writes(context.captured_queries)), 2)
+        self.assertEqual(self.recipe.tags.count(), 0)
+        self.assertEqual(self.recipe.ingredients.count(), 0)
+
+    def test_put_without_relations_refused(self):
+        """Test a put leaving the relations out doesn't clear them"""
+        payload = {"title": "Plain rice", "time_minutes": 20, "price": "2.00"}
+
+        res = self.client.put(
+            detail_url(self.recipe.id), payload, format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("tags", res.data)
+        self.assertIn("ingredients", res.data)
+        self.assertEqual(self.recipe.tags.count(), 3)
+
+    def test_create_without_relations(self):
+        """Test a new recipe can leave the relations out"""
+        payload = {"title": "Plain rice", "time_minutes": 20, "price": "2.00"}
+
+        res = self.client.post(RECIPES_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data["tags"], [])
+        self.assertEqual(res.data["ingredients"], [])
+
+    def test_put_names_replace_relations(self):
+        """Test a put with only names replaces the current rows"""
+        payload = {
+            "title": "Plain rice",
+            "time_minutes": 20,
+            "price": "2.00",
+            "tag_names": ["Quick"],
+            "ingredients": [],
+        }
+
+        res = self.client.put(
+            detail_url(self.recipe.id), payload, format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            list(self.recipe.tags.values_list("name", flat=True)), ["Quick"]
+        )
+        self.assertEqual(self.recipe.ingredients.count(), 0)
+
+    def test_update_is_atomic(self):
+        """Test a failure leaves the relations and the recipe unchanged"""
+        payload = {
+            "title": "Broken",
+            "tags": [tag.id for tag in self.tags[3:]],
+        }
+
+        # Recipe.save() runs after the relations are written
+        with self.assertRaises(ValueError):
+            with patch.object(Recipe, "save", side_effect=ValueError):
+                self.client.patch(detail_url(self.recipe.id), payload)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, "Curry")
+        self.assertEqual(
+            set(self.recipe.tags.values_list("id", flat=True)),
+            {tag.id for tag in self.tags[:3]},
+        )
+
+    def test_create_inserts_relations_once(self):
+        """Test a new recipe gets its rows in one insert per relation"""
+        payload = {
+            "title": "Soup",
+            "time_minutes": 15,
+            "price": "3.00",
+            "tags": [tag.id for tag in self.tags],
+            "ingredients": [obj.id for obj in self.ingredients],
+        }
+
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        writes = through_writes(context.captured_queries)
+        self.assertEqual(len(writes), 2)
+        self.assertTrue(all(sql.startswith("INSERT") for sql in writes))
+        recipe = Recipe.objects.get(id=res.data["id"])
+        self.assertEqual(recipe.tags.count(), 5)
+        self.assertEqual(recipe.ingredients.count(), 5)
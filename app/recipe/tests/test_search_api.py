@@ -0,0 +1,111 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient
+
+from recipe.search import has_trigram
+from recipe.tests.test_recipe_api import sample_recipe
+
+RECIPES_URL = reverse("recipe:recipe-list")
+
+
+def trigram_available():
+    # called by the tests, the test database only exists by then
+    return connection.vendor == "postgresql" and has_trigram()
+
+
+class RecipeSearchApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+        self.client.force_authenticate(self.user)
+
+    def search(self, term):
+        res = self.client.get(RECIPES_URL, {"search": term})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [recipe["title"] for recipe in res.data["results"]]
+
+    def test_search_title(self):
+        """Test searching recipes by title"""
+        sample_recipe(self.user, title="Thai chicken curry")
+        sample_recipe(self.user, title="Fish and chips")
+
+        self.assertEqual(self.search("curry"), ["Thai chicken curry"])
+
+    @skipUnless(connection.vendor == "postgresql", "full text search")
+    def test_search_title_stemmed(self):
+        """Test the words of the title are matched by their stem"""
+        sample_recipe(self.user, title="Thai chicken curry")
+
+        self.assertEqual(self.search("curries"), ["Thai chicken curry"])
+
+    def test_search_title_typo(self):
+        """Test a misspelled search still finds the recipe"""
+        if not trigram_available():
+            self.skipTest("pg_trgm isn't installed")
+        sample_recipe(self.user, title="Thai chicken curry")
+
+        self.assertEqual(self.search("chiken"), ["Thai chicken curry"])
+
+    @skipUnless(connection.vendor == "postgresql", "full text search")
+    def test_trigram_checked_once(self):
+        """Test the pg_trgm extension isn't looked up for every search"""
+        self.search("curry")
+
+        with CaptureQueriesContext(connection) as queries:
+            self.search("curry")
+
+        for query in queries.captured_queries:
+            self.assertNotIn("pg_extension", query["sql"])
+
+    def test_search_ranked(self):
+        """Test title matches come before tag and ingredient matches"""
+        by_ingredient = sample_recipe(self.user, title="Stir fry")
+        by_ingredient.ingredients.add(
+            Ingredient.objects.create(user=self.user, name="Garlic")
+        )
+        by_tag = sample_recipe(self.user, title="Roast potatoes")
+        by_tag.tags.add(Tag.objects.create(user=self.user, name="Garlic"))
+        sample_recipe(self.user, title="Garlic bread")
+        sample_recipe(self.user, title="Fruit salad")
+
+        self.assertEqual(
+            self.search("garlic"),
+            ["Garlic bread", "Roast potatoes", "Stir fry"],
+        )
+
+    def test_search_own_recipes(self):
+        """Test the recipes of other users are not searched"""
+        user2 = get_user_model().objects.create_user(
+            "other@londonappdev.com", "testpass"
+        )
+        sample_recipe(user2, title="Thai chicken curry")
+        recipe = sample_recipe(self.user, title="Chicken soup")
+        recipe.tags.add(Tag.objects.create(user=user2, name="Curry"))
+
+        self.assertEqual(self.search("curry"), [])
+
+    def test_search_with_filters(self):
+        """Test searching within the filtered recipes"""
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        recipe = sample_recipe(self.user, title="Vegetable curry")
+        recipe.tags.add(tag)
+        sample_recipe(self.user, title="Chicken curry")
+
+        res = self.client.get(
+            RECIPES_URL, {"search": "curry", "tags": str(tag.id)}
+        )
+
+        titles = [recipe["title"] for recipe in res.data["results"]]
+        self.assertEqual(titles, ["Vegetable curry"])
+        self.assertIsNone(res.data["next"])
@@ -0,0 +1,131 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient
+
+from recipe.tests.test_recipe_api import detail_url, sample_recipe
+
+RECIPES_URL = reverse("recipe:recipe-list")
+
+
+def tagged_recipe(user, **params):
+    """Create a sample recipe with a tag and an ingredient"""
+    recipe = sample_recipe(user, **params)
+    # the names are unique per user
+    tag, _ = Tag.objects.get_or_create(user=user, name="Vegan")
+    ingredient, _ = Ingredient.objects.get_or_create(user=user, name="Salt")
+    recipe.tags.add(tag)
+    recipe.ingredients.add(ingredient)
+    return recipe
+
+
+class SparseFieldsApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_list_fields(self):
+        """Test only the fields asked for are output and read"""
+        recipe = tagged_recipe(self.user, title="Soup")
+        tagged_recipe(self.user, title="Salad")
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL, {"fields": "id,title"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data["results"][1], {"id": recipe.id, "title": "Soup"}
+        )
+        # no prefetch of the tags and ingredients
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]["sql"]
+        self.assertIn('"core_recipe"."title"', sql)
+        self.assertNotIn('"core_recipe"."price"', sql)
+        self.assertNotIn('"core_recipe"."link"', sql)
+
+    def test_list_fields_with_relation(self):
+        """Test a relation is only prefetched when asked for"""
+        recipe = tagged_recipe(self.user)
+
+        with self.assertNumQueries(2):
+            res = self.client.get(RECIPES_URL, {"fields": "title,tags"})
+
+        self.assertEqual(
+            res.data["results"],
+            [{"title": recipe.title, "tags": [recipe.tags.get().id]}],
+        )
+
+    def test_list_fields_ordering_pages(self):
+        """Test the cursor still works with the ordering field left out"""
+        tagged_recipe(self.user, title="Cheap", price="1.00")
+        tagged_recipe(self.user, title="Pricey", price="9.00")
+        params = {"fields": "title", "ordering": "price", "page_size": 1}
+
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPES_URL, params)
+        res = self.client.get(res.data["next"])
+
+        self.assertEqual(res.data["results"], [{"title": "Pricey"}])
+
+    def test_list_expand(self):
+        """Test nesting the tags and ingredients of the list"""
+        recipe = tagged_recipe(self.user)
+        tag = recipe.tags.get()
+
+        res = self.client.get(RECIPES_URL, {"expand": "tags"})
+
+        item = res.data["results"][0]
+        self.assertEqual(item["tags"], [{"id": tag.id, "name": tag.name}])
+        self.assertEqual(
+            item["ingredients"], [recipe.ingredients.get().id]
+        )
+
+    def test_detail_fields(self):
+        """Test the detail of a recipe with a sparse fieldset"""
+        recipe = tagged_recipe(self.user)
+        ingredient = recipe.ingredients.get()
+
+        # the etag, the recipe and its ingredients, not its tags
+        with self.assertNumQueries(3):
+            res = self.client.get(
+                detail_url(recipe.id), {"fields": "title,ingredients"}
+            )
+
+        self.assertEqual(
+            res.data,
+            {
+                "title": recipe.title,
+                "ingredients": [
+                    {"id": ingredient.id, "name": ingredient.name}
+                ],
+            },
+        )
+
+    def test_unknown_fields(self):
+        """Test asking for unknown fields returns an error"""
+        for param, value in (("fields", "id,user"), ("expand", "price")):
+            res = self.client.get(RECIPES_URL, {param: value})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(param, res.data)
+
+    def test_write_ignores_fields(self):
+        """Test the response of a write always has every field"""
+        recipe = tagged_recipe(self.user)
+
+        res = self.client.patch(
+            f"{detail_url(recipe.id)}?fields=id", {"title": "New"}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["title"], "New")
+        self.assertIn("price", res.data)
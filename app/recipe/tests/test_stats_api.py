@@ -0,0 +1,130 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient
+
+from recipe.cache import get_cache
+from recipe.tests.test_recipe_api import run_commit_hooks, sample_recipe
+
+STATS_URL = reverse("recipe:recipe-stats")
+
+
+class RecipeStatsApiTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_stats_empty(self):
+        """Test the statistics of a user without recipes"""
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["count"], 0)
+        self.assertIsNone(res.data["time_minutes"]["avg"])
+        self.assertEqual(res.data["price"]["histogram"], [])
+        self.assertEqual(res.data["tags"], [])
+
+    def test_stats_summary_and_histograms(self):
+        """Test the averages and the histogram buckets"""
+        sample_recipe(self.user, time_minutes=5, price="4.99")
+        sample_recipe(self.user, time_minutes=14, price="5.00")
+        sample_recipe(self.user, time_minutes=45, price="12.35")
+        other = get_user_model().objects.create_user(
+            "other@londonappdev.com", "password123"
+        )
+        sample_recipe(other, time_minutes=100, price="100.00")
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data["count"], 3)
+        time_minutes = res.data["time_minutes"]
+        self.assertEqual((time_minutes["min"], time_minutes["max"]), (5, 45))
+        self.assertEqual(time_minutes["avg"], 21.3)
+        self.assertEqual(
+            time_minutes["histogram"],
+            [
+                {"start": 0, "end": 15, "count": 2},
+                {"start": 45, "end": 60, "count": 1},
+            ],
+        )
+        price = res.data["price"]
+        self.assertEqual(
+            (price["min"], price["max"], price["avg"]),
+            ("4.99", "12.35", "7.45"),
+        )
+        self.assertEqual(
+            price["histogram"],
+            [
+                {"start": "0.00", "end": "5.00", "count": 1},
+                {"start": "5.00", "end": "10.00", "count": 1},
+                {"start": "10.00", "end": "15.00", "count": 1},
+            ],
+        )
+
+    def test_stats_relation_counts(self):
+        """Test the number of recipes of every tag and ingredient"""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        dessert = Tag.objects.create(user=self.user, name="Dessert")
+        salt = Ingredient.objects.create(user=self.user, name="Salt")
+        sample_recipe(self.user).tags.add(vegan, dessert)
+        sample_recipe(self.user).tags.add(vegan)
+        sample_recipe(self.user).ingredients.add(salt)
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(
+            res.data["tags"],
+            [
+                {"id": vegan.id, "name": "Vegan", "count": 2},
+                {"id": dessert.id, "name": "Dessert", "count": 1},
+            ],
+        )
+        self.assertEqual(
+            res.data["ingredients"],
+            [{"id": salt.id, "name": "Salt", "count": 1}],
+        )
+
+    def test_stats_filtered(self):
+        """Test the statistics only cover the filtered recipes"""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        sample_recipe(self.user, time_minutes=20).tags.add(vegan)
+        sample_recipe(self.user, time_minutes=60)
+
+        res = self.client.get(STATS_URL, {"tags": vegan.id})
+
+        self.assertEqual(res.data["count"], 1)
+        self.assertEqual(res.data["time_minutes"]["max"], 20)
+
+    def test_stats_query_count(self):
+        """Test the statistics are computed in a fixed number of queries"""
+        for i in range(5):
+            sample_recipe(self.user).tags.add(
+                Tag.objects.create(user=self.user, name=f"Tag {i}")
+            )
+
+        # aggregate, 2 histograms, tag and ingredient counts
+        with self.assertNumQueries(5):
+            self.client.get(STATS_URL)
+
+    def test_stats_cached_until_change(self):
+        """Test the statistics are cached and invalidated on write"""
+        sample_recipe(self.user)
+        self.client.get(STATS_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(STATS_URL)
+        self.assertEqual(res.data["count"], 1)
+
+        sample_recipe(self.user)
+        run_commit_hooks()
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data["count"], 2)
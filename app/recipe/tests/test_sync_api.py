@@ -0,0 +1,179 @@
+import io
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Tombstone
+
+from recipe.sync import decode_token, encode_token
+from recipe.tests.test_recipe_api import sample_recipe
+
+SYNC_URL = reverse("recipe:sync")
+
+
+@override_settings(RECIPE_SYNC_MARGIN=0)
+class SyncApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass"
+        )
+        self.client.force_authenticate(self.user)
+
+    def sync(self, token=None):
+        res = self.client.get(SYNC_URL, {"since": token} if token else {})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def updated_ids(self, data, name):
+        return [item["id"] for item in data[name]["updated"]]
+
+    def test_sync_requires_login(self):
+        """Test the sync is only for authenticated users"""
+        res = APIClient().get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_full_sync(self):
+        """Test a first sync returns all the data of the user"""
+        recipe = sample_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        recipe.tags.add(tag)
+        other = get_user_model().objects.create_user(
+            "other@londonappdev.com", "password123"
+        )
+        sample_recipe(other)
+
+        data = self.sync()
+
+        self.assertTrue(data["full"])
+        self.assertEqual(
+            data["recipes"]["updated"],
+            [
+                {
+                    "id": recipe.id,
+                    "title": recipe.title,
+                    "ingredients": [],
+                    "tags": [tag.id],
+                    "time_minutes": 10,
+                    "price": "5.00",
+                    "link": "",
+                }
+            ],
+        )
+        self.assertEqual(
+            data["tags"]["updated"], [{"id": tag.id, "name": "Vegan"}]
+        )
+        self.assertEqual(data["ingredients"], {"updated": [], "deleted": []})
+
+    def test_sync_changes_only(self):
+        """Test a sync returns only what changed since the token"""
+        unchanged = sample_recipe(self.user, title="Unchanged")
+        changed = sample_recipe(self.user, title="Changed")
+        deleted = sample_recipe(self.user, title="Deleted")
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        token = self.sync()["token"]
+
+        changed.title = "New title"
+        changed.save()
+        deleted_id = deleted.id
+        deleted.delete()
+        new = Ingredient.objects.create(user=self.user, name="Salt")
+        data = self.sync(token)
+
+        self.assertFalse(data["full"])
+        self.assertEqual(self.updated_ids(data, "recipes"), [changed.id])
+        self.assertEqual(data["recipes"]["deleted"], [deleted_id])
+        self.assertEqual(self.updated_ids(data, "ingredients"), [new.id])
+        self.assertEqual(data["tags"], {"updated": [], "deleted": []})
+        self.assertNotIn(unchanged.id, self.updated_ids(data, "recipes"))
+        self.assertNotIn(tag.id, self.updated_ids(data, "tags"))
+
+    def test_sync_relation_changes(self):
+        """Test recipes come back when their tags or ingredients change"""
+        recipe = sample_recipe(self.user)
+        other = sample_recipe(self.user, title="Other")
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        other.tags.add(tag)
+        token = self.sync()["token"]
+
+        recipe.tags.add(tag)
+        data = self.sync(token)
+        self.assertEqual(self.updated_ids(data, "recipes"), [recipe.id])
+        self.assertEqual(data["recipes"]["updated"][0]["tags"], [tag.id])
+
+        token, tag_id = data["token"], tag.id
+        tag.delete()
+        data = self.sync(token)
+        self.assertEqual(
+            self.updated_ids(data, "recipes"), [recipe.id, other.id]
+        )
+        self.assertEqual(data["tags"]["deleted"], [tag_id])
+
+    def test_sync_queries_independent_of_size(self):
+        """Test the cost of a sync depends on the changes only"""
+        token = self.sync()["token"]
+        for i in range(10):
+            sample_recipe(self.user, title=f"Recipe {i}")
+
+        # per model: the changes and the tombstones, plus the tags
+        # and ingredients of the changed recipes
+        with self.assertNumQueries(8):
+            self.sync(token)
+
+    def test_sync_old_token(self):
+        """Test a token older than the tombstones gets a full sync"""
+        sample_recipe(self.user)
+        old = timezone.now() - timedelta(days=31)
+
+        data = self.sync(encode_token(old))
+
+        self.assertTrue(data["full"])
+        self.assertEqual(len(data["recipes"]["updated"]), 1)
+
+    def test_sync_invalid_token(self):
+        """Test an invalid token returns an error"""
+        res = self.client.get(SYNC_URL, {"since": "yesterday"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_token_round_trip(self):
+        """Test the token keeps the moment to the microsecond"""
+        moment = timezone.now()
+
+        self.assertEqual(decode_token(encode_token(moment)), moment)
+
+    @override_settings(RECIPE_SYNC_MARGIN=60)
+    def test_token_margin(self):
+        """Test the token leaves a margin for the late commits"""
+        token = self.sync()["token"]
+
+        margin = timezone.now() - decode_token(token)
+
+        self.assertGreaterEqual(margin, timedelta(seconds=60))
+
+    def test_clear_tombstones(self):
+        """Test the old tombstones and the ones of deleted users go"""
+        sample_recipe(self.user).delete()
+        old = sample_recipe(self.user)
+        old_id = old.id
+        old.delete()
+        Tombstone.objects.filter(object_id=old_id).update(
+            deleted_at=timezone.now() - timedelta(days=31)
+        )
+        other = get_user_model().objects.create_user(
+            "other@londonappdev.com", "password123"
+        )
+        sample_recipe(other)
+        other.delete()
+
+        call_command("clear_tombstones", stdout=io.StringIO())
+
+        self.assertEqual(Tombstone.objects.count(), 1)
@@ -1,4 +1,7 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.test import TestCase
 
@@ -7,7 +10,9 @@ from rest_framework.test import APIClient
 
 from core.models import Tag, Recipe
 
+from recipe.cache import get_user_version
 from recipe.serializers import TagSerializer
+from recipe.tests.test_recipe_api import run_commit_hooks
 
 TAGS_URL = reverse("recipe:tag-list")
 
@@ -29,6 +34,8 @@ class PrivateTagsApiTest(TestCase):
     """Test the authorized user tags API"""
 
     def setUp(self):
+        # cached responses would leak between the tests
+        cache.clear()
         self.user = get_user_model().objects.create_user(
             "test@londonappdev.com", "password123"
         )
@@ -45,7 +52,7 @@ class PrivateTagsApiTest(TestCase):
         tags = Tag.objects.all().order_by("-name")
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_tags_limited_to_user(self):
         """Test that tags returned are for the authenticated user"""
@@ -58,8 +65,8 @@ class PrivateTagsApiTest(TestCase):
         res = self.client.get(TAGS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]["name"], tag.name)
+        self.assertEqual(len(res.data["results"]), 1)
+        self.assertEqual(res.data["results"][0]["name"], tag.name)
 
     def test_create_tag_successful(self):
         """Test creating a new tag"""
@@ -97,9 +104,9 @@ class PrivateTagsApiTest(TestCase):
 
         serializer1 = TagSerializer(tag1)
         serializer2 = TagSerializer(tag2)
-        # res.data is a list
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        # res.data["results"] is a list
+        self.assertIn(serializer1.data, res.data["results"])
+        self.assertNotIn(serializer2.data, res.data["results"])
 
     def test_retrieve_tags_assigned_unique(self):
         """Test filtering tags by assigned returns unique items"""
@@ -116,4 +123,198 @@ class PrivateTagsApiTest(TestCase):
 
         res = self.client.get(TAGS_URL, {"assigned_only": 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data["results"]), 1)
+
+    def test_retrieve_tags_assigned_without_join(self):
+        """Test assigned_only reads the stored counts of the tags"""
+        tag = Tag.objects.create(user=self.user, name="Breakfast")
+        for title in ("Pancakes", "Porridge", "Toast"):
+            Recipe.objects.create(
+                title=title, time_minutes=5, price=3.00, user=self.user
+            ).tags.add(tag)
+
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(TAGS_URL, {"assigned_only": 1})
+
+        self.assertEqual(len(res.data["results"]), 1)
+        (sql,) = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith("SELECT")
+        ]
+        self.assertIn("recipe_count", sql)
+        self.assertNotIn("core_recipe_tags", sql)
+        self.assertNotIn("DISTINCT", sql)
+
+    def test_retrieve_tags_with_counts(self):
+        """Test with_counts adds the number of recipes of each tag"""
+        breakfast = Tag.objects.create(user=self.user, name="Breakfast")
+        lunch = Tag.objects.create(user=self.user, name="Lunch")
+        Tag.objects.create(user=self.user, name="Dinner")
+        for title in ("Pancakes", "Porridge"):
+            Recipe.objects.create(
+                title=title, time_minutes=5, price=3.00, user=self.user
+            ).tags.add(breakfast)
+        Recipe.objects.create(
+            title="Pancakes", time_minutes=5, price=3.00, user=self.user
+        ).tags.add(breakfast, lunch)
+
+        def counts(params):
+            res = self.client.get(TAGS_URL, params)
+            return {
+                tag["name"]: tag["recipe_count"]
+                for tag in res.data["results"]
+            }
+
+        self.assertEqual(
+            counts({"with_counts": 1}),
+            {"Breakfast": 3, "Lunch": 1, "Dinner": 0},
+        )
+        self.assertEqual(
+            counts({"with_counts": 1, "assigned_only": 1}),
+            {"Breakfast": 3, "Lunch": 1},
+        )
+
+    def test_retrieve_tags_invalid_flags(self):
+        """Test flags other than 0 or 1 are refused"""
+        for param in ("with_counts", "assigned_only"):
+            res = self.client.get(TAGS_URL, {param: "abc"})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(param, res.data)
+
+    def test_retrieve_tags_without_counts(self):
+        """Test the counts are only output when asked for"""
+        Tag.objects.create(user=self.user, name="Breakfast")
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertNotIn("recipe_count", res.data["results"][0])
+
+    def test_retrieve_tags_by_popularity(self):
+        """Test ordering the tags by their number of recipes"""
+        counts = {"Breakfast": 2, "Lunch": 0, "Dinner": 1, "Snack": 1}
+        for name, count in counts.items():
+            tag = Tag.objects.create(user=self.user, name=name)
+            for _ in range(count):
+                Recipe.objects.create(
+                    title=name, time_minutes=5, price=3.00, user=self.user
+                ).tags.add(tag)
+        ids = dict(Tag.objects.values_list("name", "id"))
+
+        res = self.client.get(
+            TAGS_URL, {"ordering": "-recipe_count", "page_size": 2}
+        )
+
+        names = [tag["name"] for tag in res.data["results"]]
+        # the same count: the newest first
+        self.assertEqual(names, ["Breakfast", "Snack"])
+
+        res = self.client.get(res.data["next"])
+
+        names = [tag["name"] for tag in res.data["results"]]
+        self.assertEqual(names, ["Dinner", "Lunch"])
+        self.assertGreater(ids["Snack"], ids["Dinner"])
+
+        res = self.client.get(TAGS_URL, {"ordering": "recipe_count"})
+
+        names = [tag["name"] for tag in res.data["results"]]
+        self.assertEqual(names, ["Lunch", "Dinner", "Snack", "Breakfast"])
+
+    def test_retrieve_tags_invalid_ordering(self):
+        """Test the tags can only be sorted by name or popularity"""
+        res = self.client.get(TAGS_URL, {"ordering": "updated_at"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("ordering", res.data)
+
+    def test_retrieve_tags_paginated(self):
+        """Test tags are paginated in descending name order"""
+        Tag.objects.create(user=self.user, name="Breakfast")
+        Tag.objects.create(user=self.user, name="Lunch")
+        Tag.objects.create(user=self.user, name="Dinner")
+
+        res = self.client.get(TAGS_URL, {"page_size": 2})
+
+        names = [tag["name"] for tag in res.data["results"]]
+        self.assertEqual(names, ["Lunch", "Dinner"])
+
+        res = self.client.get(res.data["next"])
+
+        names = [tag["name"] for tag in res.data["results"]]
+        self.assertEqual(names, ["Breakfast"])
+        self.assertIsNone(res.data["next"])
+
+    def test_retrieve_tags_unpaginated(self):
+        """Test tags are returned as a plain list when opted in"""
+        Tag.objects.create(user=self.user, name="Vegan")
+
+        res = self.client.get(TAGS_URL, {"unpaginated": 1})
+
+        serializer = TagSerializer(Tag.objects.all(), many=True)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, serializer.data)
+
+    def test_retrieve_tags_cached(self):
+        """Test the tag list is served from the cache"""
+        Tag.objects.create(user=self.user, name="Vegan")
+        self.client.get(TAGS_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(len(res.data["results"]), 1)
+
+    def test_create_tag_invalidates_cache(self):
+        """Test creating a tag refreshes the cached list"""
+        self.client.get(TAGS_URL)
+
+        self.client.post(TAGS_URL, {"name": "Vegan"})
+        run_commit_hooks()
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(len(res.data["results"]), 1)
+
+    def test_cache_invalidated_on_commit(self):
+        """Test the cache version only changes once the write commits"""
+        # before, a request could cache the old rows under the new one
+        version = get_user_version(self.user.id)
+
+        Tag.objects.create(user=self.user, name="Vegan")
+
+        self.assertEqual(get_user_version(self.user.id), version)
+        run_commit_hooks()
+        self.assertNotEqual(get_user_version(self.user.id), version)
+
+    def test_assign_tag_invalidates_cache(self):
+        """Test assigning a tag to a recipe refreshes assigned_only"""
+        tag = Tag.objects.create(user=self.user, name="Breakfast")
+        recipe = Recipe.objects.create(
+            title="Pancakes", time_minutes=5, price=3.00, user=self.user
+        )
+        res = self.client.get(TAGS_URL, {"assigned_only": 1})
+        self.assertEqual(len(res.data["results"]), 0)
+
+        recipe.tags.add(tag)
+        run_commit_hooks()
+        res = self.client.get(TAGS_URL, {"assigned_only": 1})
+        self.assertEqual(len(res.data["results"]), 1)
+
+        recipe.tags.remove(tag)
+        run_commit_hooks()
+        res = self.client.get(TAGS_URL, {"assigned_only": 1})
+        self.assertEqual(len(res.data["results"]), 0)
+
+    def test_tags_cache_limited_to_user(self):
+        """Test users never get each other's cached tags"""
+        user2 = get_user_model().objects.create_user(
+            "other@londonappdev.com", "testpass"
+        )
+        Tag.objects.create(user=user2, name="Fruity")
+        Tag.objects.create(user=self.user, name="Comfort Food")
+        self.client.get(TAGS_URL)
+
+        self.client.force_authenticate(user2)
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.data["results"][0]["name"], "Fruity")
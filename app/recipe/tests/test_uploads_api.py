@@ -0,0 +1,253 @@
+import fcntl
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from PIL import Image
+
+from core.models import ImageUpload, Recipe
+
+from recipe import uploads
+from recipe.uploads import partial_path, receive
+
+UPLOADS_URL = reverse("recipe:imageupload-list")
+CONTENT_TYPE = "application/offset+octet-stream"
+
+
+def upload_url(upload_id):
+    """Return URL for a resumable upload"""
+    return reverse("recipe:imageupload-detail", args=[upload_id])
+
+
+def sample_png(size=(300, 200)):
+    """Return the bytes of a png image that doesn't compress well"""
+    image = Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class ChunkedStream:
+    """Stream remembering the size of the reads"""
+
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+        self.reads = []
+
+    def read(self, size):
+        self.reads.append(size)
+        return self.data.read(size)
+
+
+class ImageUploadApiTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.upload_dir = tempfile.mkdtemp()
+        self.settings = override_settings(
+            MEDIA_ROOT=self.media_root,
+            RECIPE_IMAGE_UPLOAD_DIR=self.upload_dir,
+            RECIPE_IMAGE_HEADER_SIZE=1024,
+            RECIPE_IMAGE_UPLOAD_CHUNK_SIZE=4096,
+        )
+        self.settings.enable()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@londonappdev.com", "testpass"
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title="Sample recipe", time_minutes=10, price=5
+        )
+        self.image = sample_png()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+        shutil.rmtree(self.upload_dir)
+
+    def start(self, length=None):
+        length = len(self.image) if length is None else length
+        res = self.client.post(
+            UPLOADS_URL, {"recipe": self.recipe.id, "length": length}
+        )
+        return res
+
+    def send(self, upload_id, offset, data):
+        return self.client.patch(
+            upload_url(upload_id),
+            data,
+            content_type=CONTENT_TYPE,
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_start_upload(self):
+        """Test starting an upload"""
+        res = self.start()
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data["offset"], 0)
+        self.assertEqual(res.data["length"], len(self.image))
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=1000)
+    def test_start_upload_too_large(self):
+        """Test an upload larger than the limit is refused upfront"""
+        res = self.start(length=1001)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ImageUpload.objects.exists())
+
+    def test_start_upload_other_users_recipe(self):
+        """Test uploading to the recipe of another user is refused"""
+        user2 = get_user_model().objects.create_user(
+            "other@londonappdev.com", "testpass"
+        )
+        self.recipe = Recipe.objects.create(
+            user=user2, title="Other recipe", time_minutes=10, price=5
+        )
+
+        res = self.start()
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_in_chunks(self):
+        """Test an upload sent in two requests becomes the recipe image"""
+        upload_id = self.start().data["id"]
+        half = len(self.image) // 2
+
+        res = self.send(upload_id, 0, self.image[:half])
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(res["Upload-Offset"], str(half))
+
+        res = self.send(upload_id, half, self.image[half:])
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data["image_status"], Recipe.IMAGE_PROCESSING)
+        self.recipe.refresh_from_db()
+        with open(self.recipe.image.path, "rb") as image:
+            self.assertEqual(image.read(), self.image)
+        self.assertFalse(ImageUpload.objects.exists())
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+    def test_resume_upload(self):
+        """Test the offset to resume from is returned"""
+        upload_id = self.start().data["id"]
+        self.send(upload_id, 0, self.image[:2000])
+
+        res = self.client.head(upload_url(upload_id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res["Upload-Offset"], "2000")
+
+    def test_upload_wrong_offset(self):
+        """Test bytes sent at the wrong offset are refused"""
+        upload_id = self.start().data["id"]
+        self.send(upload_id, 0, self.image[:2000])
+
+        res = self.send(upload_id, 1000, self.image[1000:])
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
+    def test_upload_busy(self):
+        """Test a second request can't write to an upload at once"""
+        upload_id = self.start().data["id"]
+        upload = ImageUpload.objects.get(id=upload_id)
+
+        with open(partial_path(upload), "ab") as partial:
+            fcntl.flock(partial, fcntl.LOCK_EX)
+            res = self.send(upload_id, 0, self.image[:2000])
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(os.path.getsize(partial_path(upload)), 0)
+
+    def test_body_received_outside_transaction(self):
+        """Test no transaction is kept open while the body arrives"""
+        upload_id = self.start().data["id"]
+        # the transactions of the test itself
+        depth = len(connection.savepoint_ids)
+        depths = []
+        real_receive = uploads.receive
+
+        def receive(upload, stream):
+            depths.append(len(connection.savepoint_ids))
+            return real_receive(upload, stream)
+
+        with patch.object(uploads, "receive", side_effect=receive):
+            res = self.send(upload_id, 0, self.image)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(depths, [depth])
+
+    def test_upload_not_an_image(self):
+        """Test a file that isn't an image is refused from its start"""
+        self.image = b"x" * 5000
+        upload_id = self.start().data["id"]
+
+        res = self.send(upload_id, 0, self.image[:2000])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ImageUpload.objects.exists())
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=100 * 100)
+    def test_upload_too_many_pixels(self):
+        """Test the dimensions are checked from the start of the file"""
+        upload_id = self.start().data["id"]
+
+        res = self.send(upload_id, 0, self.image[:2000])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ImageUpload.objects.exists())
+
+    def test_upload_longer_than_length(self):
+        """Test sending more bytes than announced is refused"""
+        upload_id = self.start(length=2000).data["id"]
+
+        res = self.send(upload_id, 0, self.image[:3000])
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_receive_reads_chunks(self):
+        """Test the body is read a chunk at a time"""
+        upload = ImageUpload.objects.create(
+            user=self.user, recipe=self.recipe, length=len(self.image)
+        )
+        stream = ChunkedStream(self.image)
+
+        offset = receive(upload, stream)
+
+        self.assertEqual(offset, len(self.image))
+        self.assertGreater(len(stream.reads), 10)
+        self.assertEqual(set(stream.reads), {4096})
+        self.assertEqual(upload.format, "png")
+        self.assertEqual(os.path.getsize(partial_path(upload)), offset)
+
+    def test_clear_image_uploads(self):
+        """Test the abandoned uploads are deleted"""
+        upload_id = self.start().data["id"]
+        self.send(upload_id, 0, self.image[:2000])
+        recent_id = self.start().data["id"]
+        ImageUpload.objects.filter(id=upload_id).update(
+            created=ImageUpload.objects.get(id=upload_id).created
+            - timedelta(days=2)
+        )
+
+        call_command("clear_image_uploads", stdout=io.StringIO())
+
+        uploads = ImageUpload.objects.all()
+        self.assertEqual([str(upload.id) for upload in uploads], [recent_id])
+        self.assertEqual(os.listdir(self.upload_dir), [])
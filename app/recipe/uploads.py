@@ -0,0 +1,167 @@
+import fcntl
+import io
+import os
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+
+from PIL import Image
+
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from recipe.images import DECODE_ERRORS, set_image
+
+# resumable uploads, the body of the requests is never parsed
+# POST   /api/recipe/image-uploads/  {"recipe": 1, "length": 123456}
+#        starts an upload of `length` bytes for the recipe
+# PATCH  /api/recipe/image-uploads/<id>/  with the raw bytes as body
+#        and an Upload-Offset header: the number of bytes already sent
+# HEAD   /api/recipe/image-uploads/<id>/  tells in its Upload-Offset
+#        header where to resume after an interrupted PATCH
+# the body is read and written to disk a chunk at a time, so the
+# memory used doesn't depend on the size of the file
+# the type and the dimensions of the image are checked as soon as its
+# first RECIPE_IMAGE_HEADER_SIZE bytes arrived, without decoding it
+# once all the bytes are there the file becomes the recipe image
+# one request at a time writes to an upload, it holds a lock on the
+# file rather than on the row: the body may take minutes to arrive on a
+# slow client, a transaction kept open that long would tie up a
+# connection and block everyone else writing to the upload
+
+# the first bytes of every supported format
+SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+)
+NOT_AN_IMAGE = "Upload a valid image. The file isn't a JPEG, PNG, GIF or WebP."
+NO_SIZE = "Upload a valid image. The size of the image could not be read."
+TOO_MANY_PIXELS = "Ensure the image has no more than {max_pixels} pixels."
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "The upload is larger than its declared length."
+    default_code = "too_large"
+
+
+class OffsetConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Upload-Offset doesn't match the bytes received."
+    default_code = "offset_conflict"
+
+
+class UploadBusy(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Another request is writing to the upload."
+    default_code = "upload_busy"
+
+
+def partial_path(upload):
+    """Return the path of the unfinished file of an upload"""
+    return os.path.join(settings.RECIPE_IMAGE_UPLOAD_DIR, f"{upload.id}.part")
+
+
+def received(upload):
+    """Return the number of bytes of the upload stored so far"""
+    # the file itself is the reference, it is right even when
+    # a request died half way through
+    try:
+        return os.path.getsize(partial_path(upload))
+    except FileNotFoundError:
+        return 0
+
+
+@contextmanager
+def writing(upload):
+    """Hold the upload for the request writing to it"""
+    with open(partial_path(upload), "ab") as partial:
+        try:
+            # released when the file is closed, even if the request dies
+            fcntl.flock(partial, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadBusy()
+        yield
+
+
+def sniff(head):
+    """Return the format of an image from its first bytes"""
+    for signature, fmt in SIGNATURES:
+        if head.startswith(signature):
+            return fmt
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def check_header(head):
+    """Validate the first bytes of an image and return its format"""
+    fmt = sniff(head)
+    if fmt is None:
+        raise ValidationError(NOT_AN_IMAGE)
+    try:
+        # open() only parses the header, the pixels aren't decoded
+        image = Image.open(io.BytesIO(head))
+    except DECODE_ERRORS:
+        raise ValidationError(NO_SIZE)
+    if image.format != fmt:
+        raise ValidationError(NOT_AN_IMAGE)
+
+    width, height = image.size
+    max_pixels = settings.RECIPE_IMAGE_MAX_PIXELS
+    if width * height > max_pixels:
+        raise ValidationError(TOO_MANY_PIXELS.format(max_pixels=max_pixels))
+    return fmt.lower()
+
+
+def receive(upload, stream):
+    """Append the body of a request to the upload, return the offset"""
+    header_size = settings.RECIPE_IMAGE_HEADER_SIZE
+    chunk_size = settings.RECIPE_IMAGE_UPLOAD_CHUNK_SIZE
+    path = partial_path(upload)
+    offset = received(upload)
+    head = b""
+    if not upload.format and offset:
+        # resumed before the start of the file could be checked
+        with open(path, "rb") as partial:
+            head = partial.read(header_size)
+
+    with open(path, "ab") as partial:
+        # stream is None when the body is empty
+        read = stream.read if stream is not None else (lambda size: b"")
+        for chunk in iter(lambda: read(chunk_size), b""):
+            if offset + len(chunk) > upload.length:
+                raise UploadTooLarge()
+            partial.write(chunk)
+            offset += len(chunk)
+
+            if not upload.format:
+                head += chunk[: header_size - len(head)]
+                if len(head) == header_size or offset == upload.length:
+                    upload.format = check_header(head)
+                    upload.save(update_fields=["format"])
+                    head = b""
+
+    return offset
+
+
+def discard(upload):
+    """Delete an upload and its unfinished file"""
+    try:
+        os.remove(partial_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def complete(upload):
+    """Make the finished upload the image of its recipe"""
+    with open(partial_path(upload), "rb") as partial:
+        recipe = set_image(
+            upload.recipe, File(partial), f"upload.{upload.format}"
+        )
+    discard(upload)
+    return recipe
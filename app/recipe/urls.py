@@ -10,7 +10,12 @@ router = DefaultRouter()
 router.register("tags", views.TagViewSet)
 router.register("ingredients", views.IngredientViewSet)
 router.register("recipes", views.RecipeViewSet)
+router.register("image-uploads", views.ImageUploadViewSet)
 
 app_name = "recipe"
 
-urlpatterns = [path("", include(router.urls))]
+urlpatterns = [
+    # /api/recipe/sync/?since=...
+    path("sync/", views.SyncView.as_view(), name="sync"),
+    path("", include(router.urls)),
+]
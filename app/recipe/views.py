@@ -1,12 +1,58 @@
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 
-from core.models import Tag, Ingredient, Recipe
+from core.models import Tag, Ingredient, Recipe, ImageUpload
+
+from user.authentication import CachedTokenAuthentication
 
 from recipe import serializers
+from recipe.bulk import BulkModelMixin
+from recipe.cache import get_cache, response_cache_key
+from recipe.conditional import collection_etag, conditional, recipe_etag
+from recipe.coverage import get_index
+from recipe.filters import (
+    ATTR_ORDERING_FIELDS,
+    ATTR_UNIQUE_FIELDS,
+    DEFAULT_ATTR_ORDERING,
+    DEFAULT_ORDERING,
+    filter_recipes,
+    get_ordering,
+    params_to_bool,
+    params_to_ints,
+    params_to_names,
+)
+from recipe.images import set_image
+from recipe.pagination import (
+    RecipeAttrPagination,
+    RecipePagination,
+    SearchPagination,
+)
+from recipe.readers import FastListMixin
+from recipe.search import search_recipes
+from recipe.stats import recipe_stats
+from recipe.sync import decode_token, sync
+from recipe import uploads
+
+# fields of RecipeSerializer that can be asked for with ?fields=
+# (not the write only ones, eg. tag_names)
+RECIPE_FIELDS = tuple(
+    name
+    for name in serializers.RecipeSerializer.Meta.fields
+    if name not in serializers.RecipeSerializer.relation_fields.values()
+)
+# and the relations that can be nested with ?expand=
+RECIPE_RELATIONS = {"tags": Tag, "ingredients": Ingredient}
 
 # https://github.com/encode/django-rest-framework/tree/master/rest_framework
 # https://github.com/encode/django-rest-framework/blob/master/rest_framework/mixins.py
@@ -14,40 +60,68 @@ from recipe import serializers
 
 
 class BaseRecipeAttrViewSet(
-    viewsets.GenericViewSet, mixins.ListModelMixin, mixins.CreateModelMixin
+    viewsets.GenericViewSet,
+    FastListMixin,
+    mixins.ListModelMixin,
+    mixins.CreateModelMixin,
+    BulkModelMixin,
 ):
     """Base viewset for user owned recipe attributes"""
 
     # so that django knows what is the user ie. request.user
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     # so that django knows whether the client is permitted
     # to view the items
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeAttrPagination
 
     def get_queryset(self):
         """Return objects for the current authenticated user only"""
         # whatever we return here will be displayed in django api
-        assigned_only = bool(
-            int(self.request.query_params.get("assigned_only", 0))
+        assigned_only = params_to_bool(
+            self.request.query_params, "assigned_only"
         )
-        queryset = self.queryset
+        queryset = self.queryset.filter(user=self.request.user)
         if assigned_only:
-            # filter out those where recipe cannot be null
-            # queryset = queryset.filter(recipe__isnull=False)
-            # will return duplicate items, duplicate recipes
-            # one tag/ingredient can have many recipes
-            # will return duplicate tags if
-            # (a tag is assigned more than one recipe)
-            # TODO: why recipe not recipes ?
-            # reverse m2m queries:
-            # https://docs.djangoproject.com/en/3.2/topics/db/examples/many_to_many/
-            queryset = queryset.filter(recipe__isnull=False)
-            # distinct(): make sure the queryset returned is unique
-        return (
-            queryset.filter(user=self.request.user)
-            .order_by("-name")
-            .distinct()
+            # only the ones used by a recipe, read from the stored
+            # recipe_count and its (user, recipe_count, id) index
+            queryset = queryset.filter(recipe_count__gt=0)
+        # by name unless the client asked eg. ?ordering=-recipe_count
+        ordering = get_ordering(
+            self.request.query_params,
+            DEFAULT_ATTR_ORDERING,
+            ATTR_ORDERING_FIELDS,
+            ATTR_UNIQUE_FIELDS,
+        )
+        return queryset.order_by(*ordering)
+
+    def get_serializer_context(self):
+        """Tell the serializer whether to output the recipe counts"""
+        # ?with_counts=1 adds the number of recipes using each object
+        context = super().get_serializer_context()
+        context["with_counts"] = self.action == "list" and params_to_bool(
+            self.request.query_params, "with_counts"
         )
+        return context
+
+    def list(self, request, *args, **kwargs):
+        """List the objects, from the cache when possible"""
+        # lists are read far more often than they change
+        # the cache is invalidated by recipe.signals when they do
+        # and answered with 304 Not Modified if the client has them
+        etag = collection_etag(request, self.basename)
+        return conditional(request, etag, self._cached_list, *args, **kwargs)
+
+    def _cached_list(self, request, *args, **kwargs):
+        cache = get_cache()
+        key = response_cache_key(request, self.basename)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        cache.set(key, response.data, settings.RECIPE_API_CACHE_TIMEOUT)
+        return response
 
     def perform_create(self, serializer):
         """Create a new tag"""
@@ -61,6 +135,8 @@ class TagViewSet(BaseRecipeAttrViewSet):
     # so that django knows what to list
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
+    bulk_serializer_class = serializers.TagSerializer
+    bulk_unique_names = True
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
@@ -68,57 +144,124 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
 
     queryset = Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
+    bulk_serializer_class = serializers.IngredientSerializer
+    bulk_unique_names = True
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+# FastListMixin first, its list() replaces the one of ModelViewSet
+class RecipeViewSet(FastListMixin, viewsets.ModelViewSet, BulkModelMixin):
     """Manage recipes in a database"""
 
     serializer_class = serializers.RecipeSerializer
+    bulk_serializer_class = serializers.RecipeBulkSerializer
+    bulk_relations = {"tags": Tag, "ingredients": Ingredient}
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
-
-    # private function, by convention prepend _
-    # qs: query string
-    def _params_to_ints(self, qs):
-        """Convert a list of string IDs to a list of integers"""
-        # list of strings split up by the comma
-        # our_string = '1,2,3'
-        # our_string_list = ['1', '2', '3']
-        # for each item in the returned list, do the left
-        # similar to map
-        return [int(str_id) for str_id in qs.split(",")]
+    pagination_class = RecipePagination
 
     # all functions in python are public
     def get_queryset(self):
         # used for list()
         """Retrieve the recipes for the authenticated user"""
         # http://localhost:8000/api/recipe/recipes/?ingredients=1
-        tags = self.request.query_params.get("tags")
-        ingredients = self.request.query_params.get("ingredients")
-        queryset = self.queryset
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            # __ (double underscore): filter on foreign key objects
-            # tag > id
-            # __in return all the tags where the id is in the tag_ids list
-            queryset = queryset.filter(tags__id__in=tag_ids)
-
-        if ingredients:
-            # Field lookups
-            # https://docs.djangoproject.com/en/3.2/ref/models
-            # /querysets/#std:fieldlookup-exact
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
-
-        return queryset.filter(user=self.request.user)
+        # see recipe.filters for the supported query params
+        queryset = filter_recipes(self.queryset, self.request.query_params)
+        queryset = queryset.filter(user=self.request.user)
+        search = self._search_term()
+        if search:
+            # see recipe.search, best matches first
+            queryset = search_recipes(queryset, search, self.request.user)
+            ordering = ("-rank", "-id")
+        else:
+            # newest recipes first, so the order is stable between requests
+            ordering = DEFAULT_ORDERING
+        # unless the client asked for another one eg. ?ordering=price
+        ordering = get_ordering(self.request.query_params, ordering)
+        queryset = queryset.order_by(*ordering)
+        if self.action in ("list", "retrieve", "coverage"):
+            queryset = self._select_fields(queryset, ordering)
+
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """List the recipes, 304 if the client has the same list"""
+        etag = collection_etag(request, "recipe-list")
+        return conditional(request, etag, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Return a recipe, 304 if the client has the same version"""
+        etag = recipe_etag(request, kwargs["pk"])
+        return conditional(request, etag, super().retrieve, *args, **kwargs)
+
+    def _fieldset(self):
+        """Return the ?fields= and ?expand= of a read request"""
+        # ?fields=id,title     only the id and the title of the recipes
+        # ?expand=tags         the tags nested instead of their ids
+        if self.action not in ("list", "retrieve"):
+            return None, None
+        params = self.request.query_params
+        fields = params_to_names(params, "fields", RECIPE_FIELDS)
+        expand = params_to_names(params, "expand", RECIPE_RELATIONS)
+        return fields, expand
+
+    def _select_fields(self, queryset, ordering):
+        """Only read from the database what the serializer outputs"""
+        fields, expand = self._fieldset()
+        if fields is not None:
+            # the cursor pagination reads the ordering fields too
+            columns = {
+                name
+                for name in chain(fields, (o.lstrip("-") for o in ordering))
+                if name in RECIPE_FIELDS and name not in RECIPE_RELATIONS
+            }
+            queryset = queryset.only(*columns)
+        # without prefetching, the serializer runs one query for the tags
+        # and one for the ingredients of every recipe (2N+1 queries)
+        # prefetch_related() loads all of them in one query per relation
+        # so the query count stays the same whatever the number of recipes
+        for name, model in RECIPE_RELATIONS.items():
+            if fields is not None and name not in fields:
+                # not output, not read
+                continue
+            if self.action == "retrieve" or name in (expand or ()):
+                # nested objects, see RecipeDetailSerializer
+                columns = ("id", "name")
+            else:
+                # RecipeSerializer only outputs the primary keys
+                columns = ("id",)
+            # by id, the order of the fast list path (recipe.readers)
+            related = model.objects.only(*columns).order_by("id")
+            queryset = queryset.prefetch_related(
+                Prefetch(name, queryset=related)
+            )
+        return queryset
+
+    def _search_term(self):
+        """Return the ?search= of a list request"""
+        if self.action != "list":
+            return ""
+        return self.request.query_params.get("search", "").strip()
+
+    @property
+    def paginator(self):
+        """Return the paginator, a single ranked page for searches"""
+        if not hasattr(self, "_paginator") and self._search_term():
+            self._paginator = SearchPagination()
+        return super().paginator
+
+    def get_serializer_context(self):
+        """Pass the sparse fieldset of the request to the serializer"""
+        context = super().get_serializer_context()
+        context["fields"], context["expand"] = self._fieldset()
+        return context
 
     def get_serializer_class(self):
         """Return appropriate serializer class"""
         # when retreive() is invoked
         if self.action == "retrieve":
             return serializers.RecipeDetailSerializer
-        elif self.action == "upload_image":
+        elif self.action in ("upload_image", "image"):
             return serializers.RecipeImageSerializer
 
         return self.serializer_class
@@ -152,7 +295,163 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(recipe, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            # only the upload is stored here, the resized copies are
+            # made in the background (see recipe.images)
+            # 202: accepted but not done yet, GET image/ tells when it is
+            image = serializer.validated_data["image"]
+            set_image(recipe, image, image.name)
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(methods=["GET"], detail=True)
+    def image(self, request, pk=None):
+        """Return the image of a recipe and its processing status"""
+        recipe = self.get_object()
+        serializer = self.get_serializer(recipe)
+        return Response(serializer.data)
+
+    @action(methods=["GET"], detail=False)
+    def stats(self, request):
+        """Return statistics of the recipes, with the same filters"""
+        # like the tag and ingredient lists, the result is cached until
+        # the user changes any of their data
+        etag = collection_etag(request, "recipe-stats")
+        return conditional(request, etag, self._cached_stats)
+
+    def _cached_stats(self, request):
+        cache = get_cache()
+        key = response_cache_key(request, "recipe-stats")
+        data = cache.get(key)
+        if data is None:
+            data = recipe_stats(self.get_queryset())
+            cache.set(key, data, settings.RECIPE_API_CACHE_TIMEOUT)
+        return Response(data)
+
+    @action(methods=["GET"], detail=False)
+    def coverage(self, request):
+        """List the recipes that can be made with the given ingredients"""
+        # ?ingredients=1,2,3   the ingredients at hand
+        # ?max_missing=2       only recipes needing at most 2 others
+        # recipes needing the fewest other ingredients come first
+        # see recipe.coverage, the matching runs in memory
+        value = request.query_params.get("ingredients", "")
+        if not value:
+            raise ValidationError({"ingredients": ["This param is required."]})
+        ingredient_ids = params_to_ints(value)
+        max_missing = request.query_params.get("max_missing")
+        if max_missing is not None:
+            if not max_missing.isdigit():
+                raise ValidationError(
+                    {"max_missing": ["A valid integer is required."]}
+                )
+            max_missing = int(max_missing)
+
+        paginator = SearchPagination()
+        matches = get_index(request.user.id).coverage(
+            ingredient_ids, max_missing
+        )[: paginator.get_page_size(request)]
+        # the recipes are read in one query, then put back in order
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in matches]
+        )
+        results = []
+        for recipe_id, covered, missing in matches:
+            if recipe_id not in recipes:
+                # deleted since the index was read
+                continue
+            data = self.get_serializer(recipes[recipe_id]).data
+            data["covered"] = covered
+            data["missing"] = missing
+            results.append(data)
+        return paginator.get_paginated_response(results)
+
+
+class ImageUploadViewSet(
+    viewsets.GenericViewSet,
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+):
+    """Upload recipe images in chunks, see recipe.uploads"""
+
+    serializer_class = serializers.ImageUploadSerializer
+    queryset = ImageUpload.objects.all()
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        """Retrieve the uploads of the authenticated user"""
+        return self.queryset.filter(user=self.request.user)
+
+    def _lock(self, upload):
+        """Lock the row of the upload, it may be gone by now"""
+        # only for short checks, the body is written under the lock of
+        # recipe.uploads.writing()
+        return get_object_or_404(
+            self.get_queryset().select_for_update(), pk=upload.pk
+        )
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Return the upload and where to resume it"""
+        response = super().retrieve(request, *args, **kwargs)
+        response["Upload-Offset"] = response.data["offset"]
+        return response
+
+    def perform_destroy(self, instance):
+        uploads.discard(instance)
+
+    def partial_update(self, request, *args, **kwargs):
+        """Append the body of the request to the upload"""
+        offset = request.META.get("HTTP_UPLOAD_OFFSET", "")
+        if not offset.isdigit():
+            raise ValidationError("A valid Upload-Offset header is required.")
+
+        upload = self.get_object()
+        try:
+            with uploads.writing(upload):
+                with transaction.atomic():
+                    # still there, and not being completed
+                    upload = self._lock(upload)
+                    if int(offset) != uploads.received(upload):
+                        raise uploads.OffsetConflict()
+                # request.stream reads the body as it arrives,
+                # request.data would parse all of it first
+                offset = uploads.receive(upload, request.stream)
+                if offset == upload.length:
+                    with transaction.atomic():
+                        # once, a request resent after a lost response
+                        # finds the upload gone
+                        upload = self._lock(upload)
+                        recipe = uploads.complete(upload)
+                    serializer = serializers.RecipeImageSerializer(
+                        recipe, context=self.get_serializer_context()
+                    )
+                    return Response(
+                        serializer.data, status=status.HTTP_202_ACCEPTED
+                    )
+        except ValidationError:
+            # the file isn't an image we accept, no point resuming
+            uploads.discard(upload)
+            raise
+
+        response = Response(status=status.HTTP_204_NO_CONTENT)
+        response["Upload-Offset"] = offset
+        return response
+
+
+class SyncView(APIView):
+    """Return the changes of the user's data since the last sync"""
+
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        # ?since=<the token of the previous sync>, see recipe.sync
+        since = request.query_params.get("since")
+        if since:
+            since = decode_token(since)
+        return Response(sync(request.user, since or None))
@@ -0,0 +1,116 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+
+from rest_framework.authentication import TokenAuthentication
+
+# https://www.django-rest-framework.org/api-guide/authentication/
+# TokenAuthentication looks the token up with a join to the user table
+# for every single request. the token doesn't change between requests,
+# so keep a snapshot of its user in the cache for a while. only the
+# fields below are stored, never the password hash: the others are
+# deferred and read from the database if a view ever needs them
+# entries are evicted by user.signals when the token is deleted or the
+# user is saved (deactivated, new password, etc), which only reaches
+# the other processes through a shared cache backend (see CACHES in
+# the settings), with the default per process one a deleted token keeps
+# working elsewhere for AUTH_TOKEN_CACHE_TIMEOUT
+USER_SNAPSHOT_FIELDS = (
+    "id",
+    "email",
+    "name",
+    "is_active",
+    "is_staff",
+    "is_superuser",
+)
+
+
+class _Stats:
+    """Thread safe hit/miss counters of the token cache"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def as_dict(self):
+        """Return the counters of this process"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+# every miss costs one query, every hit saves one
+stats = _Stats()
+
+
+def get_token_cache():
+    """Return the cache used to store the tokens"""
+    return caches[settings.AUTH_TOKEN_CACHE_ALIAS]
+
+
+def token_cache_key(key):
+    """Return the cache key of a token"""
+    # don't put the raw token in the cache keys, memcached keys can be
+    # listed by anyone who has access to the cache
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f"user:token:{digest}"
+
+
+def user_snapshot(user):
+    """Return the fields of a user kept in the cache"""
+    return {name: getattr(user, name) for name in USER_SNAPSHOT_FIELDS}
+
+
+def user_from_snapshot(snapshot):
+    """Return a user built from a snapshot, without a query"""
+    model = get_user_model()
+    # from_db() wants the values in the order of the model fields, the
+    # missing ones are deferred: saving the user only writes the loaded
+    # fields, so the password can't be overwritten with a blank one
+    names = [
+        field.attname
+        for field in model._meta.concrete_fields
+        if field.attname in snapshot
+    ]
+    return model.from_db(
+        model.objects.db, names, [snapshot[name] for name in names]
+    )
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that caches the token lookups"""
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        cache_key = token_cache_key(key)
+        snapshot = cache.get(cache_key)
+        if snapshot is not None:
+            stats.hit()
+            user = user_from_snapshot(snapshot)
+            # the key and the user of the row, without reading it
+            return (user, self.get_model()(key=key, user=user))
+
+        stats.miss()
+        # raises AuthenticationFailed for unknown tokens and inactive
+        # users, those are never cached
+        user, token = super().authenticate_credentials(key)
+        cache.set(
+            cache_key, user_snapshot(user), settings.AUTH_TOKEN_CACHE_TIMEOUT
+        )
+        return (user, token)
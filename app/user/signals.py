@@ -0,0 +1,24 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from user.authentication import get_token_cache, token_cache_key
+
+# connected in UserConfig.ready()
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    """Remove a deleted token from the cache"""
+    get_token_cache().delete(token_cache_key(instance.key))
+
+
+@receiver(post_save, sender=get_user_model())
+def evict_user_tokens(sender, instance, **kwargs):
+    """Remove the tokens of a user that changed from the cache"""
+    # the cached snapshot must not outlive a deactivation or a new
+    # password, and request.user must never be stale
+    keys = Token.objects.filter(user=instance).values_list("key", flat=True)
+    get_token_cache().delete_many([token_cache_key(key) for key in keys])
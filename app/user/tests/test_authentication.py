@@ -0,0 +1,104 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.authentication import stats, token_cache_key
+
+
+ME_URL = reverse("user:me")
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test the cached token authentication"""
+
+    def setUp(self):
+        cache.clear()
+        stats.reset()
+        self.user = get_user_model().objects.create_user(
+            "test@londonappdev.com", "testpass", name="Test"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_token_lookup_cached(self):
+        """Test the token is only looked up in the database once"""
+        # me/ returns request.user, the token lookup is the only query
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(Token._meta.db_table, context.captured_queries[0]["sql"])
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["email"], self.user.email)
+        self.assertEqual(res.data["name"], self.user.name)
+        self.assertEqual(stats.as_dict(), {"hits": 1, "misses": 1})
+
+    def test_password_not_cached(self):
+        """Test the cache holds a snapshot of the user without secrets"""
+        self.client.get(ME_URL)
+
+        cached = cache.get(token_cache_key(self.token.key))
+
+        self.assertEqual(cached["id"], self.user.id)
+        self.assertEqual(cached["email"], self.user.email)
+        self.assertNotIn("password", cached)
+
+    def test_invalid_token_not_cached(self):
+        """Test an unknown token is rejected every time"""
+        self.client.credentials(HTTP_AUTHORIZATION="Token invalid")
+
+        for _ in range(2):
+            res = self.client.get(ME_URL)
+            self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(stats.as_dict(), {"hits": 0, "misses": 2})
+
+    def test_deleted_token_evicted(self):
+        """Test a deleted token stops working right away"""
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_evicted(self):
+        """Test a deactivated user can't use the cached token"""
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_updated_user_read_again(self):
+        """Test the user is never stale"""
+        self.client.get(ME_URL)
+
+        self.client.patch(ME_URL, {"name": "New name", "password": "newpass"})
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data["name"], "New name")
+        self.assertEqual(stats.misses, 2)
+
+    def test_cached_user_update_keeps_password(self):
+        """Test saving the user of a cache hit keeps the password"""
+        self.client.get(ME_URL)
+
+        res = self.client.patch(ME_URL, {"name": "New name"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(stats.hits, 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, "New name")
+        self.assertTrue(self.user.check_password("testpass"))